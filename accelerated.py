@@ -0,0 +1,309 @@
+from classes import *
+import numpy as np
+
+# Optional JIT compiled backend for mmc(), selected with backend='numba'.
+# Re-implements the move set (endpoint rotation, kink jump and pivot), the Metropolis acceptance
+# and the sampling over flat integer arrays and a dense occupancy grid, compiled with Numba.
+# When Numba is not installed NUMBA_AVAILABLE is False and mmc() uses the Python implementation instead.
+#
+# The kernel follows the same rules as the Python implementation, so the results match statistically:
+# - Kink jumps pick uniformly from the indices where a kink jump or endpoint rotation is possible,
+#   and fall back to a pivot when there are none.
+# - Pivots retry with a random point, symmetry and part until one succeeds.
+# The kernel draws from its own generator, seeded from the rng of mmc(). Runs are reproducible for a given seed,
+# but the two backends consume random numbers differently, so they do not give the same run for the same seed.
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    # Stand-in so the kernel below can still be defined without Numba. It is never called in that case.
+    def njit(*args, **kwargs):
+        return lambda function: function
+
+# Names of the backends accepted by mmc()
+BACKEND_PYTHON = 'python'
+BACKEND_NUMBA = 'numba'
+
+
+# Fills the grid with index + 1 of every monomer, centered on the bounding box of the chain.
+# Returns the new grid origin as (origin_x, origin_y).
+@njit(cache=True)
+def _kernel_rebuild_grid(xs, ys, grid):
+    size = grid.shape[0]
+    origin_x = (xs.min() + xs.max()) // 2 - size // 2
+    origin_y = (ys.min() + ys.max()) // 2 - size // 2
+    grid[:, :] = 0
+    for i in range(len(xs)):
+        grid[xs[i] - origin_x, ys[i] - origin_y] = i + 1
+    return origin_x, origin_y
+
+
+# Returns the index of the monomer at x,y or -1 if there is none.
+@njit(cache=True)
+def _kernel_occupant(grid, origin_x, origin_y, x, y):
+    gx = x - origin_x
+    gy = y - origin_y
+    size = grid.shape[0]
+    if 0 <= gx < size and 0 <= gy < size:
+        return grid[gx, gy] - 1
+    return -1
+
+
+# Counts the H-H contacts of the monomers start up to end (exclusive).
+# Contacts between two of those monomers are counted once, see ProteinLattice.count_contacts_of().
+@njit(cache=True)
+def _kernel_contacts_of(xs, ys, kinds, grid, origin_x, origin_y, start, end):
+    count = 0
+    for idx in range(start, end):
+        if kinds[idx] != 1:
+            continue
+        for d in range(4):
+            dx = (-1, 1, 0, 0)[d]
+            dy = (0, 0, -1, 1)[d]
+            other = _kernel_occupant(grid, origin_x, origin_y, xs[idx] + dx, ys[idx] + dy)
+            if other == -1 or kinds[other] != 1:
+                continue
+            if other < start or other >= end or other > idx:
+                count += 1
+    return count
+
+
+# Returns the target position of a kink jump or endpoint rotation at idx as (possible, x, y).
+# Same rules and order of preference as computation.perform_kink_jump().
+@njit(cache=True)
+def _kernel_kink_target(xs, ys, grid, origin_x, origin_y, idx):
+    length = len(xs)
+    x = xs[idx]
+    y = ys[idx]
+    if idx == 0 or idx == length - 1:
+        prev = 1 if idx == 0 else length - 2
+        px = xs[prev]
+        py = ys[prev]
+        if px == x:
+            if _kernel_occupant(grid, origin_x, origin_y, px + 1, py) == -1:
+                return True, px + 1, py
+            if _kernel_occupant(grid, origin_x, origin_y, px - 1, py) == -1:
+                return True, px - 1, py
+        else:
+            if _kernel_occupant(grid, origin_x, origin_y, px, py + 1) == -1:
+                return True, px, py + 1
+            if _kernel_occupant(grid, origin_x, origin_y, px, py - 1) == -1:
+                return True, px, py - 1
+        return False, x, y
+
+    px = xs[idx - 1]
+    py = ys[idx - 1]
+    nx = xs[idx + 1]
+    ny = ys[idx + 1]
+    if px == nx or py == ny:
+        return False, x, y
+    tx = px + nx - x
+    ty = py + ny - y
+    if _kernel_occupant(grid, origin_x, origin_y, tx, ty) == -1:
+        return True, tx, ty
+    return False, x, y
+
+
+# Writes new positions for monomers start up to end (exclusive) into the arrays and grid.
+# Recenters the grid when a position falls outside of it. Returns the (new) grid origin.
+@njit(cache=True)
+def _kernel_write_positions(xs, ys, grid, origin_x, origin_y, start, end, new_xs, new_ys):
+    size = grid.shape[0]
+    for idx in range(start, end):
+        grid[xs[idx] - origin_x, ys[idx] - origin_y] = 0
+    outside = False
+    for idx in range(start, end):
+        xs[idx] = new_xs[idx - start]
+        ys[idx] = new_ys[idx - start]
+        gx = xs[idx] - origin_x
+        gy = ys[idx] - origin_y
+        if 0 <= gx < size and 0 <= gy < size:
+            grid[gx, gy] = idx + 1
+        else:
+            outside = True
+    if outside:
+        return _kernel_rebuild_grid(xs, ys, grid)
+    return origin_x, origin_y
+
+
+# Radius of gyration, same definition as ProteinLattice.compute_gyration_radius()
+@njit(cache=True)
+def _kernel_gyration_radius(xs, ys):
+    length = len(xs)
+    center_x = (xs.min() + xs.max()) / 2.0
+    center_y = (ys.min() + ys.max()) / 2.0
+    sum_of_squares = 0.0
+    for i in range(length):
+        sum_of_squares += (xs[i] - center_x) ** 2 + (ys[i] - center_y) ** 2
+    return math.sqrt(sum_of_squares / length / length)
+
+
+# The compiled MMC loop. Modifies xs and ys in place.
+# Returns a tuple: (energy_samples, gyration_samples, statistics, lowest_energy, lowest_xs, lowest_ys)
+# statistics holds the MoveStatistics counters in order: pivot attempted/rejected/accepted, kink attempted/...
+@njit(cache=True)
+def _mmc_kernel(xs, ys, kinds, temperature, max_iterations, sampling_frequency, epsilon, boltzmann,
+                matrices, rng_seed, store_lowest):
+    np.random.seed(rng_seed)
+    length = len(xs)
+    grid = np.zeros((4 * length + 4, 4 * length + 4), dtype=np.int64)
+    origin_x, origin_y = _kernel_rebuild_grid(xs, ys, grid)
+
+    sample_count = max_iterations // sampling_frequency + 1
+    energy_samples = np.zeros(sample_count)
+    gyration_samples = np.zeros(sample_count)
+    statistics = np.zeros(6, dtype=np.int64)
+
+    # Buffers for new positions, old positions (undo) and kink candidates
+    new_xs = np.zeros(length, dtype=np.int64)
+    new_ys = np.zeros(length, dtype=np.int64)
+    old_xs = np.zeros(length, dtype=np.int64)
+    old_ys = np.zeros(length, dtype=np.int64)
+    candidates = np.zeros(length, dtype=np.int64)
+
+    contacts = _kernel_contacts_of(xs, ys, kinds, grid, origin_x, origin_y, 0, length)
+    energy = -1.0 * epsilon * contacts
+    energy_samples[0] = energy
+    gyration_samples[0] = _kernel_gyration_radius(xs, ys)
+    sample_idx = 1
+
+    lowest_energy = energy
+    lowest_xs = xs.copy()
+    lowest_ys = ys.copy()
+
+    for iteration in range(max_iterations):
+        is_kink = np.random.randint(0, 2) == 0
+        start = 0
+        end = 0
+
+        if is_kink:
+            # Gather the indices where a kink jump is possible and pick one.
+            candidate_count = 0
+            for idx in range(length):
+                possible, tx, ty = _kernel_kink_target(xs, ys, grid, origin_x, origin_y, idx)
+                if possible:
+                    candidates[candidate_count] = idx
+                    candidate_count += 1
+            if candidate_count == 0:
+                # No kink jump possible, perform a pivot instead.
+                is_kink = False
+            else:
+                statistics[3] += 1
+                idx = candidates[np.random.randint(0, candidate_count)]
+                possible, tx, ty = _kernel_kink_target(xs, ys, grid, origin_x, origin_y, idx)
+                start = idx
+                end = idx + 1
+                new_xs[0] = tx
+                new_ys[0] = ty
+
+        if not is_kink:
+            # Retry pivots until one succeeds.
+            success = False
+            while not success:
+                statistics[0] += 1
+                pivot = np.random.randint(0, length)
+                matrix = matrices[np.random.randint(0, len(matrices))]
+                if np.random.randint(0, 2) == 0:
+                    start = 0
+                    end = pivot
+                else:
+                    start = pivot + 1
+                    end = length
+
+                success = start != end
+                for idx in range(start, end):
+                    shifted_x = xs[idx] - xs[pivot]
+                    shifted_y = ys[idx] - ys[pivot]
+                    rx = shifted_x * matrix[0, 0] + shifted_y * matrix[1, 0] + xs[pivot]
+                    ry = shifted_x * matrix[0, 1] + shifted_y * matrix[1, 1] + ys[pivot]
+                    other = _kernel_occupant(grid, origin_x, origin_y, rx, ry)
+                    if other != -1 and (other < start or other >= end):
+                        success = False
+                        break
+                    new_xs[idx - start] = rx
+                    new_ys[idx - start] = ry
+                if not success:
+                    statistics[1] += 1
+
+        # Perform the move, keeping the old positions for undo
+        for idx in range(start, end):
+            old_xs[idx - start] = xs[idx]
+            old_ys[idx - start] = ys[idx]
+        old_contacts = contacts
+        contacts -= _kernel_contacts_of(xs, ys, kinds, grid, origin_x, origin_y, start, end)
+        origin_x, origin_y = _kernel_write_positions(xs, ys, grid, origin_x, origin_y, start, end, new_xs, new_ys)
+        contacts += _kernel_contacts_of(xs, ys, kinds, grid, origin_x, origin_y, start, end)
+
+        new_energy = -1.0 * epsilon * contacts
+        accepted = True
+        if new_energy < energy:
+            energy = new_energy
+            if store_lowest and new_energy < lowest_energy:
+                lowest_energy = new_energy
+                lowest_xs[:] = xs
+                lowest_ys[:] = ys
+        else:
+            w = math.exp(-(new_energy - energy) / (boltzmann * temperature))
+            if w > np.random.random():
+                energy = new_energy
+            else:
+                origin_x, origin_y = _kernel_write_positions(xs, ys, grid, origin_x, origin_y, start, end,
+                                                             old_xs, old_ys)
+                contacts = old_contacts
+                accepted = False
+
+        if accepted:
+            statistics[5 if is_kink else 2] += 1
+
+        # Sample the energy and gyration
+        if (iteration + 1) % sampling_frequency == 0:
+            energy_samples[sample_idx] = energy
+            gyration_samples[sample_idx] = _kernel_gyration_radius(xs, ys)
+            sample_idx += 1
+
+    return energy_samples, gyration_samples, statistics, lowest_energy, lowest_xs, lowest_ys
+
+
+# Performs the MMC simulation with the compiled kernel.
+# Same arguments and return value as computation.mmc(), the given lattice is moved to the resulting conformation.
+# Requires Numba, check NUMBA_AVAILABLE first.
+def mmc_accelerated(temperature: float,
+                    max_iterations: int,
+                    sampling_frequency: int,
+                    lattice: ProteinLattice,
+                    rng_seed: int,
+                    epsilon: float = 1.0,
+                    boltzmann: float = 1.0,
+                    store_lowest_lattice: bool = False) -> Tuple[Tuple[ProteinLattice, float],
+                                                                 ProteinLattice,
+                                                                 MMCSamples]:
+    length = len(lattice)
+    positions = lattice.get_positions(0, length)
+    xs = np.ascontiguousarray(positions[:, 0], dtype=np.int64)
+    ys = np.ascontiguousarray(positions[:, 1], dtype=np.int64)
+    kinds = np.array([int(lattice.get_kind(idx)) for idx in range(0, length)], dtype=np.int64)
+
+    energy_samples, gyration_samples, statistics, lowest_energy, lowest_xs, lowest_ys = _mmc_kernel(
+        xs, ys, kinds, float(temperature), max_iterations, sampling_frequency, float(epsilon), float(boltzmann),
+        PIVOT_SYMMETRY_MATRICES, rng_seed, store_lowest_lattice)
+
+    # Build the lowest lattice from the snapshot, which holds the initial conformation if nothing lower was found.
+    # The given lattice is moved below, so it is never returned as the lowest one.
+    lowest_lattice = type(lattice)([Monomer(lattice.get_kind(idx), x, y)
+                                    for idx, (x, y) in enumerate(zip(lowest_xs.tolist(), lowest_ys.tolist()))],
+                                   lattice.hydrophobicity)
+
+    # Move the lattice to the resulting conformation
+    lattice.move_monomers_array(np.arange(0, length, dtype=np.int64), np.stack([xs, ys], axis=1))
+
+    move_statistics = MoveStatistics()
+    (move_statistics.pivot_attempted, move_statistics.pivot_rejected, move_statistics.pivot_accepted,
+     move_statistics.kink_attempted, move_statistics.kink_rejected, move_statistics.kink_accepted) = \
+        statistics.tolist()
+
+    return (lowest_lattice, lowest_energy), lattice, MMCSamples(energy_samples.tolist(),
+                                                                gyration_samples.tolist(),
+                                                                move_statistics)
@@ -1,4 +1,5 @@
 from drawing import *
+import time
 
 
 # This function is run for the benchmarking procedure
@@ -39,3 +40,25 @@ def perform_mmc_benchmarking():
                         draw_initial_conformation_plot=False,
                         draw_resulting_conformation_plot=True)
     draw_energy_iterations_plot(running_average(samples.energy, averaging))
+
+
+# Compares the iterations per second of the mmc backends and lattice types on the default protein.
+# The numba backend is compiled on a short warm-up run first, so compilation time is not measured.
+def perform_backend_benchmarking(chain_length: int = 25, iterations: int = 50000, temperature: float = 0.5):
+    configurations = [
+        ('python, ProteinLattice', ProteinLattice, accelerated.BACKEND_PYTHON),
+        ('python, ArrayProteinLattice', ArrayProteinLattice, accelerated.BACKEND_PYTHON),
+    ]
+    if accelerated.NUMBA_AVAILABLE:
+        configurations.append(('numba', ProteinLattice, accelerated.BACKEND_NUMBA))
+        mmc(temperature, 100, 100, mmc_initialize_default_protein(chain_length, 0.5), backend=accelerated.BACKEND_NUMBA)
+    else:
+        print('Numba is not installed, skipping the numba backend.')
+
+    for name, lattice_type, backend in configurations:
+        lattice = mmc_initialize_default_protein(chain_length, 0.5, lattice_type)
+        seed()  # Set fresh seed
+        start = time.perf_counter()
+        _, _, samples = mmc(temperature, iterations, 100, lattice, backend=backend)
+        duration = time.perf_counter() - start
+        print('{}: {:.0f} iterations/s, mean energy: {:.2f}'.format(name, iterations / duration, mean(samples.energy)))
@@ -0,0 +1,58 @@
+from classes import *
+from random_stream import RandomStream
+from online_statistics import OnlineStatistics
+import os
+import pickle
+
+
+# State of perform_mmc_simulated_annealing() between two temperature steps.
+# Holds everything the remaining steps depend on, so a resumed run continues exactly where the checkpoint was taken:
+# the lattice (including its kink candidate order) and the random number stream are stored as they are.
+class AnnealingCheckpoint:
+    def __init__(self,
+                 parameters: Tuple,  # Parameters of the annealing run, a resumed run must use the same ones
+                 next_step: int,  # Temperature step to continue at
+                 lattice: ProteinLattice,
+                 rng: RandomStream,
+                 results: List[Tuple[float, Sequence[float], Sequence[float]]],
+                 lowest: Optional[LowestConformations],
+                 lowest_lattice_energy: float,
+                 lowest_temp: float,
+                 schedule_state=None,  # State of the AnnealingSchedule, see AnnealingSchedule.get_state()
+                 step_statistics: Optional[List[Tuple[float, OnlineStatistics, OnlineStatistics]]] = None):
+        self.parameters: Tuple = parameters
+        self.next_step: int = next_step
+        self.lattice: ProteinLattice = lattice
+        self.rng: RandomStream = rng
+        # Samples read back from disk by a sample sink are stored as plain arrays.
+        self.results: List[Tuple[float, Sequence[float], Sequence[float]]] = [
+            (temperature, np.array(energy) if isinstance(energy, np.ndarray) else energy,
+             np.array(gyration) if isinstance(gyration, np.ndarray) else gyration)
+            for temperature, energy, gyration in results
+        ]
+        self.lowest: Optional[LowestConformations] = lowest
+        self.lowest_lattice_energy: float = lowest_lattice_energy
+        self.lowest_temp: float = lowest_temp
+        self.schedule_state = schedule_state
+        self.step_statistics: List[Tuple[float, OnlineStatistics, OnlineStatistics]] = \
+            step_statistics if step_statistics is not None else []
+
+
+# Writes the checkpoint to path atomically.
+# The checkpoint is written to a temporary file next to it first and then renamed over path,
+# so path always holds either the previous or the new checkpoint, also if the process is killed while writing.
+def write_checkpoint(path: str, checkpoint: AnnealingCheckpoint):
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        pickle.dump(checkpoint, file, protocol=pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+# Reads a checkpoint written by write_checkpoint()
+def read_checkpoint(path: str) -> AnnealingCheckpoint:
+    with open(path, 'rb') as file:
+        checkpoint = pickle.load(file)
+    assert isinstance(checkpoint, AnnealingCheckpoint), 'Not an annealing checkpoint: {}'.format(path)
+    return checkpoint
@@ -2,6 +2,8 @@ from matplotlib import pyplot as plt
 import numpy as np
 from enum import IntEnum
 from typing import *
+import bisect
+import collections
 import math
 
 
@@ -11,6 +13,50 @@ class Direction(IntEnum):
     CounterClockWise = 1
 
 
+# Enum representing the symmetries of the square lattice (except identity) that a pivot move can apply.
+# The integer matrices for each of them are in pivot_symmetry_matrix().
+class PivotSymmetry(IntEnum):
+    Rotate90 = 0
+    Rotate180 = 1
+    Rotate270 = 2
+    ReflectX = 3
+    ReflectY = 4
+    ReflectDiagonal = 5
+    ReflectAntiDiagonal = 6
+
+
+# Integer matrices of the lattice symmetries. Applied to row vectors as: rotated = shifted @ matrix.
+# (Counter clock wise rotation by 90 degrees maps (x, y) to (-y, x), and so on.)
+PIVOT_ROTATE_90 = np.array([[0, 1], [-1, 0]], dtype=np.int64)
+PIVOT_ROTATE_180 = np.array([[-1, 0], [0, -1]], dtype=np.int64)
+PIVOT_ROTATE_270 = np.array([[0, -1], [1, 0]], dtype=np.int64)
+PIVOT_REFLECT_X = np.array([[1, 0], [0, -1]], dtype=np.int64)
+PIVOT_REFLECT_Y = np.array([[-1, 0], [0, 1]], dtype=np.int64)
+PIVOT_REFLECT_DIAGONAL = np.array([[0, 1], [1, 0]], dtype=np.int64)
+PIVOT_REFLECT_ANTI_DIAGONAL = np.array([[0, -1], [-1, 0]], dtype=np.int64)
+
+
+# Returns the integer matrix of the given lattice symmetry.
+# All symmetries of the square lattice map lattice points onto lattice points,
+# so no trigonometry or rounding is needed to rotate or reflect monomers.
+def pivot_symmetry_matrix(symmetry: PivotSymmetry) -> np.ndarray:
+    return {
+        PivotSymmetry.Rotate90: PIVOT_ROTATE_90,
+        PivotSymmetry.Rotate180: PIVOT_ROTATE_180,
+        PivotSymmetry.Rotate270: PIVOT_ROTATE_270,
+        PivotSymmetry.ReflectX: PIVOT_REFLECT_X,
+        PivotSymmetry.ReflectY: PIVOT_REFLECT_Y,
+        PivotSymmetry.ReflectDiagonal: PIVOT_REFLECT_DIAGONAL,
+        PivotSymmetry.ReflectAntiDiagonal: PIVOT_REFLECT_ANTI_DIAGONAL,
+    }[symmetry]
+
+
+# Stacked integer matrices of all pivot symmetries, indexed by PivotSymmetry.
+# Shared by the Python, vectorized and Numba implementations and the trajectory replay,
+# so they always apply the same symmetries.
+PIVOT_SYMMETRY_MATRICES: np.ndarray = np.stack([pivot_symmetry_matrix(symmetry) for symmetry in PivotSymmetry])
+
+
 # Enum representing left or right part of monomer.
 # Used only to make the code more readable.
 class MonomerPart(IntEnum):
@@ -18,6 +64,15 @@ class MonomerPart(IntEnum):
     Right = 1
 
 
+# Enum representing the kinds of moves done by the mmc loop.
+# Used as keys of the move probabilities of computation.mmc().
+class MoveKind(IntEnum):
+    KinkJump = 0  # Kink jump or endpoint rotation
+    Pivot = 1
+    Crankshaft = 2
+    Pull = 3
+
+
 # Enum indicating value of a MonomerRecord
 # Used internally by ProteinLattice class
 # This is so we don't need a second lookup into the chain to get the kind.
@@ -80,6 +135,360 @@ class Monomer:
         return '(({},{}) {})'.format(self.x, self.y, self.kind.__str__())
 
 
+# Set of integers that also supports indexing, so a random element can be picked in O(1).
+# Removal swaps the element with the last one, so the order of the elements is not stable.
+class IndexedSet:
+    def __init__(self, items: Iterable[int] = ()):
+        self.items: List[int] = []
+        self.__positions: Dict[int, int] = {}
+        for item in items:
+            self.add(item)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __getitem__(self, position: int) -> int:
+        return self.items[position]
+
+    def __contains__(self, item: int) -> bool:
+        return item in self.__positions
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.items)
+
+    # Adds the item, if not present already
+    def add(self, item: int):
+        if item not in self.__positions:
+            self.__positions[item] = len(self.items)
+            self.items.append(item)
+
+    # Removes the item, if present
+    def discard(self, item: int):
+        position = self.__positions.pop(item, None)
+        if position is None:
+            return
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.__positions[last] = position
+
+
+# Offsets of the diagonal neighbours of a lattice position.
+# Kink jumps and endpoint rotations always move a monomer to one of its diagonal neighbours.
+DIAGONAL_OFFSETS: List[Tuple[int, int]] = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+# Returns whether a kink jump or endpoint rotation is currently possible at idx in the given lattice.
+# Matches the moves done by computation.perform_kink_jump().
+def is_kink_jump_possible(lattice, idx: int) -> bool:
+    length = len(lattice)
+    if length < 2:
+        return False
+    x, y = lattice.get_position(idx)
+    if idx == 0 or idx == length - 1:
+        # Endpoint rotation, possible if one of the positions beside the previous monomer is free.
+        prev_x, prev_y = lattice.get_position(1 if idx == 0 else length - 2)
+        if prev_x == x:
+            return not lattice.has_monomer(prev_x + 1, prev_y) or not lattice.has_monomer(prev_x - 1, prev_y)
+        return not lattice.has_monomer(prev_x, prev_y + 1) or not lattice.has_monomer(prev_x, prev_y - 1)
+
+    # Kink jump, possible if the previous and next monomer form a corner and the opposite corner is free.
+    prev_x, prev_y = lattice.get_position(idx - 1)
+    next_x, next_y = lattice.get_position(idx + 1)
+    if prev_x == next_x or prev_y == next_y:
+        return False
+    return not lattice.has_monomer(prev_x + next_x - x, prev_y + next_y - y)
+
+
+# Updates the kink jump candidates of the lattice after the monomers at indices moved from or to the given cells.
+# Only the moved monomers, their neighbours in the chain and the monomers diagonal to a changed cell
+# can change their kink jump possibility, so this is O(len(indices) + len(cells)).
+# all_possible optionally returns whether a kink jump is possible at every index at once, used for large moves.
+def refresh_kink_candidates(lattice, candidates: IndexedSet,
+                            indices: Iterable[int], cells: Iterable[Tuple[int, int]],
+                            all_possible: Optional[Callable[[], List[bool]]] = None):
+    length = len(lattice)
+    affected = set()
+    for idx in indices:
+        affected.update((idx - 1, idx, idx + 1))
+    if len(affected) * 4 >= length:
+        # Large moves (pivots) touch a big part of the chain anyway, checking every index is cheaper
+        # than looking up the diagonal neighbours of all changed cells.
+        if all_possible is not None:
+            for idx, possible in enumerate(all_possible()):
+                if possible:
+                    candidates.add(idx)
+                else:
+                    candidates.discard(idx)
+            return
+        affected = range(0, length)
+    else:
+        get_by_coordinate = lattice.get_by_coordinate
+        for x, y in cells:
+            for dx, dy in DIAGONAL_OFFSETS:
+                other, _ = get_by_coordinate(x + dx, y + dy)
+                if other != -1:
+                    affected.add(other)
+
+    for idx in affected:
+        if 0 <= idx < length:
+            if is_kink_jump_possible(lattice, idx):
+                candidates.add(idx)
+            else:
+                candidates.discard(idx)
+
+
+# Offsets of the direct neighbours of a lattice position.
+# Pull moves give the directions of the positions they move to as indices into this list.
+NEIGHBOUR_OFFSETS: List[Tuple[int, int]] = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+
+
+# Returns the new positions of a pull move as (index_in_chain, (x, y)) tuples, see computation.perform_pull_move().
+# Monomer idx moves to L = C + NEIGHBOUR_OFFSETS[l_direction], with C = its position + NEIGHBOUR_OFFSETS[c_direction].
+# The next monomer of the pulled part moves to C, every monomer after that to the old position of
+# the monomer two places back, until a monomer is still adjacent to the new position of the one before it.
+# Only computes the positions, whether L and C are free is up to the caller.
+def pull_move_positions(get_position: Callable[[int], Tuple[int, int]], length: int, idx: int, part: MonomerPart,
+                        c_direction: int, l_direction: int) -> List[Tuple[int, Tuple[int, int]]]:
+    step = -1 if part == MonomerPart.Left else 1
+    x, y = get_position(idx)
+    c_dx, c_dy = NEIGHBOUR_OFFSETS[c_direction]
+    l_dx, l_dy = NEIGHBOUR_OFFSETS[l_direction]
+    new_positions = [(idx, (x + c_dx + l_dx, y + c_dy + l_dy))]
+
+    previous_x, previous_y = new_positions[0][1]
+    target = (x + c_dx, y + c_dy)
+    follower = idx + step
+    while 0 <= follower < length:
+        follower_x, follower_y = get_position(follower)
+        if abs(follower_x - previous_x) + abs(follower_y - previous_y) == 1:
+            break
+        new_positions.append((follower, target))
+        previous_x, previous_y = target
+        target = get_position(follower - step)
+        follower += step
+    return new_positions
+
+
+# Keeps the sums and the bounding box needed for the radius of gyration while monomers move.
+# Updated with the cells of the moved monomers only, so the radius of gyration costs O(1) instead of O(N).
+# Occupied columns and rows are counted to keep the bounding box: a chain is connected,
+# so the occupied columns (and rows) always form one range and its ends only move inwards while they are empty.
+# Like the kink candidates, moves are only recorded and applied when a value is requested.
+# A move that is undone before that costs nothing.
+class GyrationTracker:
+    # Amount of recorded moves after which they are applied anyway, to bound the memory used
+    MAX_PENDING_MOVES: int = 256
+
+    def __init__(self, cells: Iterable[Tuple[int, int]]):
+        self.length: int = 0
+        self.sum_x: int = 0
+        self.sum_y: int = 0
+        # Sum of x^2 + y^2
+        self.sum_squares: int = 0
+        # Amount of monomers per column (x) and row (y)
+        self.__columns: Dict[int, int] = {}
+        self.__rows: Dict[int, int] = {}
+        # Recorded (old_cells, new_cells) of moves that are not applied yet
+        self.__pending: List[Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]] = []
+        for x, y in cells:
+            self.length += 1
+            self.__add(x, y)
+        self.min_x: int = min(self.__columns)
+        self.max_x: int = max(self.__columns)
+        self.min_y: int = min(self.__rows)
+        self.max_y: int = max(self.__rows)
+
+    def __add(self, x: int, y: int):
+        self.sum_x += x
+        self.sum_y += y
+        self.sum_squares += x * x + y * y
+        self.__columns[x] = self.__columns.get(x, 0) + 1
+        self.__rows[y] = self.__rows.get(y, 0) + 1
+
+    def __remove(self, x: int, y: int):
+        self.sum_x -= x
+        self.sum_y -= y
+        self.sum_squares -= x * x + y * y
+        count = self.__columns[x] - 1
+        if count == 0:
+            del self.__columns[x]
+        else:
+            self.__columns[x] = count
+        count = self.__rows[y] - 1
+        if count == 0:
+            del self.__rows[y]
+        else:
+            self.__rows[y] = count
+
+    # Records that monomers moved from old_cells to new_cells
+    def move(self, old_cells: List[Tuple[int, int]], new_cells: List[Tuple[int, int]]):
+        self.__pending.append((old_cells, new_cells))
+        if len(self.__pending) > self.MAX_PENDING_MOVES:
+            self.__apply_pending()
+
+    # Records that the latest move was undone, the monomers moved back from old_cells to new_cells
+    def undo_move(self, old_cells: List[Tuple[int, int]], new_cells: List[Tuple[int, int]]):
+        if len(old_cells) == 0:
+            return
+        if len(self.__pending) != 0:
+            self.__pending.pop()
+        else:
+            self.move(old_cells, new_cells)
+
+    def __apply_pending(self):
+        for old_cells, new_cells in self.__pending:
+            self.__apply(old_cells, new_cells)
+        self.__pending.clear()
+
+    def __apply(self, old_cells: List[Tuple[int, int]], new_cells: List[Tuple[int, int]]):
+        for x, y in old_cells:
+            self.__remove(x, y)
+        for x, y in new_cells:
+            self.__add(x, y)
+            if x < self.min_x:
+                self.min_x = x
+            elif x > self.max_x:
+                self.max_x = x
+            if y < self.min_y:
+                self.min_y = y
+            elif y > self.max_y:
+                self.max_y = y
+
+        columns, rows = self.__columns, self.__rows
+        while self.min_x not in columns:
+            self.min_x += 1
+        while self.max_x not in columns:
+            self.max_x -= 1
+        while self.min_y not in rows:
+            self.min_y += 1
+        while self.max_y not in rows:
+            self.max_y -= 1
+
+    # Center of the bounding box
+    def center_point(self) -> Tuple[float, float]:
+        if len(self.__pending) != 0:
+            self.__apply_pending()
+        return (self.min_x + self.max_x) / 2.0, (self.min_y + self.max_y) / 2.0
+
+    # Radius of gyration around the center of the bounding box, see ProteinLattice.compute_gyration_radius().
+    # With s = min + max per axis, 4 * sum((x - s / 2)^2) = 4 * sum(x^2) - 4 * s * sum(x) + N * s^2,
+    # which is computed in integers, so the result does not depend on the order of the moves.
+    def gyration_radius(self) -> float:
+        if len(self.__pending) != 0:
+            self.__apply_pending()
+        sx = self.min_x + self.max_x
+        sy = self.min_y + self.max_y
+        four_sum_of_squares = 4 * self.sum_squares - 4 * (sx * self.sum_x + sy * self.sum_y) + \
+            self.length * (sx * sx + sy * sy)
+        return math.sqrt(four_sum_of_squares / 4.0 / self.length / self.length)
+
+    # Returns the tracked values, for consistency checks
+    def state(self) -> Tuple[int, int, int, int, int, int, int, int]:
+        self.__apply_pending()
+        return (self.length, self.sum_x, self.sum_y, self.sum_squares,
+                self.min_x, self.max_x, self.min_y, self.max_y)
+
+
+# Heading of a bond: its index in NEIGHBOUR_OFFSETS
+BOND_HEADINGS: Dict[Tuple[int, int], int] = {offset: heading for heading, offset in enumerate(NEIGHBOUR_OFFSETS)}
+
+# Seed of the random keys of conformation hashes, fixed so hashes are the same in every process and run
+CONFORMATION_HASH_SEED: int = 0x48500001
+# Keys of conformation hashes per chain length, see conformation_hash_keys()
+CONFORMATION_HASH_KEY_TABLES: Dict[int, np.ndarray] = {}
+
+
+# Returns the random 64 bit keys of conformation hashes of chains of the given length, as an (N, 4) array.
+# Row j holds a key for every turn the chain can make at monomer j.
+def conformation_hash_keys(length: int) -> np.ndarray:
+    keys = CONFORMATION_HASH_KEY_TABLES.get(length)
+    if keys is None:
+        keys = np.random.default_rng(CONFORMATION_HASH_SEED).integers(0, 2 ** 64, size=(length, 4),
+                                                                      dtype=np.uint64)
+        CONFORMATION_HASH_KEY_TABLES[length] = keys
+    return keys
+
+
+# Returns the turns of a chain: the change in heading at every monomer, from the bond before to the bond after it.
+# 0 is straight on, 1 a left and 3 a right turn. The ends of the chain have no turn and get 0.
+def conformation_turns(positions: np.ndarray) -> np.ndarray:
+    turns = np.zeros(len(positions), dtype=np.int64)
+    bonds = np.diff(positions, axis=0)
+    # (1, 0) -> 0, (0, 1) -> 1, (-1, 0) -> 2, (0, -1) -> 3
+    headings = np.where(bonds[:, 0] != 0, 1 - bonds[:, 0], 2 - bonds[:, 1])
+    turns[1:-1] = np.diff(headings) % 4
+    return turns
+
+
+# Returns the conformation hash of the (N, 2) positions of a chain.
+# The hash is the XOR of the keys of the turns of the chain (Zobrist hashing). Turns do not change when the chain
+# is moved or rotated, so conformations that only differ by a translation or rotation get the same hash.
+# Mirror images get different hashes. The monomer kinds are not part of the hash.
+def conformation_hash(positions: np.ndarray) -> int:
+    keys = conformation_hash_keys(len(positions))
+    turns = conformation_turns(positions)
+    return int(np.bitwise_xor.reduce(keys[np.arange(0, len(positions)), turns]))
+
+
+# Turn of the mirror image of the chain at every turn: left and right swap
+MIRRORED_TURNS: np.ndarray = np.array([0, 3, 2, 1], dtype=np.int64)
+
+
+# Returns a key that is equal for conformations which only differ by a translation, rotation or reflection.
+# The key is the smaller of the turns of the chain and of its mirror image, see conformation_turns().
+def canonical_conformation_key(positions: np.ndarray) -> bytes:
+    turns = conformation_turns(positions).astype(np.uint8)
+    mirrored = MIRRORED_TURNS.astype(np.uint8)[turns]
+    return min(turns.tobytes(), mirrored.tobytes())
+
+
+# Keeps the conformation hash of a chain up to date while monomers move, see conformation_hash().
+# A moved monomer changes at most the turns at itself and its two neighbours in the chain, so only those keys are
+# swapped in the hash. Like the kink candidates, moves are only recorded and applied when the hash is requested,
+# the first request computes it from scratch.
+class ConformationHashTracker:
+    def __init__(self, length: int):
+        self.length: int = length
+        self.__hash: int = 0
+        # Keys and turns, as lists for fast scalar access. None until the hash is first requested.
+        self.__keys: Optional[List[List[int]]] = None
+        self.__turns: Optional[List[int]] = None
+        # Indices of the monomers that moved since the hash was last requested
+        self.__moved: Set[int] = set()
+
+    # Records that the monomers at indices moved, also used when a move is undone
+    def move(self, indices: Iterable[int]):
+        if self.__turns is not None:
+            self.__moved.update(indices)
+
+    # Returns the hash of the conformation, reading the positions of the moved monomers through get_position
+    def value(self, get_position: Callable[[int], Tuple[int, int]]) -> int:
+        if self.__turns is None:
+            positions = np.array([get_position(idx) for idx in range(0, self.length)], dtype=np.int64)
+            self.__keys = conformation_hash_keys(self.length).tolist()
+            self.__turns = conformation_turns(positions.reshape(-1, 2)).tolist()
+            self.__hash = conformation_hash(positions.reshape(-1, 2))
+        elif len(self.__moved) != 0:
+            changed: Set[int] = set()
+            for idx in self.__moved:
+                changed.update((idx - 1, idx, idx + 1))
+            self.__moved.clear()
+
+            keys, turns = self.__keys, self.__turns
+            for idx in changed:
+                if not 0 < idx < self.length - 1:
+                    continue
+                previous_x, previous_y = get_position(idx - 1)
+                x, y = get_position(idx)
+                next_x, next_y = get_position(idx + 1)
+                turn = (BOND_HEADINGS[(next_x - x, next_y - y)] - BOND_HEADINGS[(x - previous_x, y - previous_y)]) % 4
+                if turn != turns[idx]:
+                    self.__hash ^= keys[idx][turns[idx]] ^ keys[idx][turn]
+                    turns[idx] = turn
+        return self.__hash
+
+
 # Data structure containing the protein chain and a lattice bidirectional lookup structure
 # This way super fast (neighbour) lookups can be achieved in O(1)
 class ProteinLattice:
@@ -92,6 +501,22 @@ class ProteinLattice:
         self.undo_set: List[MonomerMoveRecord] = []
         # The lattice, used for fast lookups!
         self.__calculate_lattice()
+        # Running count of H-H contacts, kept up to date on every move and undo.
+        # This avoids walking the whole chain to compute the energy after every move.
+        self.contact_count: int = self.compute_contact_count()
+        # Contact count before the latest move(s), restored by undo_last_change().
+        self.undo_contact_count: int = self.contact_count
+        # Indices where a kink jump or endpoint rotation is currently possible.
+        # Moves only record what changed, the set is refreshed when it is requested by get_kink_candidates().
+        # This way a move that is undone right away costs nothing extra.
+        self.__kink_candidates: IndexedSet = IndexedSet(idx for idx in range(0, len(self.chain))
+                                                        if is_kink_jump_possible(self, idx))
+        self.__dirty_indices: Set[int] = set()
+        self.__dirty_cells: Set[Tuple[int, int]] = set()
+        # Sums and bounding box for the radius of gyration, kept up to date on every move and undo.
+        self.__gyration: GyrationTracker = GyrationTracker((monomer.x, monomer.y) for monomer in self.chain)
+        # Translation and rotation invariant hash of the conformation, kept up to date on every move and undo.
+        self.__conformation_hash: ConformationHashTracker = ConformationHashTracker(len(self.chain))
 
     # Computes the internal lattice structure
     # We compute the grid size such that it can
@@ -105,6 +530,32 @@ class ProteinLattice:
             monomer = self.chain[i]
             self.__lattice[(monomer.x, monomer.y)] = MonomerRecord(MonomerRecordValue(int(monomer.kind)), i)
 
+    # Returns the length of the chain
+    def __len__(self) -> int:
+        return len(self.chain)
+
+    # Returns the x,y position of the monomer at idx in the chain
+    def get_position(self, idx: int) -> Tuple[int, int]:
+        monomer = self.chain[idx]
+        return monomer.x, monomer.y
+
+    # Returns the kind of the monomer at idx in the chain
+    def get_kind(self, idx: int) -> MonomerKind:
+        return self.chain[idx].kind
+
+    # Returns the positions of monomers start up to end (exclusive) as a (k, 2) int array
+    def get_positions(self, start: int, end: int) -> np.ndarray:
+        return np.array([(monomer.x, monomer.y) for monomer in self.chain[start:end]], dtype=np.int64).reshape(-1, 2)
+
+    # Returns whether any of the given (k, 2) positions is taken by a monomer outside of start up to end (exclusive).
+    # Positions of the monomers in start-end are considered free, as they are the ones being moved.
+    def has_collision(self, positions: np.ndarray, start: int, end: int) -> bool:
+        for x, y in positions.tolist():
+            record = self.__lattice.get((x, y))
+            if record is not None and not start <= record.index < end:
+                return True
+        return False
+
     # Returns an idx,value pair for a given position. idx = -1 if no monomer is present.
     def get_by_coordinate(self, x: int, y: int) -> (int, MonomerRecordValue):
         val = self.__lattice.get((x, y))
@@ -139,6 +590,14 @@ class ProteinLattice:
             monomer.x = record.old[0]
             monomer.y = record.old[1]
 
+        # Restore the contact count
+        self.contact_count = self.undo_contact_count
+
+        self.__after_move([record.index for record in self.undo_set],
+                          [record.new for record in self.undo_set],
+                          [record.old for record in self.undo_set],
+                          undo=True)
+
         # Clear undo set
         self.undo_set = []
 
@@ -152,6 +611,10 @@ class ProteinLattice:
 
         self.undo_set = []
         self.undo_set.append(MonomerMoveRecord(idx, (monomer.x, monomer.y), (x, y)))
+        self.undo_contact_count = self.contact_count
+
+        # Remove the contacts at the old position
+        self.contact_count -= self.count_contacts_of([idx])
 
         del self.__lattice[(monomer.x, monomer.y)]
         self.__lattice[(x, y)] = MonomerRecord(MonomerRecordValue(monomer.kind), idx)
@@ -159,6 +622,32 @@ class ProteinLattice:
         self.chain[idx].x = x
         self.chain[idx].y = y
 
+        # Add the contacts at the new position
+        self.contact_count += self.count_contacts_of([idx])
+
+        self.__after_move([idx], [self.undo_set[0].old], [(x, y)])
+
+    # Updates the bookkeeping that depends on monomer positions after the monomers at indices
+    # moved from old_cells to new_cells. Also used by undo_last_change() with the cells swapped and undo set.
+    def __after_move(self, indices: List[int], old_cells: List[Tuple[int, int]], new_cells: List[Tuple[int, int]],
+                     undo: bool = False):
+        self.__dirty_indices.update(indices)
+        self.__dirty_cells.update(old_cells)
+        self.__dirty_cells.update(new_cells)
+        if undo:
+            self.__gyration.undo_move(old_cells, new_cells)
+        else:
+            self.__gyration.move(old_cells, new_cells)
+        self.__conformation_hash.move(indices)
+
+    # Returns the indices where a kink jump or endpoint rotation is currently possible.
+    def get_kink_candidates(self) -> IndexedSet:
+        if len(self.__dirty_indices) != 0:
+            refresh_kink_candidates(self, self.__kink_candidates, self.__dirty_indices, self.__dirty_cells)
+            self.__dirty_indices.clear()
+            self.__dirty_cells.clear()
+        return self.__kink_candidates
+
     # Debug function checking for internal inconsistencies in the lattice structure.
     def consistency_check(self):
         for idx in range(0, len(self.chain)):
@@ -166,6 +655,11 @@ class ProteinLattice:
             lat = self.__lattice[(monomer.x, monomer.y)]
             assert lat.index == idx
         assert len(self.chain) == len(self.__lattice)
+        assert self.contact_count == self.compute_contact_count()
+        assert self.__gyration.state() == GyrationTracker((monomer.x, monomer.y) for monomer in self.chain).state()
+        assert set(self.get_kink_candidates()) == {idx for idx in range(0, len(self.chain))
+                                             if is_kink_jump_possible(self, idx)}
+        assert self.compute_conformation_hash() == conformation_hash(self.get_positions(0, len(self.chain)))
 
     # Moves multiple monomers at once.
     # Tuple is: (index_in_chain, (x, y))
@@ -176,6 +670,11 @@ class ProteinLattice:
         for idx, (x, y) in new_positions:
             monomer = self.chain[idx]
             self.undo_set.append(MonomerMoveRecord(idx, (monomer.x, monomer.y), (x, y)))
+        self.undo_contact_count = self.contact_count
+
+        # Remove the contacts at the old positions
+        indices = [idx for idx, _ in new_positions]
+        self.contact_count -= self.count_contacts_of(indices)
 
         # Remove all old items
         for idx, _ in new_positions:
@@ -190,6 +689,48 @@ class ProteinLattice:
             monomer.x = nx
             monomer.y = ny
 
+        # Add the contacts at the new positions
+        self.contact_count += self.count_contacts_of(indices)
+
+        self.__after_move(indices, [record.old for record in self.undo_set], [record.new for record in self.undo_set])
+
+    # Moves multiple monomers at once, given as an index array and an (k, 2) position array.
+    # Erases and replaces the undo stack!
+    def move_monomers_array(self, indices: np.ndarray, positions: np.ndarray):
+        self.move_monomers([(idx, (x, y)) for idx, (x, y) in zip(indices.tolist(), positions.tolist())])
+
+    # Returns the number of H-H contacts the given monomers take part in.
+    # Contacts between two of the given monomers are counted once.
+    # Only H monomers and their direct neighbours are inspected, so this is O(len(indices)).
+    def count_contacts_of(self, indices: List[int]) -> int:
+        moved = set(indices)
+        count = 0
+        for idx in indices:
+            monomer = self.chain[idx]
+            if monomer.kind != MonomerKind.H:
+                continue
+            for position in [(monomer.x - 1, monomer.y), (monomer.x + 1, monomer.y),
+                             (monomer.x, monomer.y - 1), (monomer.x, monomer.y + 1)]:
+                record = self.__lattice.get(position)
+                if record is None or record.value != MonomerRecordValue.H:
+                    continue
+                # Contacts between two given monomers are only counted from the lowest index.
+                if record.index not in moved or record.index > idx:
+                    count += 1
+        return count
+
+    # Computes the number of H-H contacts by walking the whole chain.
+    # Just like calculate_energy(), contacts are counted from both sides and then halved.
+    def compute_contact_count(self) -> int:
+        f = 0
+        for monomer in self.chain:
+            if monomer.kind != MonomerKind.H:
+                continue
+            for neighbour in self.get_neighbours(monomer.x, monomer.y):
+                if neighbour.kind == MonomerKind.H:
+                    f += 1
+        return f // 2
+
     # Returns the direct neighbouring Monomers around (x,y), if any
     def get_neighbours(self, x: int, y: int) -> List[Monomer]:
         neighbours = []
@@ -201,41 +742,576 @@ class ProteinLattice:
 
         return neighbours
 
-    # Computes the center coordinate of the protein
+    # Computes the center coordinate of the protein: the center of its bounding box.
+    # The bounding box is kept up to date on every move, so this is O(1).
     def compute_center_point(self) -> Tuple[float, float]:
-        # Retrieve min/max values on each axis
-        min_x = min(self.chain, key=lambda e: e.x).x
-        max_x = max(self.chain, key=lambda e: e.x).x
-        min_y = min(self.chain, key=lambda e: e.y).y
-        max_y = max(self.chain, key=lambda e: e.y).y
-
-        # Compute delta's
-        dx: float = max_x - min_x
-        dy: float = max_y - min_y
-        # Compute centroid
-        return min_x + (dx / 2), min_y + (dy / 2)
-
-    # Computes the radius of gyration
+        return self.__gyration.center_point()
+
+    # Computes the radius of gyration: sqrt(sum(|rk - rc|^2) / N / N) with rc the center point.
+    # The sums are kept up to date on every move, so this is O(1).
     def compute_gyration_radius(self) -> float:
-        rc = self.compute_center_point()
-        sum_of_squares = 0
-        for monomer in self.chain:
-            rk = monomer.x, monomer.y
-            # Compute the rk - rc
-            neg_x, neg_y = rk[0] - rc[0], rk[1] - rc[1]
-            # Compute dot product with itself
-            res = (neg_x ** 2) + (neg_y ** 2)
-            sum_of_squares += res
-        # Compute mean
-        mean_value = sum_of_squares / len(self.chain)
-        # Normalize
-        mean_value *= 1 / len(self.chain)
-        # Take the root and return
-        return math.sqrt(mean_value)
+        return self.__gyration.gyration_radius()
+
+    # Computes the hash of the conformation, see conformation_hash().
+    # Only the turns around the monomers moved since the last call are updated.
+    def compute_conformation_hash(self) -> int:
+        return self.__conformation_hash.value(self.get_position)
+
+
+# Offsets of NEIGHBOUR_OFFSETS as x and y arrays, for looking up the neighbours of many monomers at once
+NEIGHBOUR_DX: np.ndarray = np.array([dx for dx, _ in NEIGHBOUR_OFFSETS], dtype=np.int64)
+NEIGHBOUR_DY: np.ndarray = np.array([dy for _, dy in NEIGHBOUR_OFFSETS], dtype=np.int64)
+
+# Amount of monomers from which ArrayProteinLattice counts contacts with array operations instead of one by one
+ARRAY_CONTACTS_MIN_LENGTH: int = 8
+
+
+# Alternative lattice backend with the same API as ProteinLattice.
+# Positions are stored in a NumPy int array of shape (N, 2) and occupancy in a dense 2D grid
+# holding index + 1 of the monomer at each cell (0 means empty).
+# Positions, occupancy and the undo buffers are preallocated arrays, so moves allocate no Monomer or records.
+# Single monomer moves pass scalars, moves of many monomers (pivots) count their contacts with array operations.
+# The trackers shared with ProteinLattice still get the moved cells of every move as lists.
+# The array operations pay off for longer chains: slower than ProteinLattice for short chains (25 monomers),
+# faster for long ones (100 monomers), see benchmarking.perform_backend_benchmarking().
+# The grid covers a square of 4N + 4 cells around the chain and is recentered when the chain comes within one cell
+# of its border, so the neighbours of every monomer are always inside of it.
+class ArrayProteinLattice:
+
+    # Initializes a new Lattice based on the given chain
+    def __init__(self, chain: List[Monomer], hydrophobicity: float):
+        self.hydrophobicity: float = hydrophobicity
+        # Monomer kinds, as array and as list for fast scalar access
+        self.kinds: np.ndarray = np.array([int(monomer.kind) for monomer in chain], dtype=np.int8)
+        self.__is_h: np.ndarray = self.kinds == int(MonomerKind.H)
+        self.__kinds: List[MonomerKind] = [monomer.kind for monomer in chain]
+        self.__record_values: List[MonomerRecordValue] = [MonomerRecordValue(int(monomer.kind)) for monomer in chain]
+        # Monomer positions, row idx holds (x, y) of monomer idx
+        self.positions: np.ndarray = np.array([(monomer.x, monomer.y) for monomer in chain], dtype=np.int64)
+
+        # Undo buffers, the first undo_length entries are valid.
+        self.undo_indices: np.ndarray = np.zeros(len(chain), dtype=np.int64)
+        self.undo_positions: np.ndarray = np.zeros((len(chain), 2), dtype=np.int64)
+        self.undo_length: int = 0
+        # Marks the monomers whose contacts are being counted, all False outside of count_contacts_of()
+        self.__counting: np.ndarray = np.zeros(len(chain), dtype=bool)
+
+        # The grid, used for fast lookups!
+        self.grid_size: int = 4 * len(chain) + 4
+        self.grid: np.ndarray = np.zeros((self.grid_size, self.grid_size), dtype=np.int32)
+        self.origin_x: int = 0
+        self.origin_y: int = 0
+        self.__calculate_lattice()
+
+        # Running count of H-H contacts, see ProteinLattice.
+        self.contact_count: int = self.compute_contact_count()
+        self.undo_contact_count: int = self.contact_count
+        # Indices where a kink jump or endpoint rotation is currently possible, see ProteinLattice.
+        self.__kink_candidates: IndexedSet = IndexedSet(idx for idx in range(0, len(chain))
+                                                        if is_kink_jump_possible(self, idx))
+        self.__dirty_indices: Set[int] = set()
+        self.__dirty_cells: Set[Tuple[int, int]] = set()
+        # Sums and bounding box for the radius of gyration, see ProteinLattice.
+        self.__gyration: GyrationTracker = GyrationTracker(self.get_position(idx) for idx in range(0, len(chain)))
+        # Hash of the conformation, see ProteinLattice.
+        self.__conformation_hash: ConformationHashTracker = ConformationHashTracker(len(chain))
+
+    # (Re)computes the occupancy grid, centered on the bounding box of the chain.
+    # Reuses the grid buffer so recentering does not allocate.
+    def __calculate_lattice(self):
+        mins = self.positions.min(axis=0)
+        maxs = self.positions.max(axis=0)
+        self.origin_x = int((mins[0] + maxs[0]) // 2) - self.grid_size // 2
+        self.origin_y = int((mins[1] + maxs[1]) // 2) - self.grid_size // 2
+
+        self.grid.fill(0)
+        self.grid[self.positions[:, 0] - self.origin_x,
+                  self.positions[:, 1] - self.origin_y] = np.arange(1, len(self.kinds) + 1, dtype=np.int32)
+
+    # Returns the protein chain as a list of Monomer objects.
+    # Builds new objects on every call, so only use it for output, not in the simulation loop.
+    @property
+    def chain(self) -> List[Monomer]:
+        return [Monomer(kind, x, y) for kind, (x, y) in zip(self.__kinds, self.positions.tolist())]
+
+    # Returns the length of the chain
+    def __len__(self) -> int:
+        return len(self.__kinds)
+
+    # Returns the x,y position of the monomer at idx in the chain
+    def get_position(self, idx: int) -> Tuple[int, int]:
+        return self.positions.item(idx, 0), self.positions.item(idx, 1)
+
+    # Returns the kind of the monomer at idx in the chain
+    def get_kind(self, idx: int) -> MonomerKind:
+        return self.__kinds[idx]
+
+    # Returns the positions of monomers start up to end (exclusive) as a (k, 2) int array
+    def get_positions(self, start: int, end: int) -> np.ndarray:
+        return self.positions[start:end]
+
+    # Returns whether any of the given (k, 2) positions is taken by a monomer outside of start up to end (exclusive).
+    # Positions of the monomers in start-end are considered free, as they are the ones being moved.
+    # Looks all positions up in the grid at once, positions outside of the grid are always free.
+    def has_collision(self, positions: np.ndarray, start: int, end: int) -> bool:
+        gx = positions[:, 0] - self.origin_x
+        gy = positions[:, 1] - self.origin_y
+        inside = (gx >= 0) & (gy >= 0) & (gx < self.grid_size) & (gy < self.grid_size)
+        values = self.grid[gx[inside], gy[inside]]
+        # Values hold index + 1, so the free range is start + 1 up to end + 1.
+        return bool(np.any((values != 0) & ((values <= start) | (values > end))))
+
+    # Returns an idx,value pair for a given position. idx = -1 if no monomer is present.
+    def get_by_coordinate(self, x: int, y: int) -> (int, MonomerRecordValue):
+        gx = x - self.origin_x
+        gy = y - self.origin_y
+        if 0 <= gx < self.grid_size and 0 <= gy < self.grid_size:
+            value = self.grid.item(gx, gy)
+            if value != 0:
+                return value - 1, self.__record_values[value - 1]
+        return -1, MonomerRecordValue.NONE
+
+    # Returns the monomer at position x,y
+    def get_monomer(self, x: int, y: int) -> Optional[Monomer]:
+        idx, _ = self.get_by_coordinate(x, y)
+        if idx != -1:
+            return Monomer(self.__kinds[idx], x, y)
+        return None
+
+    # Returns whether there is a monomer at x,y
+    def has_monomer(self, x: int, y: int) -> bool:
+        gx = x - self.origin_x
+        gy = y - self.origin_y
+        if 0 <= gx < self.grid_size and 0 <= gy < self.grid_size:
+            return self.grid.item(gx, gy) != 0
+        return False
+
+    # Writes new positions for the given indices into the positions array and grid.
+    # Recenters the grid if a new position falls outside of it.
+    def __write_positions(self, indices: np.ndarray, positions: np.ndarray):
+        old = self.positions[indices]
+        self.grid[old[:, 0] - self.origin_x, old[:, 1] - self.origin_y] = 0
+        self.positions[indices] = positions
+
+        gx = positions[:, 0] - self.origin_x
+        gy = positions[:, 1] - self.origin_y
+        if gx.min() < 1 or gy.min() < 1 or gx.max() >= self.grid_size - 1 or gy.max() >= self.grid_size - 1:
+            self.__calculate_lattice()
+        else:
+            self.grid[gx, gy] = indices + 1
+
+    # Writes a new position for a single monomer, scalar version of __write_positions.
+    def __write_position(self, idx: int, x: int, y: int):
+        ox, oy = self.get_position(idx)
+        self.grid[ox - self.origin_x, oy - self.origin_y] = 0
+        self.positions[idx, 0] = x
+        self.positions[idx, 1] = y
+
+        gx = x - self.origin_x
+        gy = y - self.origin_y
+        if 1 <= gx < self.grid_size - 1 and 1 <= gy < self.grid_size - 1:
+            self.grid[gx, gy] = idx + 1
+        else:
+            self.__calculate_lattice()
+
+    # Undoes the latest move(s) in the chain.
+    def undo_last_change(self):
+        # Restore the contact count
+        self.contact_count = self.undo_contact_count
+
+        if self.undo_length == 1:
+            idx = self.undo_indices.item(0)
+            x, y = self.get_position(idx)
+            ox, oy = self.undo_positions.item(0, 0), self.undo_positions.item(0, 1)
+            self.__write_position(idx, ox, oy)
+            self.__after_move([idx], [(x, y)], [(ox, oy)], undo=True)
+        elif self.undo_length > 1:
+            indices = self.undo_indices[:self.undo_length]
+            moved_cells = [(x, y) for x, y in self.positions[indices].tolist()]
+            old_cells = [(x, y) for x, y in self.undo_positions[:self.undo_length].tolist()]
+            self.__write_positions(indices, self.undo_positions[:self.undo_length])
+            self.__after_move(indices.tolist(), moved_cells, old_cells, undo=True)
+
+        # Clear undo set
+        self.undo_length = 0
+
+    # Move monomer to different position.
+    # Assumes x,y is empty!
+    # Erases and replaces the undo stack!
+    def move_monomer(self, idx: int, x: int, y: int):
+        ox, oy = self.get_position(idx)
+        self.undo_indices[0] = idx
+        self.undo_positions[0, 0] = ox
+        self.undo_positions[0, 1] = oy
+        self.undo_length = 1
+        self.undo_contact_count = self.contact_count
+
+        self.contact_count -= self.__count_contacts_of_monomer(idx)
+        self.__write_position(idx, x, y)
+        self.contact_count += self.__count_contacts_of_monomer(idx)
+
+        self.__after_move([idx], [(ox, oy)], [(x, y)])
+
+    # Moves multiple monomers at once.
+    # Tuple is: (index_in_chain, (x, y))
+    # Erases and replaces the undo stack!
+    def move_monomers(self, new_positions: List[Tuple[int, Tuple[int, int]]]):
+        indices = np.array([idx for idx, _ in new_positions], dtype=np.int64)
+        positions = np.array([position for _, position in new_positions], dtype=np.int64).reshape(-1, 2)
+        self.move_monomers_array(indices, positions)
+
+    # Moves multiple monomers at once, given as an index array and an (k, 2) position array.
+    # Erases and replaces the undo stack!
+    def move_monomers_array(self, indices: np.ndarray, positions: np.ndarray):
+        count = len(indices)
+        self.undo_indices[:count] = indices
+        self.undo_positions[:count] = self.positions[indices]
+        self.undo_length = count
+        self.undo_contact_count = self.contact_count
+
+        self.contact_count -= self.count_contacts_of(indices)
+        self.__write_positions(indices, positions)
+        self.contact_count += self.count_contacts_of(indices)
+
+        self.__after_move(indices.tolist(),
+                          [(x, y) for x, y in self.undo_positions[:count].tolist()],
+                          [(x, y) for x, y in positions.tolist()])
+
+    # Updates the bookkeeping that depends on monomer positions, see ProteinLattice.
+    def __after_move(self, indices: List[int], old_cells: List[Tuple[int, int]], new_cells: List[Tuple[int, int]],
+                     undo: bool = False):
+        self.__dirty_indices.update(indices)
+        self.__dirty_cells.update(old_cells)
+        self.__dirty_cells.update(new_cells)
+        if undo:
+            self.__gyration.undo_move(old_cells, new_cells)
+        else:
+            self.__gyration.move(old_cells, new_cells)
+        self.__conformation_hash.move(indices)
+
+    # Returns the indices where a kink jump or endpoint rotation is currently possible.
+    def get_kink_candidates(self) -> IndexedSet:
+        if len(self.__dirty_indices) != 0:
+            refresh_kink_candidates(self, self.__kink_candidates, self.__dirty_indices, self.__dirty_cells,
+                                    self.__kink_jumps_possible)
+            self.__dirty_indices.clear()
+            self.__dirty_cells.clear()
+        return self.__kink_candidates
+
+    # Returns whether a kink jump or endpoint rotation is possible at every index, see is_kink_jump_possible().
+    # The kink jumps are checked with array operations, the two endpoints one by one.
+    def __kink_jumps_possible(self) -> List[bool]:
+        length = len(self.__kinds)
+        if length < 3:
+            return [is_kink_jump_possible(self, idx) for idx in range(0, length)]
+        previous = self.positions[:-2]
+        current = self.positions[1:-1]
+        following = self.positions[2:]
+        # The previous and next monomer form a corner and the opposite corner is free.
+        # The opposite corner is a diagonal neighbour, so it is inside the grid.
+        opposite = previous + following - current
+        corner = (previous[:, 0] != following[:, 0]) & (previous[:, 1] != following[:, 1])
+        free = self.grid[opposite[:, 0] - self.origin_x, opposite[:, 1] - self.origin_y] == 0
+        return [is_kink_jump_possible(self, 0)] + (corner & free).tolist() + \
+            [is_kink_jump_possible(self, length - 1)]
+
+    # Returns the number of H-H contacts the given monomers (a list or an index array) take part in.
+    # Contacts between two of the given monomers are counted once.
+    # Many monomers are looked up in the grid all at once, a few one by one.
+    def count_contacts_of(self, indices: Union[List[int], np.ndarray]) -> int:
+        if len(indices) < ARRAY_CONTACTS_MIN_LENGTH:
+            moved = set(indices.tolist() if isinstance(indices, np.ndarray) else indices)
+            count = 0
+            for idx in moved:
+                if self.__kinds[idx] != MonomerKind.H:
+                    continue
+                x, y = self.get_position(idx)
+                for nx, ny in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]:
+                    other, value = self.get_by_coordinate(nx, ny)
+                    if value != MonomerRecordValue.H:
+                        continue
+                    # Contacts between two given monomers are only counted from the lowest index.
+                    if other not in moved or other > idx:
+                        count += 1
+            return count
+
+        indices = np.asarray(indices, dtype=np.int64)
+        is_h = self.__is_h
+        h_indices = indices[is_h[indices]]
+        # Index of the monomer at each of the 4 neighbours of every H monomer, -1 if the cell is empty.
+        # The grid keeps a free border, so the neighbours are always inside of it.
+        others = self.grid[(self.positions[h_indices, 0] - self.origin_x)[:, None] + NEIGHBOUR_DX,
+                           (self.positions[h_indices, 1] - self.origin_y)[:, None] + NEIGHBOUR_DY] - 1
+        counting = self.__counting
+        counting[indices] = True
+        # Contacts between two given monomers are only counted from the lowest index.
+        contacts = (others != -1) & is_h[others] & \
+            (~counting[others] | (others > h_indices[:, None]))
+        counting[indices] = False
+        return int(np.count_nonzero(contacts))
+
+    # Returns the number of H-H contacts of the monomer at idx, scalar version of count_contacts_of()
+    def __count_contacts_of_monomer(self, idx: int) -> int:
+        if self.__kinds[idx] != MonomerKind.H:
+            return 0
+        x = self.positions.item(idx, 0) - self.origin_x
+        y = self.positions.item(idx, 1) - self.origin_y
+        grid, record_values = self.grid, self.__record_values
+        count = 0
+        for value in (grid.item(x - 1, y), grid.item(x + 1, y), grid.item(x, y - 1), grid.item(x, y + 1)):
+            if value != 0 and record_values[value - 1] == MonomerRecordValue.H:
+                count += 1
+        return count
+
+    # Computes the number of H-H contacts over the whole chain.
+    def compute_contact_count(self) -> int:
+        return self.count_contacts_of(list(range(0, len(self.__kinds))))
+
+    # Debug function checking for internal inconsistencies in the lattice structure.
+    def consistency_check(self):
+        for idx in range(0, len(self.__kinds)):
+            x, y = self.get_position(idx)
+            assert self.get_by_coordinate(x, y)[0] == idx
+        assert np.count_nonzero(self.grid) == len(self.__kinds)
+        assert not np.any(self.__counting)
+        assert self.contact_count == self.compute_contact_count()
+        assert self.__gyration.state() == GyrationTracker(self.get_position(idx)
+                                                          for idx in range(0, len(self.__kinds))).state()
+        assert set(self.get_kink_candidates()) == {idx for idx in range(0, len(self.__kinds))
+                                             if is_kink_jump_possible(self, idx)}
+        assert self.compute_conformation_hash() == conformation_hash(self.positions)
+
+    # Returns the direct neighbouring Monomers around (x,y), if any
+    def get_neighbours(self, x: int, y: int) -> List[Monomer]:
+        neighbours = []
+
+        for nx, ny in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]:
+            idx, _ = self.get_by_coordinate(nx, ny)
+            if idx != -1:
+                neighbours.append(Monomer(self.__kinds[idx], nx, ny))
+
+        return neighbours
+
+    # Computes the center coordinate of the protein, see ProteinLattice
+    def compute_center_point(self) -> Tuple[float, float]:
+        return self.__gyration.center_point()
+
+    # Computes the radius of gyration, same definition as ProteinLattice.compute_gyration_radius()
+    def compute_gyration_radius(self) -> float:
+        return self.__gyration.gyration_radius()
+
+    # Computes the hash of the conformation, see conformation_hash().
+    # Only the turns around the monomers moved since the last call are updated.
+    def compute_conformation_hash(self) -> int:
+        return self.__conformation_hash.value(self.get_position)
+
+
+# Counters of attempted, rejected and accepted moves during a MMC simulation.
+# Rejected moves are attempts that were not possible on the lattice (collision or no kink present).
+# Accepted moves passed the Metropolis criterion, so attempted - rejected - accepted moves were undone.
+class MoveStatistics:
+    def __init__(self):
+        self.pivot_attempted: int = 0
+        self.pivot_rejected: int = 0
+        self.pivot_accepted: int = 0
+        self.kink_attempted: int = 0
+        self.kink_rejected: int = 0
+        self.kink_accepted: int = 0
+        self.crankshaft_attempted: int = 0
+        self.crankshaft_rejected: int = 0
+        self.crankshaft_accepted: int = 0
+        self.pull_attempted: int = 0
+        self.pull_rejected: int = 0
+        self.pull_accepted: int = 0
+
+    # Counts an accepted move of the given kind
+    def count_accepted(self, kind: MoveKind):
+        if kind == MoveKind.KinkJump:
+            self.kink_accepted += 1
+        elif kind == MoveKind.Pivot:
+            self.pivot_accepted += 1
+        elif kind == MoveKind.Crankshaft:
+            self.crankshaft_accepted += 1
+        else:
+            self.pull_accepted += 1
+
+    # Override for printing
+    def __repr__(self):
+        return self.__str__()
+
+    # Outputs the counters as text
+    def __str__(self):
+        return ('pivot: {}/{}/{}, kink: {}/{}/{}, crankshaft: {}/{}/{}, pull: {}/{}/{} '
+                '(attempted/rejected/accepted)').format(
+            self.pivot_attempted, self.pivot_rejected, self.pivot_accepted,
+            self.kink_attempted, self.kink_rejected, self.kink_accepted,
+            self.crankshaft_attempted, self.crankshaft_rejected, self.crankshaft_accepted,
+            self.pull_attempted, self.pull_rejected, self.pull_accepted)
 
 
 # Represents collected samples from a MMC simulation
+# energy and gyration_radius are lists, or arrays for samples read back from disk.
 class MMCSamples:
-    def __init__(self, energy: [float], gyration_radius: [float]):
-        self.energy: [float] = energy
-        self.gyration_radius: [float] = gyration_radius
+    def __init__(self, energy: Sequence[float], gyration_radius: Sequence[float],
+                 move_statistics: Optional[MoveStatistics] = None):
+        self.energy: Sequence[float] = energy
+        self.gyration_radius: Sequence[float] = gyration_radius
+        self.move_statistics: MoveStatistics = move_statistics if move_statistics is not None else MoveStatistics()
+
+
+# Keeps the capacity lowest energy conformations seen, without copying lattices.
+# Each conformation is stored as an (N, 2) array of positions, lattices are only built on request.
+# Conformations that are translations, rotations or reflections of each other count as the same,
+# the first one seen is kept. See canonical_conformation_key().
+# With equal energies the conformation seen first ranks higher.
+class LowestConformations:
+    def __init__(self, capacity: int = 1):
+        self.capacity: int = capacity
+        # Sorted from lowest to highest energy
+        self.energies: List[float] = []
+        self.positions: List[np.ndarray] = []
+        self.__keys: List[bytes] = []
+        # Taken from the first lattice offered
+        self.kinds: List[MonomerKind] = []
+        self.hydrophobicity: float = 0.0
+
+    def __len__(self) -> int:
+        return len(self.energies)
+
+    # Lowest energy seen, infinity if nothing was offered yet
+    @property
+    def lowest_energy(self) -> float:
+        return self.energies[0] if len(self.energies) != 0 else math.inf
+
+    # Returns whether a conformation with this energy would be stored, checked before taking a snapshot
+    def is_candidate(self, energy: float) -> bool:
+        return len(self.energies) < self.capacity or energy < self.energies[-1]
+
+    # Stores a snapshot of the lattice if its energy is among the lowest and it is not stored yet.
+    # Returns whether it was stored.
+    def offer(self, energy: float, lattice) -> bool:
+        if not self.is_candidate(energy):
+            return False
+        if len(self.kinds) == 0:
+            self.kinds = [lattice.get_kind(idx) for idx in range(0, len(lattice))]
+            self.hydrophobicity = lattice.hydrophobicity
+        return self.offer_positions(energy, lattice.get_positions(0, len(lattice)))
+
+    # Stores a copy of the (N, 2) positions if the energy is among the lowest and they are not stored yet.
+    # Returns whether they were stored.
+    def offer_positions(self, energy: float, positions: np.ndarray) -> bool:
+        if not self.is_candidate(energy):
+            return False
+        positions = np.array(positions, dtype=np.int64)
+        key = canonical_conformation_key(positions)
+        if key in self.__keys:
+            return False
+
+        rank = bisect.bisect_right(self.energies, energy)
+        self.energies.insert(rank, energy)
+        self.positions.insert(rank, positions)
+        self.__keys.insert(rank, key)
+        if len(self.energies) > self.capacity:
+            self.energies.pop()
+            self.positions.pop()
+            self.__keys.pop()
+        return True
+
+    # Offers all conformations stored in other
+    def merge(self, other: 'LowestConformations'):
+        if len(self.kinds) == 0:
+            self.kinds = other.kinds
+            self.hydrophobicity = other.hydrophobicity
+        for energy, positions in zip(other.energies, other.positions):
+            self.offer_positions(energy, positions)
+
+    # Builds the conformation at the rank (0 is the lowest) as a lattice of the given type
+    def get_lattice(self, rank: int = 0, lattice_type: Type = ProteinLattice) -> ProteinLattice:
+        return lattice_type([Monomer(kind, x, y) for kind, (x, y) in zip(self.kinds, self.positions[rank].tolist())],
+                            self.hydrophobicity)
+
+    # Builds all stored conformations, from lowest to highest energy
+    def get_lattices(self, lattice_type: Type = ProteinLattice) -> List[ProteinLattice]:
+        return [self.get_lattice(rank, lattice_type) for rank in range(0, len(self.energies))]
+
+
+# Bounded least recently used cache from conformation hash to (energy, gyration radius), see conformation_hash().
+# Saves full O(N) evaluations of conformations that are evaluated again, for callers that evaluate whole
+# conformations like enumeration, PERM or bulk conformation files. mmc() tracks the energy incrementally per move,
+# so it only uses the cache for its initial and resulting conformation.
+# The monomer kinds and epsilon are not part of the hash, so use one cache per chain and epsilon.
+class ConformationCache:
+    def __init__(self, capacity: int = 65536):
+        self.capacity: int = capacity
+        self.hits: int = 0
+        self.misses: int = 0
+        # Least recently used first
+        self.__entries: collections.OrderedDict = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.__entries
+
+    # Returns the (energy, gyration radius) stored for the hash and marks it as used, None if it is not stored
+    def get(self, key: int) -> Optional[Tuple[float, float]]:
+        value = self.__entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return value
+
+    # Stores the energy and gyration radius for the hash, dropping the least recently used entry if full
+    def put(self, key: int, energy: float, gyration_radius: float):
+        self.__entries[key] = (energy, gyration_radius)
+        self.__entries.move_to_end(key)
+        if len(self.__entries) > self.capacity:
+            self.__entries.popitem(last=False)
+
+    # Override for printing
+    def __repr__(self):
+        return self.__str__()
+
+    # Outputs the size and hit rate as text
+    def __str__(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / lookups if lookups != 0 else 0.0
+        return '{}/{} conformations, {}/{} hits ({:.1f}%)'.format(len(self.__entries), self.capacity,
+                                                                 self.hits, lookups, hit_rate)
+
+
+# Counts the distinct conformations visited at every temperature by their conformation hash,
+# a cheap measure of how much of the conformation space a sampler explores.
+class VisitedStates:
+    def __init__(self):
+        # Hashes of the conformations visited, per temperature
+        self.states: Dict[float, Set[int]] = {}
+        # Amount of visits, per temperature
+        self.visits: Dict[float, int] = {}
+
+    # Counts a visit of the conformation with the hash at the temperature
+    def visit(self, temperature: float, key: int):
+        states = self.states.get(temperature)
+        if states is None:
+            states = self.states[temperature] = set()
+            self.visits[temperature] = 0
+        states.add(key)
+        self.visits[temperature] += 1
+
+    # Amount of distinct conformations visited at the temperature
+    def distinct_count(self, temperature: float) -> int:
+        return len(self.states.get(temperature, ()))
+
+    # Returns (temperature, distinct conformations, visits) for every temperature, from high to low temperature
+    def counts(self) -> List[Tuple[float, int, int]]:
+        return [(temperature, len(self.states[temperature]), self.visits[temperature])
+                for temperature in sorted(self.states, reverse=True)]
+
+    # Adds the visits counted by other
+    def merge(self, other: 'VisitedStates'):
+        for temperature, states in other.states.items():
+            self.states.setdefault(temperature, set()).update(states)
+            self.visits[temperature] = self.visits.get(temperature, 0) + other.visits[temperature]
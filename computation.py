@@ -1,7 +1,9 @@
-import drawing
+import accelerated
 from classes import *
 from typing import *
 from generation import *
+from sample_sinks import *
+from online_statistics import *
 from statistics import mean
 import math
 import copy
@@ -24,8 +26,7 @@ def calculate_energy(epsilon: float, lattice: ProteinLattice) -> float:
     # f = Encounters
     f: int = 0
 
-    for i in range(0, len(lattice.chain)):
-        monomer = lattice.chain[i]
+    for monomer in lattice.chain:
 
         # We only care about H monomers.
         if monomer.kind != MonomerKind.H:
@@ -44,6 +45,26 @@ def calculate_energy(epsilon: float, lattice: ProteinLattice) -> float:
     return -1.0 * epsilon * float(f)
 
 
+# Returns the energy level of the chain using the running contact count of the lattice.
+# Gives the same result as calculate_energy, but in O(1) as the lattice updates the count on every move.
+def calculate_energy_incremental(epsilon: float, lattice: ProteinLattice) -> float:
+    return -1.0 * epsilon * float(lattice.contact_count)
+
+
+# Returns (energy, gyration radius) of the chain, looked up by its conformation hash in the cache if given.
+# Conformations that are not in the cache are evaluated with calculate_energy() and stored.
+def calculate_energy_cached(epsilon: float, lattice: ProteinLattice,
+                            cache: Optional[ConformationCache] = None) -> Tuple[float, float]:
+    if cache is None:
+        return calculate_energy(epsilon, lattice), lattice.compute_gyration_radius()
+    key = lattice.compute_conformation_hash()
+    value = cache.get(key)
+    if value is None:
+        value = calculate_energy(epsilon, lattice), lattice.compute_gyration_radius()
+        cache.put(key, *value)
+    return value
+
+
 # Returns the positions to check for a diff between previous and current points.
 # Specifically for endpoint rotations.
 def endpoints_rotate_lookup_table(diff_x: int, diff_y: int) -> List[Tuple[int, int]]:
@@ -80,61 +101,61 @@ def kink_jump_lookup_table(diff_prev_x: int,
 # Might do an endpoint rotation if requested on endpoint in chain
 # Modifies the given lattice!
 def perform_kink_jump(idx_to_jump: int, lattice: ProteinLattice) -> bool:
-    monomer = lattice.chain[idx_to_jump]
-    if idx_to_jump == 0 or idx_to_jump == len(lattice.chain) - 1:
+    x, y = lattice.get_position(idx_to_jump)
+    if idx_to_jump == 0 or idx_to_jump == len(lattice) - 1:
         # Endpoint rotate
         # Determine previous monomer
         if idx_to_jump == 0:
-            prev_monomer = lattice.chain[1]
+            prev_x, prev_y = lattice.get_position(1)
         else:
-            prev_monomer = lattice.chain[-2]
+            prev_x, prev_y = lattice.get_position(len(lattice) - 2)
 
         # Determine relative offsets from prev_monomer based on diff xy
-        offsets = endpoints_rotate_lookup_table(prev_monomer.x - monomer.x, prev_monomer.y - monomer.y)
-        for (x, y) in offsets:
+        offsets = endpoints_rotate_lookup_table(prev_x - x, prev_y - y)
+        for (dx, dy) in offsets:
             # Check if position is taken or not, and move if possible.
-            if not lattice.has_monomer(prev_monomer.x + x, prev_monomer.y + y):
-                lattice.move_monomer(idx_to_jump, prev_monomer.x + x, prev_monomer.y + y)
+            if not lattice.has_monomer(prev_x + dx, prev_y + dy):
+                lattice.move_monomer(idx_to_jump, prev_x + dx, prev_y + dy)
                 return True
     else:
         # Determine if a kink jump can be performed
-        prev_mon = lattice.chain[idx_to_jump - 1]
-        next_mon = lattice.chain[idx_to_jump + 1]
+        prev_x, prev_y = lattice.get_position(idx_to_jump - 1)
+        next_x, next_y = lattice.get_position(idx_to_jump + 1)
         # Check the four configurations
 
         # Gather the position to check
-        offsets = kink_jump_lookup_table(prev_mon.x - monomer.x,
-                                         prev_mon.y - monomer.y,
-                                         next_mon.x - monomer.x,
-                                         next_mon.y - monomer.y)
+        offsets = kink_jump_lookup_table(prev_x - x,
+                                         prev_y - y,
+                                         next_x - x,
+                                         next_y - y)
 
         # Check if position is taken or not, perform kink jump if possible.
-        for (x, y) in offsets:
+        for (dx, dy) in offsets:
             # List will always be either 0 or 1 in length.
             # (Using a list makes it easier to use than an explicit None check)
-            if not lattice.has_monomer(monomer.x + x, monomer.y + y):
-                lattice.move_monomer(idx_to_jump, monomer.x + x, monomer.y + y)
+            if not lattice.has_monomer(x + dx, y + dy):
+                lattice.move_monomer(idx_to_jump, x + dx, y + dy)
                 return True
 
     # No kink jump possible. Returning False.
     return False
 
 
-# Gathers all monomers that need to be rotated based on rotation point and part
-def gather_rotated_monomers(lattice: ProteinLattice,
-                            rotation_point_idx: int,
-                            part: MonomerPart) -> List[Tuple[int, Monomer]]:
-    monomers = []
+# All symmetries used by the pivot move in the mmc loop.
+PIVOT_SYMMETRIES: List[PivotSymmetry] = [symmetry for symmetry in PivotSymmetry]
+
+# Amount of monomers nearest to the pivot point that are rotated and checked one at a time
+# before the rest of the part is checked at once.
+PIVOT_EARLY_REJECTION_LENGTH: int = 8
+
+
+# Returns the (start, end) index range (end exclusive) of the monomers that are moved by a pivot
+def rotated_part_range(lattice: ProteinLattice, rotation_point_idx: int, part: MonomerPart) -> Tuple[int, int]:
     if part == MonomerPart.Left:
         # Get 0 - idx (exclusive idx)
-        for i in range(0, rotation_point_idx):
-            monomers.append((i, lattice.chain[i]))
-    else:
-        # Get idx - end (exclusive idx)
-        for i in range(rotation_point_idx + 1, len(lattice.chain)):
-            monomers.append((i, lattice.chain[i]))
-
-    return monomers
+        return 0, rotation_point_idx
+    # Get idx - end (exclusive idx)
+    return rotation_point_idx + 1, len(lattice)
 
 
 # Tries to perform a pivot move given a rotation point, direction, which part to rotate and the input lattice.
@@ -144,62 +165,132 @@ def perform_pivot(rotation_point_idx: int,
                   direction: Direction,
                   rotated_part: MonomerPart,
                   lattice: ProteinLattice) -> bool:
-    rotation_monomer = lattice.chain[rotation_point_idx]
+    symmetry = {
+        Direction.ClockWise: PivotSymmetry.Rotate270,
+        Direction.CounterClockWise: PivotSymmetry.Rotate90
+    }[direction]
+    return perform_pivot_symmetry(rotation_point_idx, symmetry, rotated_part, lattice)
+
 
-    rotated_part = gather_rotated_monomers(lattice, rotation_point_idx, rotated_part)
+# Tries to perform a pivot move applying any lattice symmetry to the given part of the chain.
+# Returns true if the move succeeded, false if not.
+# Modifies the given lattice!
+def perform_pivot_symmetry(rotation_point_idx: int,
+                           symmetry: PivotSymmetry,
+                           rotated_part: MonomerPart,
+                           lattice: ProteinLattice) -> bool:
+    start, end = rotated_part_range(lattice, rotation_point_idx, rotated_part)
 
     # Exception for special case when rotating the endpoint and part to rotate is len == 0
     # In such a special case, nothing is done to the monomer, thus we would waste an iteration.
     # Therefore, we return False.
-    if len(rotated_part) == 0:
+    if start == end:
         return False
 
-    # Get the rotation angle
-    angle = {
-        Direction.ClockWise: 3 * math.pi / 2.0,
-        Direction.CounterClockWise: math.pi / 2.0
-    }[direction]
+    pivot_x, pivot_y = lattice.get_position(rotation_point_idx)
+    (a, b), (c, d) = pivot_symmetry_matrix(symmetry).tolist()
 
-    new_positions = []
-    for (mon_idx, monomer) in rotated_part:
-        # Translate the monomer to 0,0
-        shifted_x = monomer.x - rotation_monomer.x
-        shifted_y = monomer.y - rotation_monomer.y
-
-        # Rotate the monomer
-        a1 = float(shifted_x) * math.cos(angle)
-        a2 = float(shifted_y) * math.sin(angle)
-        a3 = float(shifted_x) * math.sin(angle)
-        a4 = float(shifted_y) * math.cos(angle)
-
-        rotated_shifted_x = int(round(a1 - a2))
-        rotated_shifted_y = int(round(a3 + a4))
-
-        # Translate the monomer back to original position
-        new_positions.append((mon_idx,
-                              (rotated_shifted_x + rotation_monomer.x,
-                               rotated_shifted_y + rotation_monomer.y)
-                              ))
-
-    # We need to check both the lattice if we can rotate.
-    for (_, (x, y)) in new_positions:
-        # Check for positions from the rotated part, these are always free after rotation.
-        # (It effectively excludes the positions of the rotated part.)
-        if any(elem.x == x and elem.y == y for (_, elem) in rotated_part):
-            continue
-        # Check the lattice
-        if lattice.has_monomer(x, y):
+    # Rotate and test the monomers nearest to the pivot point one at a time first.
+    # Collisions are most likely there, so most failing attempts stop before the rest of the part is touched.
+    if rotated_part == MonomerPart.Left:
+        nearest = range(end - 1, max(start, end - PIVOT_EARLY_REJECTION_LENGTH) - 1, -1)
+    else:
+        nearest = range(start, min(end, start + PIVOT_EARLY_REJECTION_LENGTH))
+    for idx in nearest:
+        x, y = lattice.get_position(idx)
+        shifted_x, shifted_y = x - pivot_x, y - pivot_y
+        other_idx, _ = lattice.get_by_coordinate(shifted_x * a + shifted_y * c + pivot_x,
+                                                 shifted_x * b + shifted_y * d + pivot_y)
+        # Positions of the rotated part itself are always free after rotation.
+        if other_idx != -1 and not start <= other_idx < end:
+            return False
+
+    # Translate the part to 0,0, apply the symmetry and translate back, all in one go.
+    pivot = np.array((pivot_x, pivot_y), dtype=np.int64)
+    new_positions = (lattice.get_positions(start, end) - pivot) @ pivot_symmetry_matrix(symmetry) + pivot
+
+    # Check the remainder of the part against the lattice.
+    if end - start > PIVOT_EARLY_REJECTION_LENGTH:
+        if rotated_part == MonomerPart.Left:
+            remainder = new_positions[:len(new_positions) - PIVOT_EARLY_REJECTION_LENGTH]
+        else:
+            remainder = new_positions[PIVOT_EARLY_REJECTION_LENGTH:]
+        if lattice.has_collision(remainder, start, end):
             return False
 
     # Actually move the monomers to the new positions in the lattice/chain
-    lattice.move_monomers(new_positions)
+    lattice.move_monomers_array(np.arange(start, end, dtype=np.int64), new_positions)
+
+    return True
+
+
+# Tries to do a crankshaft move of monomers idx and idx + 1, returns whether it succeeded or not.
+# Possible if idx - 1 up to idx + 2 form a U shape: both monomers flip over to the other side of the U.
+# Doing the same move again flips them back.
+# Modifies the given lattice!
+def perform_crankshaft(idx: int, lattice: ProteinLattice) -> bool:
+    if idx < 1 or idx + 2 >= len(lattice):
+        return False
+    prev_x, prev_y = lattice.get_position(idx - 1)
+    x, y = lattice.get_position(idx)
+    next_x, next_y = lattice.get_position(idx + 1)
+    last_x, last_y = lattice.get_position(idx + 2)
+
+    # The ends of the U are adjacent and both monomers stick out in the same direction.
+    dx, dy = x - prev_x, y - prev_y
+    if (next_x - last_x, next_y - last_y) != (dx, dy) or abs(last_x - prev_x) + abs(last_y - prev_y) != 1:
+        return False
+    if lattice.has_monomer(prev_x - dx, prev_y - dy) or lattice.has_monomer(last_x - dx, last_y - dy):
+        return False
+
+    lattice.move_monomers([(idx, (prev_x - dx, prev_y - dy)), (idx + 1, (last_x - dx, last_y - dy))])
+    return True
+
+
+# Tries to do a pull move of monomer idx, returns whether it succeeded or not.
+# Monomer idx moves to a free position L, the given part of the chain follows it (Lesh, Mitzenmacher and Whitesides).
+# See classes.pull_move_positions() for where the monomers move to.
+# If idx has a neighbour in the other part, L must be next to that neighbour and diagonal to idx:
+# l_direction must point from idx to the neighbour and c_direction must be perpendicular to it.
+# Otherwise idx is an end of the chain and L and C can be any adjacent pair of positions.
+# C must be free or taken by the next monomer of the part, which then stays where it is.
+# The reverse of a pull move is a pull move again.
+# Modifies the given lattice!
+def perform_pull_move(idx: int, part: MonomerPart, c_direction: int, l_direction: int,
+                      lattice: ProteinLattice) -> bool:
+    length = len(lattice)
+    step = -1 if part == MonomerPart.Left else 1
+    x, y = lattice.get_position(idx)
+    c_dx, c_dy = NEIGHBOUR_OFFSETS[c_direction]
+    l_dx, l_dy = NEIGHBOUR_OFFSETS[l_direction]
+
+    anchor = idx - step
+    if 0 <= anchor < length:
+        anchor_x, anchor_y = lattice.get_position(anchor)
+        if (l_dx, l_dy) != (anchor_x - x, anchor_y - y) or c_dx * l_dx + c_dy * l_dy != 0:
+            return False
+
+    c_x, c_y = x + c_dx, y + c_dy
+    if lattice.has_monomer(c_x + l_dx, c_y + l_dy):
+        return False
+    follower = idx + step
+    if 0 <= follower < length:
+        other_idx, _ = lattice.get_by_coordinate(c_x, c_y)
+        if other_idx != -1 and other_idx != follower:
+            return False
 
+    lattice.move_monomers(pull_move_positions(lattice.get_position, length, idx, part, c_direction, l_direction))
     return True
 
 
+# Returns how many of sample_count values discard_fraction_of_array() discards
+def discarded_sample_count(sample_count: int, fraction: float = 0.1) -> int:
+    return int(math.ceil(sample_count * fraction))
+
+
 # Discards first {fraction} amount of elements from values.
 def discard_fraction_of_array(values: List[float], fraction: float = 0.1) -> List[float]:
-    slice_idx = int(math.ceil(len(values) * fraction))
+    slice_idx = discarded_sample_count(len(values), fraction)
     return values[slice_idx:len(values)]
 
 
@@ -209,54 +300,192 @@ def compute_heat_capacity(values: List[float], temperature: float, boltzmann: fl
     if discard:
         values = discard_fraction_of_array(values, discard_fraction)
 
-    mean_squared_energy = mean([e ** 2 for e in values])
-    mean_energy = mean(values)
-
-    return (mean_squared_energy - (mean_energy ** 2)) / (boltzmann * temperature)
+    # Variance of the energy: mean(E^2) - mean(E)^2, computed in one pass over an array without a list of squares.
+    return float(np.var(np.asarray(values, dtype=np.float64))) / (boltzmann * temperature)
 
 
 # Performs the kink jump move as part of the main mmc loop.
 # May fail, returns False in that case!
-def mmc_attempt_kink_jump(lattice: ProteinLattice) -> bool:
-    success = False
-    # Perform kink jump
-
-    # Keep track of attempted indices, since kink jumps and endpoint rotations are usually only possible on
-    # a few positions in the chain. So therefore we keep track of this as a small optimization in order to avoid
-    # re-attempting already attempted positions where we did a kink jump move.
-    # If this list becomes empty, it means kink jump was not possible. The function will return False.
+# Counts attempts and rejections in statistics, if given.
+# Draws from rng, or from a stream seeded by the global random module if it is not given.
+# Stages the move in trajectory (a trajectories.TrajectoryWriter), if given.
+def mmc_attempt_kink_jump(lattice: ProteinLattice, statistics: Optional[MoveStatistics] = None,
+                          rng: Optional[RandomStream] = None, trajectory=None) -> bool:
+    # The lattice keeps track of the indices where a kink jump or endpoint rotation is possible,
+    # so we can directly pick one of those instead of probing random positions.
+    # If there are none, kink jump is not possible. The function will return False.
     # In such a situation the algorithm MUST perform a pivot first in order to get unstuck.
-    possible_attempts = [e for e in range(0, len(lattice.chain))]
-    while not success and len(possible_attempts) != 0:
-        jump_idx = choices(possible_attempts)[0]
-        success = perform_kink_jump(jump_idx, lattice)
-        if not success:
-            # Disallow attempted indices
-            possible_attempts.remove(jump_idx)
+    candidates = lattice.get_kink_candidates()
+    if len(candidates) == 0:
+        return False
+
+    if rng is None:
+        rng = RandomStream.from_global_random()
+    jump_idx = rng.choice(candidates)
+    old_x, old_y = lattice.get_position(jump_idx)
+    success = perform_kink_jump(jump_idx, lattice)
+    if success and trajectory is not None:
+        new_x, new_y = lattice.get_position(jump_idx)
+        trajectory.stage_kink_jump(jump_idx, new_x - old_x, new_y - old_y)
+    if statistics is not None:
+        statistics.kink_attempted += 1
+        statistics.kink_rejected += 0 if success else 1
     return success
 
 
 # Performs the pivot move as part of the main mmc loop.
+# Picks one of the given lattice symmetries for each attempt, by default all of them.
 # In practice always succeeds so always should return True.
-def mmc_perform_pivot(lattice: ProteinLattice) -> bool:
+# With single_attempt it returns False if the first attempt is not possible, instead of trying again.
+# Then every pivot is proposed as often as its reverse, which Wang-Landau sampling depends on.
+# Counts attempts and rejections in statistics, if given.
+# Draws from rng, or from a stream seeded by the global random module if it is not given.
+# Stages the move in trajectory (a trajectories.TrajectoryWriter), if given.
+def mmc_perform_pivot(lattice: ProteinLattice, symmetries: List[PivotSymmetry] = PIVOT_SYMMETRIES,
+                      statistics: Optional[MoveStatistics] = None,
+                      rng: Optional[RandomStream] = None, trajectory=None, single_attempt: bool = False) -> bool:
+    if rng is None:
+        rng = RandomStream.from_global_random()
     success = False
-    while not success:
-        rotation_idx = choices(range(0, len(lattice.chain)))[0]
-        direction = choice([0, 1])
-        part = choice([0, 1])
-        success = perform_pivot(rotation_idx, Direction(direction), MonomerPart(part), lattice)
+    attempts = 0
+    while not success and not (single_attempt and attempts == 1):
+        attempts += 1
+        rotation_idx = rng.randrange(len(lattice))
+        symmetry = rng.choice(symmetries)
+        part = rng.randrange(2)
+        success = perform_pivot_symmetry(rotation_idx, symmetry, MonomerPart(part), lattice)
+        if statistics is not None:
+            statistics.pivot_attempted += 1
+            statistics.pivot_rejected += 0 if success else 1
+    if success and trajectory is not None:
+        trajectory.stage_pivot(rotation_idx, symmetry, MonomerPart(part))
+    return success
+
+
+# Performs the crankshaft move as part of the main mmc loop.
+# Fails if the picked monomers do not form a U shape or the other side is taken, returns False in that case.
+# Counts attempts and rejections in statistics, if given.
+# Draws from rng, or from a stream seeded by the global random module if it is not given.
+# Stages the move in trajectory (a trajectories.TrajectoryWriter), if given.
+def mmc_attempt_crankshaft(lattice: ProteinLattice, statistics: Optional[MoveStatistics] = None,
+                           rng: Optional[RandomStream] = None, trajectory=None) -> bool:
+    if rng is None:
+        rng = RandomStream.from_global_random()
+    # Any monomer with two monomers after it and one before can start a U shape.
+    idx = rng.randrange(len(lattice) - 3) + 1 if len(lattice) >= 4 else 0
+    old_x, old_y = lattice.get_position(idx)
+    success = perform_crankshaft(idx, lattice)
+    if success and trajectory is not None:
+        new_x, new_y = lattice.get_position(idx)
+        trajectory.stage_crankshaft(idx, new_x - old_x, new_y - old_y)
+    if statistics is not None:
+        statistics.crankshaft_attempted += 1
+        statistics.crankshaft_rejected += 0 if success else 1
     return success
 
 
+# Performs the pull move as part of the main mmc loop.
+# Picks the monomer, the part that follows it and the directions at random, fails if they do not form a pull move.
+# Returns False in that case!
+# A pull move of an end towards the rest of the chain has 16 combinations of directions, any other pull move 4,
+# as l_direction follows from the neighbour in the other part. Pulls of an end are picked 4 times as often,
+# so every pull move is proposed as often as its reverse.
+# Counts attempts and rejections in statistics, if given.
+# Draws from rng, or from a stream seeded by the global random module if it is not given.
+# Stages the move in trajectory (a trajectories.TrajectoryWriter), if given.
+def mmc_attempt_pull_move(lattice: ProteinLattice, statistics: Optional[MoveStatistics] = None,
+                          rng: Optional[RandomStream] = None, trajectory=None) -> bool:
+    if rng is None:
+        rng = RandomStream.from_global_random()
+    length = len(lattice)
+    pick = rng.randrange(2 * length + 6)
+    c_direction = rng.randrange(len(NEIGHBOUR_OFFSETS))
+    if pick < 8:
+        # Pull of an end
+        idx, part = (0, MonomerPart.Right) if pick < 4 else (length - 1, MonomerPart.Left)
+        l_direction = rng.randrange(len(NEIGHBOUR_OFFSETS))
+    else:
+        # Pull of a monomer with a neighbour in the other part, L is next to that neighbour
+        pick -= 8
+        idx, part = (pick, MonomerPart.Left) if pick < length - 1 else (pick - length + 2, MonomerPart.Right)
+        x, y = lattice.get_position(idx)
+        anchor_x, anchor_y = lattice.get_position(idx + 1 if part == MonomerPart.Left else idx - 1)
+        l_direction = NEIGHBOUR_OFFSETS.index((anchor_x - x, anchor_y - y))
+    success = perform_pull_move(idx, part, c_direction, l_direction, lattice)
+    if success and trajectory is not None:
+        trajectory.stage_pull_move(idx, part, c_direction, l_direction)
+    if statistics is not None:
+        statistics.pull_attempted += 1
+        statistics.pull_rejected += 0 if success else 1
+    return success
+
+
+# Returns the move kinds with a probability larger than 0 and their cumulative probabilities, scaled to end at 1.
+# Passed to pick_move_kind(), so a move kind is picked with a single random number.
+def cumulative_move_probabilities(move_probabilities: Dict[MoveKind, float]) -> Tuple[List[MoveKind], List[float]]:
+    move_kinds = [kind for kind in MoveKind if move_probabilities.get(kind, 0.0) > 0.0]
+    assert len(move_kinds) != 0, 'At least one move kind needs a probability larger than 0'
+    cumulative = np.cumsum([move_probabilities[kind] for kind in move_kinds])
+    return move_kinds, (cumulative / cumulative[-1]).tolist()
+
+
+# Picks the kind of the next move of the mmc loop from the output of cumulative_move_probabilities().
+# Picks kink jumps and pivots half of the time each if move_kinds is None.
+def pick_move_kind(rng: RandomStream, move_kinds: Optional[List[MoveKind]],
+                   cumulative: Optional[List[float]]) -> MoveKind:
+    if move_kinds is None:
+        return MoveKind(rng.randrange(2))
+    return move_kinds[bisect.bisect_right(cumulative, rng.random())]
+
+
+# Performs a move of the given kind as part of the main mmc loop.
+# Returns the kind of the move that was done, and whether it succeeded.
+# A crankshaft or pull move that is not possible leaves the chain as it is.
+# So does a pivot with single_pivot_attempt, see mmc_perform_pivot().
+def mmc_attempt_move(kind: MoveKind, lattice: ProteinLattice, statistics: Optional[MoveStatistics] = None,
+                     rng: Optional[RandomStream] = None, trajectory=None,
+                     single_pivot_attempt: bool = False) -> Tuple[MoveKind, bool]:
+    if kind == MoveKind.KinkJump:
+        # Perform kink jump / endpoint rotation.
+        # In some rare cases this can fail, so we need to check for that.
+        # In such situations there are no kink jump / endpoint rotations possible.
+        # Therefore, opposed to the given sample pseudocode, I check this and perform a pivot instead.
+        # This prevents the simulation from becoming stuck.
+        if mmc_attempt_kink_jump(lattice, statistics=statistics, rng=rng, trajectory=trajectory):
+            return kind, True
+        return MoveKind.Pivot, mmc_perform_pivot(lattice, statistics=statistics, rng=rng, trajectory=trajectory,
+                                                 single_attempt=single_pivot_attempt)
+    if kind == MoveKind.Pivot:
+        return kind, mmc_perform_pivot(lattice, statistics=statistics, rng=rng, trajectory=trajectory,
+                                       single_attempt=single_pivot_attempt)
+    if kind == MoveKind.Crankshaft:
+        return kind, mmc_attempt_crankshaft(lattice, statistics=statistics, rng=rng, trajectory=trajectory)
+    return kind, mmc_attempt_pull_move(lattice, statistics=statistics, rng=rng, trajectory=trajectory)
+
+
 # Returns the default protein
-def mmc_initialize_default_protein(chain_length: int, hydrophobicity: float) -> ProteinLattice:
+# lattice_type selects the lattice backend, either ProteinLattice or ArrayProteinLattice.
+def mmc_initialize_default_protein(chain_length: int, hydrophobicity: float,
+                                   lattice_type: Type = ProteinLattice) -> ProteinLattice:
     # Generate the protein chain.
-    seed(1234, 2)  # Set seed to fixed value for reproducibility of initial configuration.
-    lattice = ProteinLattice(generate_protein(chain_length, hydrophobicity), hydrophobicity)
+    # Uses its own generator with a fixed seed for reproducibility of initial configuration,
+    # without resetting the global random state.
+    lattice = lattice_type(generate_protein(chain_length, hydrophobicity, Random(1234)), hydrophobicity)
 
     return lattice
 
 
+# Draws the conformation of the lattice, or submits it to the renderer (a rendering.RenderQueue) if given.
+# The renderer writes it to a file in a worker process, so the simulation does not wait for it.
+def draw_conformation(lattice: ProteinLattice, temperature: float, renderer=None, name: str = 'conformation'):
+    if renderer is not None:
+        renderer.submit_conformation(lattice, temperature, name)
+    else:
+        # Imported here, as drawing star-imports this module and importing it at the top would make a cycle.
+        import drawing
+        drawing.draw_protein_conformation(lattice, temperature, lattice.hydrophobicity)
+
+
 # Main function for performing the MMC simulation.
 # Returns a tuple: ( (lowest_energy_lattice, lowest_energy), result_lattice, samples )
 def mmc(temperature: float,  # Temperature parameter
@@ -267,73 +496,147 @@ def mmc(temperature: float,  # Temperature parameter
         boltzmann: float = 1.0,  # Boltzmann weight
         draw_initial_conformation_plot: bool = False,  # Boolean indicating if initial conformation needs to be drawn
         draw_resulting_conformation_plot: bool = False,  # Boolean indicating if final conformation needs to be drawn
-        # Keeps track of lowest lattice found. Causes noticable performance hit due to excess copying of memory.
-        store_lowest_lattice: bool = False) -> Tuple[Tuple[ProteinLattice, float], ProteinLattice, MMCSamples]:
+        # Keeps track of lowest lattice found. Only positions are copied, the lattice is built once at the end.
+        store_lowest_lattice: bool = True,
+        # Implementation to use, 'python' or 'numba'. Falls back to 'python' if Numba is not installed.
+        backend: str = accelerated.BACKEND_PYTHON,
+        # Random number stream of this run. If not given, a stream is seeded from the global random module.
+        rng: Optional[RandomStream] = None,
+        # Receives the samples as they are taken. If not given, they are kept in memory.
+        sink: Optional[SampleSink] = None,
+        # trajectories.TrajectoryWriter that records every step. Only supported by the 'python' backend.
+        trajectory=None,
+        # Receives the lowest conformations if store_lowest_lattice is set, one is kept if not given.
+        # Pass one with a larger capacity to keep the top-K, or the same one to several runs to track over all of them.
+        lowest: Optional[LowestConformations] = None,
+        # Relative probability of each MoveKind, missing kinds are not done.
+        # Kink jumps and pivots half of the time each if not given. Only the default is supported by 'numba'.
+        move_probabilities: Optional[Dict[MoveKind, float]] = None,
+        # Looks up the initial conformation and stores the resulting one by their conformation hash, if given.
+        # Moves are evaluated incrementally, so the cache only saves the full evaluations at the start of each run.
+        # Only used by 'python'.
+        cache: Optional[ConformationCache] = None,
+        # Counts the distinct conformations visited at this temperature, if given. Only supported by 'python'.
+        visited: Optional[VisitedStates] = None,
+        # rendering.RenderQueue that renders the conformation plots to files, they are shown if not given.
+        renderer=None) -> Tuple[Tuple[ProteinLattice, float], ProteinLattice, MMCSamples]:
 
     # Draw the initial conformation or not
     if draw_initial_conformation_plot:
-        drawing.draw_protein_conformation(lattice, temperature, lattice.hydrophobicity)
-
-    energy_samples = []
-    gyration_samples = []
+        draw_conformation(lattice, temperature, renderer, 'initial_conformation')
+
+    if rng is None:
+        rng = RandomStream.from_global_random()
+    if sink is None:
+        sink = MemorySampleSink()
+    if store_lowest_lattice and lowest is None:
+        lowest = LowestConformations()
+
+    # Run the compiled implementation if requested and available.
+    # It does not record trajectories, count visited conformations or do crankshaft and pull moves,
+    # so the Python implementation is used when a trajectory, visited states or move probabilities are given.
+    # Its random numbers are seeded from rng, so runs stay reproducible.
+    if backend == accelerated.BACKEND_NUMBA and accelerated.NUMBA_AVAILABLE and trajectory is None and \
+            move_probabilities is None and visited is None:
+        # The kernel moves the lattice, so the initial conformation is offered before and its snapshot after.
+        if store_lowest_lattice:
+            lowest.offer(calculate_energy_incremental(epsilon, lattice), lattice)
+        (lowest_lattice, lowest_lattice_energy), lattice, samples = accelerated.mmc_accelerated(
+            temperature, max_iterations, sampling_frequency, lattice,
+            rng.randrange(2 ** 32),
+            epsilon=epsilon,
+            boltzmann=boltzmann,
+            store_lowest_lattice=store_lowest_lattice)
+        sink.extend(samples.energy, samples.gyration_radius)
+        sink.flush()
+        if draw_resulting_conformation_plot:
+            draw_conformation(lattice, temperature, renderer, 'resulting_conformation')
+        if store_lowest_lattice:
+            lowest.offer(lowest_lattice_energy, lowest_lattice)
+            lowest_lattice, lowest_lattice_energy = lowest.get_lattice(0, type(lattice)), lowest.lowest_energy
+        return (lowest_lattice, lowest_lattice_energy), lattice, MMCSamples(sink.get_energy(),
+                                                                            sink.get_gyration_radius(),
+                                                                            samples.move_statistics)
+
+    statistics = MoveStatistics()
+    if trajectory is not None:
+        trajectory.start(lattice)
+
+    if move_probabilities is not None:
+        move_kinds, move_cumulative = cumulative_move_probabilities(move_probabilities)
+    else:
+        move_kinds, move_cumulative = None, None
 
     # Take initial samples
-    energy = calculate_energy(epsilon, lattice)
-    energy_samples.append(energy)
-    gyration_samples.append(lattice.compute_gyration_radius())
+    energy, gyration_radius = calculate_energy_cached(epsilon, lattice, cache)
+    sink.append(energy, gyration_radius)
+    if visited is not None:
+        visited.visit(temperature, lattice.compute_conformation_hash())
 
     # Store which lattice is the lowest encountered so far.
     lowest_lattice = lattice
     lowest_lattice_energy: float = energy
+    if store_lowest_lattice:
+        lowest.offer(energy, lattice)
 
     for iteration in range(0, max_iterations):
-        # Choose operation
-        operation_kind = choice([0, 1])
-        if operation_kind == 0:
-            # Perform kink jump / endpoint rotation.
-            # In some rare cases this can fail, so we need to check for that.
-            # In such situations there are no kink jump / endpoint rotations possible.
-            # Therefore, opposed to the given sample pseudocode, I check this and perform a pivot instead.
-            # This prevents the simulation from becoming stuck.
-            success = mmc_attempt_kink_jump(lattice)
-        else:
-            # Perform pivot
-            success = mmc_perform_pivot(lattice)
-
-        # In certain rare cases a kink jump/endpoint_rotation is not possible,
-        # so we need to perform a pivot instead.
-        if not success and operation_kind == 0:
-            mmc_perform_pivot(lattice)
-
-        # We have successfully changed our chain here.
-        new_energy = calculate_energy(epsilon, lattice)
-        if new_energy < energy:
+        # Choose and perform the operation
+        operation_kind = pick_move_kind(rng, move_kinds, move_cumulative)
+        operation_kind, success = mmc_attempt_move(operation_kind, lattice, statistics=statistics, rng=rng,
+                                                   trajectory=trajectory)
+
+        # The lattice keeps track of the contacts of the moved monomers, so this is O(1).
+        new_energy = calculate_energy_incremental(epsilon, lattice)
+        accepted = True
+        if not success:
+            # A move that was not possible leaves the chain as it is, the step counts as rejected.
+            accepted = False
+        elif new_energy < energy:
             energy = new_energy
-            # Save the lattice as lowest using a deepcopy if this is new lowest energy lattice.
-            if store_lowest_lattice and new_energy < lowest_lattice_energy:
-                lowest_lattice = copy.deepcopy(lattice)
-                lowest_lattice_energy = new_energy
-
         else:
             # boltzmann weight
             w: float = math.exp(- (float(new_energy) - float(energy)) / (float(boltzmann) * temperature))
             # Reject if w is smaller or equal to random value in 0-1
-            if w > random():
+            if w > rng.random():
                 energy = new_energy
             else:
                 lattice.undo_last_change()
+                accepted = False
+
+        # Snapshot the positions if this is one of the lowest energy conformations.
+        if accepted and store_lowest_lattice and lowest.is_candidate(energy):
+            lowest.offer(energy, lattice)
+
+        if accepted:
+            statistics.count_accepted(operation_kind)
+            if visited is not None:
+                visited.visit(temperature, lattice.compute_conformation_hash())
+
+        if trajectory is not None:
+            trajectory.write_step(accepted)
 
         # Uncomment this line to print progress.
         # print('Iteration: {}/{} T: {}'.format(iteration + 1, max_iterations, temperature))
 
         # Sample the energy and gyration
         if (iteration + 1) % sampling_frequency == 0:
-            energy_samples.append(energy)
-            gyration_samples.append(lattice.compute_gyration_radius())
+            gyration_radius = lattice.compute_gyration_radius()
+            sink.append(energy, gyration_radius)
+
+    # The next run usually starts from the resulting conformation, like the next temperature step of an annealing.
+    if cache is not None:
+        cache.put(lattice.compute_conformation_hash(), energy, lattice.compute_gyration_radius())
 
     # If enabled draw the resulting conformation plot
     if draw_resulting_conformation_plot:
-        drawing.draw_protein_conformation(lattice, temperature, lattice.hydrophobicity)
-
-    # Return values
-    return (lowest_lattice, lowest_lattice_energy), lattice, MMCSamples(energy_samples, gyration_samples)
+        draw_conformation(lattice, temperature, renderer, 'resulting_conformation')
+
+    # Return values, the samples are read back from the sink.
+    sink.flush()
+    if trajectory is not None:
+        trajectory.flush()
+    if store_lowest_lattice:
+        lowest_lattice, lowest_lattice_energy = lowest.get_lattice(0, type(lattice)), lowest.lowest_energy
+    return (lowest_lattice, lowest_lattice_energy), lattice, MMCSamples(sink.get_energy(),
+                                                                        sink.get_gyration_radius(),
+                                                                        statistics)
@@ -0,0 +1,253 @@
+from generation import *
+import os
+import numpy as np
+
+# Compact encoding of chains and their conformations.
+# A chain is stored as two strings:
+# - the H/P sequence, see get_chain_composition_string()
+# - the relative directions, one character per bond (N - 1): F(orward), L(eft) or R(ight)
+#   compared to the previous bond. The first bond is compared to itself, so it is always F.
+# The directions do not depend on where the chain is or how it is rotated, so equal conformations
+# always get equal strings. Decoding puts the first monomer at (0, 0) with the first bond pointing right.
+#
+# Bulk conformation files hold many chains of the same length as fixed size records (little endian):
+# - Header: magic b'HPCONF01', chain length (uint32)
+# - Records of conformation_record_dtype(length): kinds packed 8 per byte (1 is H),
+#   directions packed 4 per byte (F = 0, L = 1, R = 2) and the energy (float64).
+
+CONFORMATION_MAGIC = b'HPCONF01'
+
+# Direction characters, by their code
+DIRECTION_CHARACTERS = 'FLR'
+
+# Turn code (0 forward, 1 left, 3 right) of a change in heading, headings are indices into NEIGHBOUR_OFFSETS,
+# which go counter clock wise. 2 would be a step back onto the chain itself.
+TURN_CODES = np.array([0, 1, 255, 2], dtype=np.uint8)
+# Change in heading of every direction code
+CODE_TURNS = np.array([0, 1, 3], dtype=np.int64)
+
+
+# Returns the character -> direction code table, upper and lower case. Other characters map to 255.
+def build_direction_code_lookup() -> np.ndarray:
+    lookup = np.full(256, 255, dtype=np.uint8)
+    for code, character in enumerate(DIRECTION_CHARACTERS):
+        lookup[ord(character)] = code
+        lookup[ord(character.lower())] = code
+    return lookup
+
+
+# Character -> direction code, for parsing a whole string at once
+DIRECTION_CODE_LOOKUP = build_direction_code_lookup()
+
+# Offsets of NEIGHBOUR_OFFSETS as an array, indexed by heading
+HEADING_OFFSETS = np.array(NEIGHBOUR_OFFSETS, dtype=np.int64)
+
+
+# Returns the direction codes of the bonds between the (N, 2) positions, as an uint8 array of length N - 1
+def direction_codes_from_positions(positions: np.ndarray) -> np.ndarray:
+    bonds = np.diff(positions, axis=0)
+    # (1, 0) -> 0, (0, 1) -> 1, (-1, 0) -> 2, (0, -1) -> 3
+    headings = np.where(bonds[:, 0] != 0, 1 - bonds[:, 0], 2 - bonds[:, 1])
+    turns = np.diff(headings, prepend=headings[:1]) % 4
+    codes = TURN_CODES[turns]
+    assert not np.any(codes == 255), 'Chain folds back onto itself'
+    return codes
+
+
+# Returns the (N, 2) positions of a chain with the given direction codes, see the encoding above
+def positions_from_direction_codes(codes: np.ndarray) -> np.ndarray:
+    headings = np.cumsum(CODE_TURNS[np.asarray(codes, dtype=np.int64)]) % 4
+    positions = np.zeros((len(codes) + 1, 2), dtype=np.int64)
+    np.cumsum(HEADING_OFFSETS[headings], axis=0, out=positions[1:])
+    return positions
+
+
+# Converts a string of direction characters into direction codes
+def parse_directions(directions: str) -> np.ndarray:
+    codes = DIRECTION_CODE_LOOKUP[np.frombuffer(directions.encode('ascii'), dtype=np.uint8)]
+    assert not np.any(codes == 255), 'Invalid direction string: {}'.format(directions)
+    return codes
+
+
+# Converts direction codes into a string of direction characters
+def format_directions(codes: np.ndarray) -> str:
+    return np.frombuffer(b'FLR', dtype=np.uint8)[codes].tobytes().decode('ascii')
+
+
+# Returns the relative directions of the conformation of the lattice
+def encode_directions(lattice: ProteinLattice) -> str:
+    return format_directions(direction_codes_from_positions(lattice.get_positions(0, len(lattice))))
+
+
+# Returns the (sequence, directions) encoding of the lattice
+def encode_lattice(lattice: ProteinLattice) -> Tuple[str, str]:
+    return get_chain_composition_string(lattice.chain), encode_directions(lattice)
+
+
+# Builds a lattice of the given type from its (sequence, directions) encoding.
+# hydrophobicity defaults to the fraction of H monomers.
+def lattice_from_encoding(sequence: str, directions: str, hydrophobicity: Optional[float] = None,
+                          lattice_type: Type = ProteinLattice) -> ProteinLattice:
+    assert len(directions) == len(sequence) - 1, 'Need one direction per bond: {} {}'.format(sequence, directions)
+    kinds = parse_chain_composition_string(sequence)
+    positions = positions_from_direction_codes(parse_directions(directions))
+    return lattice_from_kinds_and_positions(kinds, positions, hydrophobicity, lattice_type)
+
+
+# Builds a lattice of the given type from monomer kinds and (N, 2) positions.
+# hydrophobicity defaults to the fraction of H monomers.
+def lattice_from_kinds_and_positions(kinds: Sequence[MonomerKind], positions: np.ndarray,
+                                     hydrophobicity: Optional[float] = None,
+                                     lattice_type: Type = ProteinLattice) -> ProteinLattice:
+    cells = [(x, y) for x, y in positions.tolist()]
+    assert len(set(cells)) == len(cells), 'Conformation crosses itself'
+    if hydrophobicity is None:
+        hydrophobicity = sum(1 for kind in kinds if kind == MonomerKind.H) / len(kinds)
+    return lattice_type([Monomer(kind, x, y) for kind, (x, y) in zip(kinds, cells)], hydrophobicity)
+
+
+# Returns the record type of bulk conformation files for chains of the given length
+def conformation_record_dtype(length: int) -> np.dtype:
+    return np.dtype([('kinds', 'u1', ((length + 7) // 8,)),
+                     ('directions', 'u1', ((length - 1 + 3) // 4,)),
+                     ('energy', '<f8')])
+
+
+# Returns the size in bytes of the header of a bulk conformation file
+def conformation_header_size() -> int:
+    return len(CONFORMATION_MAGIC) + 4
+
+
+# Packs (M, N - 1) direction codes, 4 per byte, first code in the lowest bits
+def pack_direction_codes(codes: np.ndarray) -> np.ndarray:
+    count, bonds = codes.shape
+    padded = np.zeros((count, (bonds + 3) // 4 * 4), dtype=np.uint8)
+    padded[:, :bonds] = codes
+    padded = padded.reshape(count, -1, 4)
+    return padded[:, :, 0] | (padded[:, :, 1] << 2) | (padded[:, :, 2] << 4) | (padded[:, :, 3] << 6)
+
+
+# Unpacks direction codes packed by pack_direction_codes() into an (M, bonds) array
+def unpack_direction_codes(packed: np.ndarray, bonds: int) -> np.ndarray:
+    shifts = np.array([0, 2, 4, 6], dtype=np.uint8)
+    codes = (packed[:, :, np.newaxis] >> shifts) & 3
+    return codes.reshape(len(packed), -1)[:, :bonds]
+
+
+# Writes conformations of chains of the same length to a bulk conformation file.
+# Records are buffered and written every buffer_size conformations.
+# Use write_arrays() to write large amounts at once without building lattices.
+class ConformationWriter:
+    def __init__(self, path: str, length: int, buffer_size: int = 65536):
+        assert length >= 2, 'Conformation files need chains of at least 2 monomers'
+        self.path: str = path
+        self.length: int = length
+        self.buffer_size: int = buffer_size
+        self.count: int = 0
+        self.__dtype: np.dtype = conformation_record_dtype(length)
+        self.__kinds: List[np.ndarray] = []
+        self.__codes: List[np.ndarray] = []
+        self.__energies: List[float] = []
+        self.__file = open(path, 'wb')
+        self.__file.write(CONFORMATION_MAGIC)
+        self.__file.write(np.array([length], dtype='<u4').tobytes())
+
+    # Writes the conformation of the lattice with its energy
+    def write(self, lattice: ProteinLattice, energy: float):
+        assert len(lattice) == self.length, 'All conformations of a file need the same length'
+        self.__kinds.append(np.array([lattice.get_kind(idx) == MonomerKind.H for idx in range(0, self.length)]))
+        self.__codes.append(direction_codes_from_positions(lattice.get_positions(0, self.length)))
+        self.__energies.append(energy)
+        if len(self.__energies) >= self.buffer_size:
+            self.flush()
+
+    # Writes a conformation given by its (sequence, directions) encoding
+    def write_encoded(self, sequence: str, directions: str, energy: float):
+        assert len(sequence) == self.length and len(directions) == self.length - 1, \
+            'All conformations of a file need the same length'
+        self.__kinds.append(np.array([kind == MonomerKind.H for kind in parse_chain_composition_string(sequence)]))
+        self.__codes.append(parse_directions(directions))
+        self.__energies.append(energy)
+        if len(self.__energies) >= self.buffer_size:
+            self.flush()
+
+    # Writes M conformations at once: (M, N) booleans that are True for H, (M, N - 1) direction codes and M energies
+    def write_arrays(self, is_h: np.ndarray, codes: np.ndarray, energies: np.ndarray):
+        self.flush()
+        records = np.zeros(len(energies), dtype=self.__dtype)
+        records['kinds'] = np.packbits(is_h.astype(np.bool_), axis=1, bitorder='little')
+        records['directions'] = pack_direction_codes(codes.astype(np.uint8))
+        records['energy'] = energies
+        self.__file.write(records.tobytes())
+        self.count += len(records)
+
+    def flush(self):
+        if self.__file is None:
+            return
+        if len(self.__energies) != 0:
+            kinds, codes, energies = np.stack(self.__kinds), np.stack(self.__codes), np.array(self.__energies)
+            self.__kinds, self.__codes, self.__energies = [], [], []
+            self.write_arrays(kinds, codes, energies)
+        self.__file.flush()
+
+    def close(self):
+        self.flush()
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+# Reads a bulk conformation file written by ConformationWriter.
+# The records are memory-mapped, so files with millions of conformations open instantly.
+class ConformationReader:
+    def __init__(self, path: str):
+        self.path: str = path
+        with open(path, 'rb') as file:
+            magic = file.read(len(CONFORMATION_MAGIC))
+            assert magic == CONFORMATION_MAGIC, 'Not a conformation file: {}'.format(path)
+            self.length: int = int(np.frombuffer(file.read(4), dtype='<u4')[0])
+
+        dtype = conformation_record_dtype(self.length)
+        count = (os.path.getsize(path) - conformation_header_size()) // dtype.itemsize
+        if count > 0:
+            self.records: np.ndarray = np.memmap(path, dtype=dtype, mode='r', offset=conformation_header_size(),
+                                                 shape=(count,))
+        else:
+            self.records: np.ndarray = np.zeros(0, dtype=dtype)
+
+    # Amount of conformations
+    def __len__(self) -> int:
+        return len(self.records)
+
+    # Energies of all conformations
+    @property
+    def energies(self) -> np.ndarray:
+        return self.records['energy']
+
+    # Returns (M, N) booleans that are True for H, for the conformations start up to end (exclusive)
+    def get_is_h(self, start: int, end: int) -> np.ndarray:
+        return np.unpackbits(self.records['kinds'][start:end], axis=1, count=self.length,
+                             bitorder='little').astype(np.bool_)
+
+    # Returns the (M, N - 1) direction codes of the conformations start up to end (exclusive)
+    def get_direction_codes(self, start: int, end: int) -> np.ndarray:
+        return unpack_direction_codes(self.records['directions'][start:end], self.length - 1)
+
+    # Returns the (sequence, directions) encoding of conformation idx
+    def get_encoding(self, idx: int) -> Tuple[str, str]:
+        sequence = ''.join('H' if is_h else 'P' for is_h in self.get_is_h(idx, idx + 1)[0].tolist())
+        return sequence, format_directions(self.get_direction_codes(idx, idx + 1)[0])
+
+    # Returns conformation idx as a lattice of the given type
+    def get_lattice(self, idx: int, lattice_type: Type = ProteinLattice,
+                    hydrophobicity: Optional[float] = None) -> ProteinLattice:
+        kinds = [MonomerKind.H if is_h else MonomerKind.P for is_h in self.get_is_h(idx, idx + 1)[0].tolist()]
+        positions = positions_from_direction_codes(self.get_direction_codes(idx, idx + 1)[0])
+        return lattice_from_kinds_and_positions(kinds, positions, hydrophobicity, lattice_type)
+
+    # Returns the indices of the first occurrence of every distinct chain and conformation, in file order.
+    # Records are compared byte for byte, which works because the encoding does not depend on position or rotation.
+    def unique_indices(self) -> np.ndarray:
+        keys = np.concatenate([self.records['kinds'], self.records['directions']], axis=1)
+        _, indices = np.unique(keys.view(np.dtype((np.void, keys.shape[1]))), return_index=True)
+        return np.sort(indices)
@@ -1,4 +1,5 @@
 from computation import *
+import os
 
 blue = np.array([65 / 256, 105 / 256, 225 / 256, 1])
 orange = np.array([255 / 256, 165 / 256, 0 / 256, 1])
@@ -20,6 +21,22 @@ def adjacent_values(vals, q1, q3):
     return lower_adjacent_value, upper_adjacent_value
 
 
+# Switches matplotlib to the non-interactive Agg backend, for runs without a display.
+# Figures can then only be written to files, by passing an output path to the drawing functions.
+def use_headless_rendering():
+    plt.switch_backend('Agg')
+
+
+# Finishes the figure: writes it to output_path and closes it if given, shows it otherwise.
+# Closing the figure keeps long batch runs from piling up open figures.
+def show_figure(fig, output_path: Optional[str] = None):
+    if output_path is None:
+        plt.show()
+        return
+    fig.savefig(output_path)
+    plt.close(fig)
+
+
 # Internal function used to set axis style of subplots.
 def set_axis_style(ax, labels):
     ax.get_xaxis().set_tick_params(direction='out')
@@ -33,7 +50,9 @@ def set_axis_style(ax, labels):
 def draw_violin_plot_over_temp(title: str,
                                ylabel: str,
                                values: List[List[float]],
-                               temperatures: List[float]):
+                               temperatures: List[float],
+                               # Write the figure to this file instead of showing it
+                               output_path: Optional[str] = None):
     fig, axis = plt.subplots(nrows=1, ncols=1)
     axis.set_title(title)
     parts = axis.violinplot(
@@ -58,7 +77,7 @@ def draw_violin_plot_over_temp(title: str,
     set_axis_style(axis, ['{:.1f}'.format(e) for e in temperatures])
     axis.set_ylabel(ylabel)
     axis.set_xlabel('Temperature (ε/kB)')
-    plt.show()
+    show_figure(fig, output_path)
 
 
 # Plots histograms for energy/gyration vs. temperature.
@@ -67,7 +86,8 @@ def draw_histograms(temperatures: List[float],
                     values: List[List[float]],
                     xlabel: str,
                     ylabel: str,
-                    title: str):
+                    title: str,
+                    output_path: Optional[str] = None):  # Write the figure to this file instead of showing it
     cols = int(math.sqrt(next_perfect_square(len(temperatures))))
     rows = int(len(temperatures) / cols)
     print(len(temperatures))
@@ -95,11 +115,15 @@ def draw_histograms(temperatures: List[float],
         axi.label_outer()
 
     fig.suptitle(title, y=0.99, size='large')
-    fig.show()
+    if output_path is None:
+        fig.show()
+    else:
+        show_figure(fig, output_path)
 
 
 # Plots the protein.
-def draw_protein_conformation(lattice: ProteinLattice, temperature: float, hydrophobicity: float):
+def draw_protein_conformation(lattice: ProteinLattice, temperature: float, hydrophobicity: float,
+                              output_path: Optional[str] = None):  # Write the figure to this file instead of showing it
     plt.title('HP Protein, N = {}, E = {:.2f}, T = {:.2f}, H = {:.2f}'.format(
         len(lattice.chain),
         calculate_energy(1.0, lattice),
@@ -125,24 +149,35 @@ def draw_protein_conformation(lattice: ProteinLattice, temperature: float, hydro
 
     plt.legend()
     plt.gca().set_aspect('equal')
-    plt.show()
+    show_figure(plt.gcf(), output_path)
 
 
 # Draws the plot for energy vs. iterations
-def draw_energy_iterations_plot(samples: List[float]):
+def draw_energy_iterations_plot(samples: List[float],
+                                # Write the figure to this file instead of showing it
+                                output_path: Optional[str] = None):
     print(len(samples))
     plt.title('Energy vs. iterations')
     plt.plot(samples)
     plt.ylabel('Energy')
     plt.xlabel('Iterations (x100)')
-    plt.show()
+    show_figure(plt.gcf(), output_path)
 
 
 # Draws plots for simulated annealing
+# With an output directory, every plot is written to its own file in it instead of being shown.
 def draw_simulated_annealing_plots(lattice: ProteinLattice,
                                    results: List[Tuple[float, List[float], List[float]]],
                                    draw_energy_histograms_per_temp: bool = False,
-                                   draw_gyration_histograms_per_temp: bool = False):
+                                   draw_gyration_histograms_per_temp: bool = False,
+                                   output_directory: Optional[str] = None):
+    # Returns the file of the plot with the name, None to show it
+    def output_path(name: str) -> Optional[str]:
+        if output_directory is None:
+            return None
+        os.makedirs(output_directory, exist_ok=True)
+        return os.path.join(output_directory, name + '.png')
+
     # Sort results by temperature. min temp -> max temp
     results.sort(key=lambda x: x[0])
     temperatures = [elem[0] for elem in results]
@@ -162,40 +197,44 @@ def draw_simulated_annealing_plots(lattice: ProteinLattice,
     plt.title('Average Energy vs. Temperature')
     plt.xlabel('Temperature (ε/kB)')
     plt.ylabel('Average energy')
-    plt.show()
+    show_figure(plt.gcf(), output_path('energy_vs_temperature'))
 
     # Draw avg gyration vs temp
     plt.plot(temperatures, avg_gyration_per_temp)
     plt.title('Average gyration vs. Temperature')
     plt.xlabel('Temperature (ε/kB)')
     plt.ylabel('Average gyration')
-    plt.show()
+    show_figure(plt.gcf(), output_path('gyration_vs_temperature'))
 
     # Draw distributions for energy vs temp
     if draw_energy_histograms_per_temp:
         draw_histograms(temperatures, [result_set[1] for result_set in results],
                         title='Energy distributions for different temperatures',
                         xlabel='Energy levels',
-                        ylabel='Counts (relative)')
+                        ylabel='Counts (relative)',
+                        output_path=output_path('energy_histograms'))
 
     # Draw distributions for gyration vs temp
     if draw_gyration_histograms_per_temp:
         draw_histograms(temperatures, [result_set[2] for result_set in results],
                         title='Gyration radius distributions for different temperatures',
                         xlabel='Gyration radii',
-                        ylabel='Counts (relative)')
+                        ylabel='Counts (relative)',
+                        output_path=output_path('gyration_histograms'))
 
     # Draw violinplot for energy distributions
     draw_violin_plot_over_temp('Energy distributions per temperature',
                                'Energy level',
                                [elem[1] for elem in results],
-                               temperatures)
+                               temperatures,
+                               output_path=output_path('energy_violins'))
 
     # Draw violinplot for gyration distributions
     draw_violin_plot_over_temp('Gyration distributions per temperature',
                                'Gyration radius',
                                [elem[2] for elem in results],
-                               temperatures)
+                               temperatures,
+                               output_path=output_path('gyration_violins'))
 
     # Compute heat capacity and draw plot vs temperature
     heat_capacity_per_temp: List[float] = [compute_heat_capacity(elem[1], elem[0])
@@ -204,4 +243,4 @@ def draw_simulated_annealing_plots(lattice: ProteinLattice,
     plt.xlabel('Temperature (ε/kB)')
     plt.ylabel('Heat capacity')
     plt.title('Heat capacity vs. Temperature')
-    plt.show()
+    show_figure(plt.gcf(), output_path('heat_capacity_vs_temperature'))
@@ -0,0 +1,194 @@
+from simulated_annealing import *
+import argparse
+import csv
+import hashlib
+import itertools
+import multiprocessing
+import time
+
+
+# A single run of the ensemble: one protein annealed with one temperature schedule and seed.
+# Either sequence (string of H and P) or chain_length is given.
+# With a chain_length, the sequence is generated randomly using hydrophobicity.
+class EnsembleTask:
+    def __init__(self,
+                 index: int,  # Position of the task in the ensemble
+                 sequence: Optional[str],
+                 chain_length: int,
+                 hydrophobicity: float,
+                 max_temp: float,
+                 min_temp: float,
+                 temperature_steps: int,
+                 mmc_iterations_per_step: int,
+                 task_seed: int,
+                 sampling_frequency: int = 100):
+        self.index: int = index
+        self.sequence: Optional[str] = sequence
+        self.chain_length: int = len(sequence) if sequence is not None else chain_length
+        self.hydrophobicity: float = hydrophobicity
+        self.max_temp: float = max_temp
+        self.min_temp: float = min_temp
+        self.temperature_steps: int = temperature_steps
+        self.mmc_iterations_per_step: int = mmc_iterations_per_step
+        self.seed: int = task_seed
+        self.sampling_frequency: int = sampling_frequency
+
+
+# Columns of the results table, in order.
+ENSEMBLE_RESULT_COLUMNS: List[str] = [
+    'index', 'sequence', 'chain_length', 'hydrophobicity',
+    'max_temp', 'min_temp', 'temperature_steps', 'mmc_iterations_per_step', 'seed',
+    'lowest_energy', 'final_energy', 'final_mean_energy', 'final_mean_gyration', 'runtime'
+]
+
+
+# Returns the seed of one task, derived from base_seed, its parameters and the number of the seed (replicate).
+# Seeds do not depend on the position of the task in the grid, so reordering the grid keeps the runs of every task,
+# and runs with different base seeds do not share any task seeds.
+def ensemble_task_seed(base_seed: int,
+                       protein: Union[str, int],
+                       hydrophobicity: float,
+                       schedule: Tuple[float, float, int, int],
+                       replicate: int) -> int:
+    key = repr((base_seed, protein, float(hydrophobicity), tuple(schedule), replicate)).encode('utf-8')
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], 'little')
+
+
+# Builds the grid of tasks from all combinations of the given parameters.
+# Every (protein, hydrophobicity, schedule) combination is run once per seed.
+# Hydrophobicities only apply to chain lengths, fixed sequences use their own fraction of H monomers.
+# Schedules are tuples of: (max_temp, min_temp, temperature_steps, mmc_iterations_per_step)
+# Seeds are derived from base_seed and the task parameters, see ensemble_task_seed().
+def build_ensemble_grid(sequences_or_lengths: List[Union[str, int]],
+                        hydrophobicities: List[float],
+                        schedules: List[Tuple[float, float, int, int]],
+                        seed_count: int,
+                        base_seed: int = 1234,
+                        sampling_frequency: int = 100) -> List[EnsembleTask]:
+    tasks = []
+    for protein in sequences_or_lengths:
+        if isinstance(protein, str):
+            protein_hydrophobicities = [float(protein.upper().count('H')) / len(protein)]
+        else:
+            protein_hydrophobicities = hydrophobicities
+
+        for hydrophobicity, schedule, replicate in itertools.product(protein_hydrophobicities,
+                                                             schedules,
+                                                             range(0, seed_count)):
+            max_temp, min_temp, temperature_steps, mmc_iterations_per_step = schedule
+            index = len(tasks)
+            tasks.append(EnsembleTask(index,
+                                      protein if isinstance(protein, str) else None,
+                                      protein if isinstance(protein, int) else 0,
+                                      hydrophobicity,
+                                      max_temp,
+                                      min_temp,
+                                      temperature_steps,
+                                      mmc_iterations_per_step,
+                                      ensemble_task_seed(base_seed, protein, hydrophobicity, schedule, replicate),
+                                      sampling_frequency))
+    return tasks
+
+
+# Runs a single task and returns its row of the results table.
+# Module level function so it can be sent to the worker processes of the pool.
+def run_ensemble_task(task: EnsembleTask) -> Dict[str, Union[str, int, float]]:
+    start = time.perf_counter()
+
+    # Everything random in this run follows from the task seed.
+    rng = RandomStream(task.seed)
+    if task.sequence is not None:
+        chain = generate_protein_with_sequence(task.sequence, rng)
+    else:
+        chain = generate_protein(task.chain_length, task.hydrophobicity, rng)
+    lattice = ProteinLattice(chain, task.hydrophobicity)
+
+    # Only the statistics of the samples are needed, so the samples themselves are not kept.
+    step_statistics: List[Tuple[float, OnlineStatistics, OnlineStatistics]] = []
+    # The lowest energy is tracked over every iteration, the step statistics only see the kept samples.
+    (_, lowest_energy, _), lattice, _ = perform_mmc_simulated_annealing(lattice,
+                                                                        task.temperature_steps,
+                                                                        task.mmc_iterations_per_step,
+                                                                        task.max_temp,
+                                                                        min_temp=task.min_temp,
+                                                                        sampling_frequency=task.sampling_frequency,
+                                                                        rng=rng,
+                                                                        draw_conformation_plots=False,
+                                                                        verbose=False,
+                                                                        keep_samples=False,
+                                                                        step_statistics=step_statistics)
+    _, final_energy_statistics, final_gyration_statistics = step_statistics[-1]
+
+    return {
+        'index': task.index,
+        'sequence': get_chain_composition_string(lattice.chain),
+        'chain_length': task.chain_length,
+        'hydrophobicity': task.hydrophobicity,
+        'max_temp': task.max_temp,
+        'min_temp': task.min_temp,
+        'temperature_steps': task.temperature_steps,
+        'mmc_iterations_per_step': task.mmc_iterations_per_step,
+        'seed': task.seed,
+        'lowest_energy': lowest_energy,
+        'final_energy': calculate_energy_incremental(1.0, lattice),
+        'final_mean_energy': final_energy_statistics.mean,
+        'final_mean_gyration': final_gyration_statistics.mean,
+        'runtime': time.perf_counter() - start
+    }
+
+
+# Runs all tasks on a process pool and streams the result rows into a CSV file as they finish.
+# Rows arrive in order of completion, the index column gives the position in the grid.
+# Returns all result rows, sorted by index.
+def run_ensemble(tasks: List[EnsembleTask],
+                 output_path: str,
+                 processes: Optional[int] = None) -> List[Dict[str, Union[str, int, float]]]:
+    rows = []
+    with open(output_path, 'w', newline='') as output_file, multiprocessing.Pool(processes) as pool:
+        writer = csv.DictWriter(output_file, fieldnames=ENSEMBLE_RESULT_COLUMNS)
+        writer.writeheader()
+        for row in pool.imap_unordered(run_ensemble_task, tasks):
+            writer.writerow(row)
+            output_file.flush()
+            rows.append(row)
+            print('Finished task {}/{}'.format(len(rows), len(tasks)))
+
+    rows.sort(key=lambda row: row['index'])
+    return rows
+
+
+# Command line interface for the ensemble runner.
+# Example: python ensemble.py --lengths 25 50 --hydrophobicities 0.2 0.5 0.8 --seeds 10 --output results.csv
+def main():
+    parser = argparse.ArgumentParser(description='Run an ensemble of simulated annealing runs over a process pool.')
+    parser.add_argument('--lengths', type=int, nargs='*', default=[],
+                        help='chain lengths of randomly generated sequences')
+    parser.add_argument('--sequences', type=str, nargs='*', default=[],
+                        help='fixed sequences of H and P monomers')
+    parser.add_argument('--hydrophobicities', type=float, nargs='+', default=[0.5],
+                        help='hydrophobicities, used to generate sequences for --lengths')
+    parser.add_argument('--max-temps', type=float, nargs='+', default=[2.0])
+    parser.add_argument('--min-temps', type=float, nargs='+', default=[0.0])
+    parser.add_argument('--temperature-steps', type=int, nargs='+', default=[25])
+    parser.add_argument('--iterations', type=int, nargs='+', default=[15000],
+                        help='mmc iterations per temperature step')
+    parser.add_argument('--sampling-frequency', type=int, default=100)
+    parser.add_argument('--seeds', type=int, default=1, help='amount of seeds per combination')
+    parser.add_argument('--base-seed', type=int, default=1234)
+    parser.add_argument('--processes', type=int, default=None, help='worker processes, defaults to one per cpu')
+    parser.add_argument('--output', type=str, default='ensemble_results.csv')
+    args = parser.parse_args()
+
+    proteins: List[Union[str, int]] = args.sequences + args.lengths
+    if len(proteins) == 0:
+        parser.error('at least one of --lengths or --sequences is required')
+
+    schedules = list(itertools.product(args.max_temps, args.min_temps, args.temperature_steps, args.iterations))
+    tasks = build_ensemble_grid(proteins, args.hydrophobicities, schedules, args.seeds,
+                                base_seed=args.base_seed,
+                                sampling_frequency=args.sampling_frequency)
+    run_ensemble(tasks, args.output, processes=args.processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+from wang_landau import *
+from accelerated import njit
+import multiprocessing
+
+# Exact enumeration of all conformations of short chains (up to about 20-25 monomers).
+# Gives the exact energy histogram, ground state and partition function, as a reference for the MC results.
+#
+# The 8 symmetries of the square lattice are factored out: the first step always goes to the right
+# and the first step off the x axis always goes up. Every enumerated conformation then stands for 8
+# conformations (its rotations and reflections), except the straight chain which only has 4.
+# The walks are split up by their first prefix_length monomers, every prefix is enumerated
+# depth first by a Numba compiled kernel in a worker process of a multiprocessing pool.
+
+# Steps of the depth first search, in the order they are tried: right, up, left, down
+ENUMERATION_STEPS_X = np.array([1, 0, -1, 0], dtype=np.int64)
+ENUMERATION_STEPS_Y = np.array([0, 1, 0, -1], dtype=np.int64)
+
+
+# Places monomer k at (x, y) and updates the contact count, the gyration sums and the bounding box up to k.
+# Grid cells hold 0 if empty, 1 for a P and 2 for an H monomer, shifted by n so the chain always fits.
+@njit(cache=True)
+def _kernel_enumeration_place(k, x, y, is_h, grid, xs, ys, contacts, straight,
+                              sum_x, sum_y, sum_squares, min_x, max_x, min_y, max_y):
+    n = len(is_h)
+    xs[k] = x
+    ys[k] = y
+    grid[x + n, y + n] = 2 if is_h[k] else 1
+    if k == 0:
+        contacts[0] = 0
+        straight[0] = y == 0
+        sum_x[0] = x
+        sum_y[0] = y
+        sum_squares[0] = x * x + y * y
+        min_x[0] = x
+        max_x[0] = x
+        min_y[0] = y
+        max_y[0] = y
+        return
+
+    # Contacts with all H neighbours, including the previous monomer, like calculate_energy()
+    count = contacts[k - 1]
+    if is_h[k]:
+        for d in range(0, 4):
+            if grid[x + ENUMERATION_STEPS_X[d] + n, y + ENUMERATION_STEPS_Y[d] + n] == 2:
+                count += 1
+    contacts[k] = count
+    straight[k] = straight[k - 1] and y == 0
+    sum_x[k] = sum_x[k - 1] + x
+    sum_y[k] = sum_y[k - 1] + y
+    sum_squares[k] = sum_squares[k - 1] + x * x + y * y
+    min_x[k] = min(min_x[k - 1], x)
+    max_x[k] = max(max_x[k - 1], x)
+    min_y[k] = min(min_y[k - 1], y)
+    max_y[k] = max(max_y[k - 1], y)
+
+
+# Enumerates all conformations that start with the prefix positions, depth first.
+# Adds the amount of conformations per contact count to histogram and their radii of gyration to gyration_sums,
+# both weighted by the amount of symmetric conformations each one stands for.
+# Returns the highest contact count found, best_xs and best_ys receive the first conformation with it.
+@njit(cache=True)
+def _kernel_enumerate(is_h, prefix_xs, prefix_ys, histogram, gyration_sums, best_xs, best_ys):
+    n = len(is_h)
+    grid = np.zeros((2 * n + 1, 2 * n + 1), dtype=np.int8)
+    xs = np.zeros(n, dtype=np.int64)
+    ys = np.zeros(n, dtype=np.int64)
+    contacts = np.zeros(n, dtype=np.int64)
+    straight = np.zeros(n, dtype=np.bool_)
+    sum_x = np.zeros(n, dtype=np.int64)
+    sum_y = np.zeros(n, dtype=np.int64)
+    sum_squares = np.zeros(n, dtype=np.int64)
+    min_x = np.zeros(n, dtype=np.int64)
+    max_x = np.zeros(n, dtype=np.int64)
+    min_y = np.zeros(n, dtype=np.int64)
+    max_y = np.zeros(n, dtype=np.int64)
+    # Next step to try from every monomer
+    next_step = np.zeros(n, dtype=np.int64)
+
+    prefix_length = len(prefix_xs)
+    for k in range(0, prefix_length):
+        _kernel_enumeration_place(k, prefix_xs[k], prefix_ys[k], is_h, grid, xs, ys, contacts, straight,
+                                  sum_x, sum_y, sum_squares, min_x, max_x, min_y, max_y)
+
+    best = -1
+    k = prefix_length - 1
+    while True:
+        if k == n - 1:
+            # Complete conformation
+            c = contacts[k]
+            weight = 4 if straight[k] else 8
+            histogram[c] += weight
+            # Radius of gyration around the center of the bounding box, see GyrationTracker.gyration_radius()
+            sx = min_x[k] + max_x[k]
+            sy = min_y[k] + max_y[k]
+            four_sum_of_squares = 4 * sum_squares[k] - 4 * (sx * sum_x[k] + sy * sum_y[k]) + n * (sx * sx + sy * sy)
+            gyration_sums[c] += weight * np.sqrt(four_sum_of_squares / 4.0 / n / n)
+            if c > best:
+                best = c
+                best_xs[:] = xs
+                best_ys[:] = ys
+        else:
+            d = next_step[k]
+            if d < 4:
+                next_step[k] = d + 1
+                # While the chain is straight, only the step up may leave the x axis.
+                if straight[k] and d == 3:
+                    continue
+                x = xs[k] + ENUMERATION_STEPS_X[d]
+                y = ys[k] + ENUMERATION_STEPS_Y[d]
+                if grid[x + n, y + n] != 0:
+                    continue
+                k += 1
+                _kernel_enumeration_place(k, x, y, is_h, grid, xs, ys, contacts, straight,
+                                          sum_x, sum_y, sum_squares, min_x, max_x, min_y, max_y)
+                next_step[k] = 0
+                continue
+
+        # All steps from k are done, take the monomer back
+        if k == prefix_length - 1:
+            break
+        grid[xs[k] + n, ys[k] + n] = 0
+        k -= 1
+    return best
+
+
+# Returns the positions of the first prefix_length monomers of every conformation that is enumerated.
+# Only prefixes going right first, and up at their first step off the x axis, are included.
+def enumeration_prefixes(prefix_length: int) -> List[List[Tuple[int, int]]]:
+    prefixes: List[List[Tuple[int, int]]] = []
+    stack: List[List[Tuple[int, int]]] = [[(0, 0), (1, 0)]]
+    while len(stack) != 0:
+        positions = stack.pop()
+        if len(positions) == prefix_length:
+            prefixes.append(positions)
+            continue
+        x, y = positions[-1]
+        straight = all(py == 0 for _, py in positions)
+        for dx, dy in zip(ENUMERATION_STEPS_X.tolist(), ENUMERATION_STEPS_Y.tolist()):
+            if straight and dy < 0:
+                continue
+            if (x + dx, y + dy) not in positions:
+                stack.append(positions + [(x + dx, y + dy)])
+    return prefixes
+
+
+# Enumerates all conformations that start with the prefix.
+# Module level function so it can be sent to the worker processes of the pool.
+# Arguments tuple: (is_h, prefix positions)
+# Returns a tuple: (histogram by contact count, gyration sums by contact count, best contact count, best positions)
+def enumerate_prefix(arguments: Tuple[np.ndarray, List[Tuple[int, int]]]) \
+        -> Tuple[np.ndarray, np.ndarray, int, np.ndarray]:
+    is_h, prefix = arguments
+    length = len(is_h)
+    histogram = np.zeros(2 * length + 1, dtype=np.int64)
+    gyration_sums = np.zeros(2 * length + 1, dtype=np.float64)
+    best_xs = np.zeros(length, dtype=np.int64)
+    best_ys = np.zeros(length, dtype=np.int64)
+    prefix_positions = np.array(prefix, dtype=np.int64).reshape(-1, 2)
+    best = _kernel_enumerate(is_h, prefix_positions[:, 0].copy(), prefix_positions[:, 1].copy(),
+                             histogram, gyration_sums, best_xs, best_ys)
+    return histogram, gyration_sums, int(best), np.stack([best_xs, best_ys], axis=1)
+
+
+# Exact energy histogram of a chain, see enumerate_conformations().
+# Conformations are counted up to translation, so the counts add up to the number of self-avoiding walks.
+class EnumerationResult:
+    def __init__(self, energies: np.ndarray, counts: np.ndarray, gyration_radii: np.ndarray,
+                 ground_state: ProteinLattice, ground_state_energy: float):
+        # Energy levels that occur, lowest first
+        self.energies: np.ndarray = energies
+        # Amount of conformations at every energy level
+        self.counts: np.ndarray = counts
+        # Mean radius of gyration of the conformations at every energy level
+        self.gyration_radii: np.ndarray = gyration_radii
+        # One of the conformations with the lowest energy
+        self.ground_state: ProteinLattice = ground_state
+        self.ground_state_energy: float = ground_state_energy
+
+    # Returns the exact density of states, for averages at any temperature
+    def density_of_states(self, boltzmann: float = 1.0) -> DensityOfStates:
+        return DensityOfStates(self.energies, np.log(self.counts.astype(np.float64)), self.gyration_radii, boltzmann)
+
+    # Returns the natural logarithm of the partition function sum(exp(-E / kT)) over all conformations
+    def ln_partition_function(self, temperature: float, boltzmann: float = 1.0) -> float:
+        ln_weights = np.log(self.counts.astype(np.float64)) - self.energies / (boltzmann * temperature)
+        largest = ln_weights.max()
+        return float(largest + np.log(np.exp(ln_weights - largest).sum()))
+
+
+# Enumerates all conformations of the sequence exactly, in parallel over the prefixes of the walks.
+# The time grows by a factor of about 2.6 per monomer, so this is only feasible for short chains.
+# Returns an EnumerationResult with the energy histogram and a ground state lattice.
+def enumerate_conformations(
+        kinds: Sequence[MonomerKind],  # Kind of every monomer of the chain
+        epsilon: float = 1.0,
+        hydrophobicity: Optional[float] = None,  # Of the ground state lattice, the fraction of H if not given
+        prefix_length: int = 8,  # Amount of monomers of the prefixes the work is split up by
+        processes: Optional[int] = None,  # Amount of worker processes, defaults to one per cpu.
+        verbose: bool = True  # Print progress
+) -> EnumerationResult:
+    length = len(kinds)
+    assert length >= 2, 'Enumeration needs a chain of at least 2 monomers'
+    if hydrophobicity is None:
+        hydrophobicity = sum(1 for kind in kinds if kind == MonomerKind.H) / length
+
+    is_h = np.array([kind == MonomerKind.H for kind in kinds], dtype=np.bool_)
+    prefixes = enumeration_prefixes(max(2, min(prefix_length, length)))
+    arguments = [(is_h, prefix) for prefix in prefixes]
+
+    histogram = np.zeros(2 * length + 1, dtype=np.int64)
+    gyration_sums = np.zeros(2 * length + 1, dtype=np.float64)
+    best = -1
+    best_positions = None
+    with multiprocessing.Pool(processes) as pool:
+        # Ordered, so the same ground state is returned on every run
+        for done, (prefix_histogram, prefix_gyration_sums, prefix_best, prefix_best_positions) in enumerate(
+                pool.imap(enumerate_prefix, arguments, chunksize=max(1, len(arguments) // 256)), 1):
+            histogram += prefix_histogram
+            gyration_sums += prefix_gyration_sums
+            if prefix_best > best:
+                best = prefix_best
+                best_positions = prefix_best_positions
+            if verbose and (done % 100 == 0 or done == len(arguments)):
+                print('Enumerated prefix {}/{}'.format(done, len(arguments)))
+
+    # Lowest energy (most contacts) first
+    levels = np.nonzero(histogram)[0][::-1]
+    ground_state = ProteinLattice([Monomer(kind, x, y) for kind, (x, y) in zip(kinds, best_positions.tolist())],
+                                  hydrophobicity)
+    return EnumerationResult(-1.0 * epsilon * levels.astype(np.float64),
+                             histogram[levels],
+                             gyration_sums[levels] / histogram[levels],
+                             ground_state,
+                             -1.0 * epsilon * float(best))
@@ -1,5 +1,6 @@
 from classes import *
 from random import *
+from random_stream import RandomStream
 
 
 # Directions as per random number generator:
@@ -30,55 +31,42 @@ def get_kind_count(chain: List[Monomer], kind: MonomerKind) -> int:
 
 # Returns a string containing H and P for each monomer
 def get_chain_composition_string(chain: List[Monomer]) -> str:
-    return_value = ''
-    for m in chain:
-        if m.kind == MonomerKind.H:
-            return_value += 'H'
-        else:
-            return_value += 'P'
-    return return_value
-
-
-# Validates if a given position is occupied in the chain.
-def has_monomer(x: int, y: int, chain: List[Monomer]) -> bool:
-    for i in range(0, len(chain)):
-        if chain[i].x == x and chain[i].y == y:
-            return True
-    return False
+    return ''.join('H' if m.kind == MonomerKind.H else 'P' for m in chain)
 
 
 # Validates whether the given position is valid. (i.e. is not occupied)
 # Also checks for dead ends in the lattice.
-def is_valid_new_position(x: int, y: int, chain: List[Monomer], dead_chain: List[Monomer]) -> bool:
-    if has_monomer(x, y, chain):
+# chain_cells and dead_cells are sets of (x, y), so every check is a hash lookup instead of a scan over the chain.
+def is_valid_new_position(x: int, y: int, chain_cells: Set[Tuple[int, int]], dead_cells: Set[Tuple[int, int]]) -> bool:
+    if (x, y) in chain_cells:
         return False
-    if has_monomer(x, y, dead_chain):
+    if (x, y) in dead_cells:
         return False
 
-    if is_dead_position(x, y, chain, dead_chain):
+    if is_dead_position(x, y, chain_cells, dead_cells):
         return False
 
     return True
 
 
-def is_dead_position(x: int, y: int, chain: List[Monomer], dead_chain: List[Monomer]) -> bool:
-    # We now check for dead ends by walking through the chain searching for 4 neighbour points
+def is_dead_position(x: int, y: int, chain_cells: Set[Tuple[int, int]], dead_cells: Set[Tuple[int, int]]) -> bool:
+    # We now check for dead ends by looking up the 4 neighbour points in the chain.
     # If we can not move from this position to another, exclude it by returning False.
     if (
-            has_monomer(x + 1, y, chain) and
-            has_monomer(x - 1, y, chain) and
-            has_monomer(x, y + 1, chain) and
-            has_monomer(x, y - 1, chain)
+            (x + 1, y) in chain_cells and
+            (x - 1, y) in chain_cells and
+            (x, y + 1) in chain_cells and
+            (x, y - 1) in chain_cells
     ):
         return True
 
-    # We now check for dead ends by walking through the dead chain searching for 4 neighbour points
+    # We now check for dead ends by looking up the 4 neighbour points in the dead cells.
     # If we can not move from this position to another, exclude it by returning False.
     if (
-            has_monomer(x + 1, y, dead_chain) and
-            has_monomer(x - 1, y, dead_chain) and
-            has_monomer(x, y + 1, dead_chain) and
-            has_monomer(x, y - 1, dead_chain)
+            (x + 1, y) in dead_cells and
+            (x - 1, y) in dead_cells and
+            (x, y + 1) in dead_cells and
+            (x, y - 1) in dead_cells
     ):
         return True
     return False
@@ -87,50 +75,158 @@ def is_dead_position(x: int, y: int, chain: List[Monomer], dead_chain: List[Mono
 # Generates a random protein chain.
 # length is the length of the chain.
 # hydrophobicity is a fraction between 0 and 1 determining the relative amount of H monomers.
-def generate_protein(length: int, hydrophobicity: float) -> List[Monomer]:
+# rng is a random.Random or RandomStream to draw from, the global random functions are used if it is not given.
+def generate_protein(length: int, hydrophobicity: float,
+                     rng: Optional[Union[Random, RandomStream]] = None) -> List[Monomer]:
+    random_choice = rng.choice if rng is not None else choice
+    random_choices = rng.choices if rng is not None else choices
+
     # We keep track of all nodes we tried but ended up in a dead state.
     # This is so we can recursively track back until we find a valid path.
-    dead_chain = []
+    dead_cells: Set[Tuple[int, int]] = set()
 
     current_chain = [
         # Add initial monomer to make the algorithm simpler.
         Monomer(
             # Returns H or P depending on weight
-            MonomerKind(choices([1, 2], [hydrophobicity, 1.0 - hydrophobicity])[0]),
+            MonomerKind(random_choices([1, 2], [hydrophobicity, 1.0 - hydrophobicity])[0]),
             0,  # x coord
             0  # y coord
         )
     ]
+    # Positions taken by the current chain
+    chain_cells: Set[Tuple[int, int]] = {(0, 0)}
     # We need to generate N - 1 additional monomers
     while True:
         # Generate direction with equal probability
-        direction = choice([0, 1, 2, 3])
+        direction = random_choice([0, 1, 2, 3])
         (new_x, new_y) = generate_new_coords(direction, current_chain[-1].x, current_chain[-1].y)
 
         # Checks if we can add the monomer at the given position.
-        if is_valid_new_position(new_x, new_y, current_chain, dead_chain):
+        if is_valid_new_position(new_x, new_y, chain_cells, dead_cells):
             # Take a step if we can take it
             current_chain.append(
                 Monomer(
                     # Returns H or P depending on weight
-                    MonomerKind(choices([1, 2], [hydrophobicity, 1.0 - hydrophobicity])[0]),
+                    MonomerKind(random_choices([1, 2], [hydrophobicity, 1.0 - hydrophobicity])[0]),
                     new_x,
                     new_y
                 )
             )
+            chain_cells.add((new_x, new_y))
         else:
-            dead_chain.append(Monomer(
-                MonomerKind.H,
-                new_x,
-                new_y
-            ))
+            dead_cells.add((new_x, new_y))
             # Now we need to check if the previous position is dead or not, it might now be, in which case we need to
             # walk back
             prev = current_chain[-1]
-            if is_dead_position(prev.x, prev.y, current_chain, dead_chain):
+            if is_dead_position(prev.x, prev.y, chain_cells, dead_cells):
                 current_chain.pop()
-                dead_chain.append(prev)
+                chain_cells.discard((prev.x, prev.y))
+                dead_cells.add((prev.x, prev.y))
 
         if length == len(current_chain):
             return current_chain
         continue
+
+
+# Steps on the lattice, in the order of the directions of generate_new_coords()
+SAW_STEPS: List[Tuple[int, int]] = [(0, 1), (1, 0), (-1, 0), (0, -1)]
+
+
+# Grows a self avoiding walk of length monomers from (0, 0) with Rosenbluth growth:
+# every step picks uniformly among the free neighbours of the last monomer.
+# Returns a tuple: (positions, log_weight) with positions an (N, 2) array and log_weight the log of the
+# Rosenbluth weight, the product of the amount of free neighbours at every step.
+# Weighting walks by it gives averages over uniformly sampled self avoiding walks.
+# Returns (None, -inf) if the walk got trapped before reaching the length.
+def rosenbluth_walk(length: int,
+                    rng: Optional[Union[Random, RandomStream]] = None) -> Tuple[Optional[np.ndarray], float]:
+    random_float = rng.random if rng is not None else random
+
+    positions = [(0, 0)]
+    cells: Set[Tuple[int, int]] = {(0, 0)}
+    log_weight = 0.0
+    x, y = 0, 0
+    for _ in range(1, length):
+        free = [(x + dx, y + dy) for dx, dy in SAW_STEPS if (x + dx, y + dy) not in cells]
+        if len(free) == 0:
+            return None, -math.inf
+        log_weight += math.log(len(free))
+        x, y = free[int(random_float() * len(free))]
+        positions.append((x, y))
+        cells.add((x, y))
+    return np.array(positions, dtype=np.int64).reshape(-1, 2), log_weight
+
+
+# Grows a self avoiding walk of length monomers from (0, 0), backing out of dead ends.
+# Every step picks uniformly among the free neighbours of the last monomer.
+# When there are none the last monomer is taken off again and its position is marked dead,
+# so a pocket enclosed by the walk is explored once instead of along every possible path.
+# A walk that needs more than max_backtracks backtracks starts over, so long chains never stall.
+# Returns the positions as an (N, 2) array.
+def grow_self_avoiding_walk(length: int,
+                            rng: Optional[Union[Random, RandomStream]] = None,
+                            max_backtracks: Optional[int] = None) -> np.ndarray:
+    random_float = rng.random if rng is not None else random
+    if max_backtracks is None:
+        max_backtracks = 10 * length
+
+    while True:
+        positions = [(0, 0)]
+        # Positions taken by the walk or marked dead
+        cells: Set[Tuple[int, int]] = {(0, 0)}
+        backtracks = 0
+        while 0 < len(positions) < length and backtracks <= max_backtracks:
+            x, y = positions[-1]
+            options = [(x + dx, y + dy) for dx, dy in SAW_STEPS if (x + dx, y + dy) not in cells]
+            if len(options) == 0:
+                # Dead end, take the last monomer off again. Its position stays in cells, marked dead.
+                backtracks += 1
+                positions.pop()
+                continue
+
+            position = options[int(random_float() * len(options))]
+            positions.append(position)
+            cells.add(position)
+
+        if len(positions) == length:
+            return np.array(positions, dtype=np.int64).reshape(-1, 2)
+
+
+# Generates count independent self avoiding walks of length monomers with grow_self_avoiding_walk().
+# Returns them as a (count, N, 2) array, all starting at (0, 0).
+def generate_self_avoiding_walks(length: int, count: int,
+                                 rng: Optional[Union[Random, RandomStream]] = None) -> np.ndarray:
+    walks = np.zeros((count, length, 2), dtype=np.int64)
+    for i in range(0, count):
+        walks[i] = grow_self_avoiding_walk(length, rng)
+    return walks
+
+
+# Generates count independent random protein chains in bulk.
+# Conformations come from grow_self_avoiding_walk(), which stays fast for chains of thousands of monomers.
+# Every monomer is H with probability hydrophobicity, like generate_protein().
+def generate_proteins(length: int, hydrophobicity: float, count: int,
+                      rng: Optional[Union[Random, RandomStream]] = None) -> List[List[Monomer]]:
+    random_float = rng.random if rng is not None else random
+    proteins = []
+    for walk in generate_self_avoiding_walks(length, count, rng):
+        proteins.append([Monomer(MonomerKind.H if random_float() < hydrophobicity else MonomerKind.P, x, y)
+                         for x, y in walk.tolist()])
+    return proteins
+
+
+# Converts a string of H and P characters into a list of monomer kinds.
+def parse_chain_composition_string(sequence: str) -> List[MonomerKind]:
+    return [{'H': MonomerKind.H, 'P': MonomerKind.P}[c] for c in sequence.upper()]
+
+
+# Generates a random protein chain with the given H/P sequence.
+# The conformation is generated by generate_protein(), after which the kinds are replaced by the sequence.
+def generate_protein_with_sequence(sequence: str,
+                                   rng: Optional[Union[Random, RandomStream]] = None) -> List[Monomer]:
+    kinds = parse_chain_composition_string(sequence)
+    chain = generate_protein(len(kinds), 0.5, rng)
+    for monomer, kind in zip(chain, kinds):
+        monomer.kind = kind
+    return chain
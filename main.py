@@ -1,6 +1,7 @@
 from debug_functions import check_random_walk
 from benchmarking import *
 from simulated_annealing import *
+from parallel_tempering import perform_mmc_replica_exchange
 
 
 # Main function of the program
@@ -9,10 +10,23 @@ def main():
     # check_random_walk()
     # return
 
+    # Enable following two lines to compare the speed of the mmc backends.
+    # perform_backend_benchmarking()
+    # return
+
     # Enable following two lines to run the benchmarking procedure for 3 fixed temperatures.
     # perform_mmc_benchmarking()
     # return
 
+    # Enable following lines to run the replica exchange procedure, one process per temperature.
+    # (lowest_lattice, lowest_energy, lowest_temp), lattice, results, swap_rates = perform_mmc_replica_exchange(
+    #     mmc_initialize_default_protein(25, 0.5),
+    #     [0.1 * (i + 1) for i in range(0, 20)],  # Temperatures
+    #     100,  # Exchange rounds
+    #     1000)  # MMC Iterations per exchange round
+    # draw_simulated_annealing_plots(lattice, results)
+    # return
+
     # Enable following lines to run the simulated annealing procedure.
     hydrophobicity = 0.5
     lattice = mmc_initialize_default_protein(25, hydrophobicity)
@@ -23,7 +37,7 @@ def main():
         2.0,  # Max temperature
         min_temp= 0.0,  # Min temperature
         randomize_seed=True,
-        store_lowest_lattice=False)  # Set this only to true if necessary, slows down the algorithm significantly
+        store_lowest_lattice=True)  # Only positions are copied, so this is cheap
     # Draw lowest protein
     draw_protein_conformation(lowest_lattice, lowest_temp, hydrophobicity)
     print('Lowest protein: {}'.format(lowest_lattice.chain))
@@ -0,0 +1,151 @@
+from sample_sinks import *
+import math
+
+
+# Running statistics of one sampled quantity, updated one value at a time without keeping the values.
+# Mean and variance use Welford's algorithm, so no sums of squares of large numbers are kept.
+# Also keeps the minimum, maximum, a histogram with bins of bin_width and the sums needed for the
+# integrated autocorrelation time up to max_lag samples apart.
+# The first discard values are skipped, like discard_fraction_of_array() does for lists.
+class OnlineStatistics:
+    def __init__(self, discard: int = 0, bin_width: float = 1.0, max_lag: int = 100):
+        self.discard: int = discard
+        self.bin_width: float = bin_width
+        self.max_lag: int = max_lag
+        self.count: int = 0
+        self.mean: float = 0.0
+        self.minimum: float = math.inf
+        self.maximum: float = -math.inf
+        # Bin index -> count, bin i holds values in [i * bin_width, (i + 1) * bin_width)
+        self.bins: Dict[int, int] = {}
+        self.__m2: float = 0.0
+        self.__skipped: int = 0
+
+        # Autocorrelation: values are shifted by the first value to keep the products small.
+        # lag_sums[k] is the sum of y[t] * y[t - k], recent holds the last max_lag shifted values, newest first.
+        self.__has_autocorrelation: bool = True
+        self.__reference: Optional[float] = None
+        self.__shifted_sum: float = 0.0
+        self.__lag_sums: np.ndarray = np.zeros(max_lag + 1, dtype=np.float64)
+        self.__recent: np.ndarray = np.zeros(max_lag + 1, dtype=np.float64)
+
+    # Adds a value
+    def add(self, value: float):
+        if self.__skipped < self.discard:
+            self.__skipped += 1
+            return
+
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.__m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        bin_idx = int(math.floor(value / self.bin_width))
+        self.bins[bin_idx] = self.bins.get(bin_idx, 0) + 1
+
+        if self.__reference is None:
+            self.__reference = value
+        shifted = value - self.__reference
+        self.__shifted_sum += shifted
+        self.__recent[1:] = self.__recent[:-1]
+        self.__recent[0] = shifted
+        self.__lag_sums += shifted * self.__recent
+
+    # Adds all values
+    def extend(self, values: Iterable[float]):
+        for value in values:
+            self.add(value)
+
+    # Adds the values counted by other, as if they were added to this one.
+    # The autocorrelation of two separate series can not be combined, it is not available after merging.
+    def merge(self, other: 'OnlineStatistics'):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.__m2 += other.__m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        for bin_idx, bin_count in other.bins.items():
+            self.bins[bin_idx] = self.bins.get(bin_idx, 0) + bin_count
+        self.__has_autocorrelation = False
+
+    # Population variance, same as mean(x^2) - mean(x)^2 over the values
+    @property
+    def variance(self) -> float:
+        return self.__m2 / self.count if self.count != 0 else 0.0
+
+    @property
+    def standard_deviation(self) -> float:
+        return math.sqrt(self.variance)
+
+    # Returns the heat capacity, treating the values as energies sampled at the temperature.
+    # Same as compute_heat_capacity() on the values without discarding.
+    def heat_capacity(self, temperature: float, boltzmann: float = 1.0) -> float:
+        return self.variance / (boltzmann * temperature)
+
+    # Returns the histogram as (bin_edges, counts), with len(bin_edges) == len(counts) + 1.
+    # Empty bins between the lowest and highest value are included.
+    def histogram(self) -> Tuple[np.ndarray, np.ndarray]:
+        if len(self.bins) == 0:
+            return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.int64)
+        first, last = min(self.bins), max(self.bins)
+        edges = np.arange(first, last + 2, dtype=np.float64) * self.bin_width
+        counts = np.array([self.bins.get(bin_idx, 0) for bin_idx in range(first, last + 1)], dtype=np.int64)
+        return edges, counts
+
+    # Returns the normalized autocorrelation for lags 0 up to max_lag (or count - 1, if smaller)
+    def autocorrelation(self) -> np.ndarray:
+        assert self.__has_autocorrelation, 'Autocorrelation is not available after merging'
+        lags = min(self.max_lag, self.count - 1)
+        if lags < 0 or self.variance == 0.0:
+            return np.ones(max(lags + 1, 0), dtype=np.float64)
+        shifted_mean = self.__shifted_sum / self.count
+        k = np.arange(0, lags + 1)
+        covariance = self.__lag_sums[:lags + 1] / (self.count - k) - shifted_mean * shifted_mean
+        return covariance / covariance[0]
+
+    # Returns the integrated autocorrelation time in samples: 1 + 2 * sum of the autocorrelation,
+    # summed up to the first lag where it drops to zero or below.
+    def autocorrelation_time(self) -> float:
+        rho = self.autocorrelation()
+        tau = 1.0
+        for value in rho[1:].tolist():
+            if value <= 0.0:
+                break
+            tau += 2.0 * value
+        return tau
+
+
+# Keeps online statistics of the energy and gyration radius samples taken by mmc().
+# The samples are passed on to inner if given, so the raw samples can still be kept.
+# Without inner no samples are kept at all and the getters return empty lists.
+class StatisticsSampleSink(SampleSink):
+    def __init__(self, inner: Optional[SampleSink] = None, discard: int = 0,
+                 energy_bin_width: float = 1.0, gyration_bin_width: float = 0.05, max_lag: int = 100):
+        self.inner: Optional[SampleSink] = inner
+        self.energy: OnlineStatistics = OnlineStatistics(discard, energy_bin_width, max_lag)
+        self.gyration_radius: OnlineStatistics = OnlineStatistics(discard, gyration_bin_width, max_lag)
+
+    def append(self, energy: float, gyration_radius: float):
+        self.energy.add(energy)
+        self.gyration_radius.add(gyration_radius)
+        if self.inner is not None:
+            self.inner.append(energy, gyration_radius)
+
+    def flush(self):
+        if self.inner is not None:
+            self.inner.flush()
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+    def get_energy(self) -> Sequence[float]:
+        return self.inner.get_energy() if self.inner is not None else []
+
+    def get_gyration_radius(self) -> Sequence[float]:
+        return self.inner.get_gyration_radius() if self.inner is not None else []
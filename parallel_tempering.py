@@ -0,0 +1,129 @@
+from simulated_annealing import *
+import multiprocessing
+
+
+# Runs a single replica at its temperature for a number of mmc iterations.
+# Module level function so it can be sent to the worker processes of the pool.
+# Arguments tuple: (temperature, iterations, sampling_frequency, lattice, epsilon, boltzmann, rng)
+# Returns a tuple: (resulting_lattice, resulting_energy, samples, (lowest_lattice, lowest_energy))
+# The lowest conformation is the lowest one visited during the iterations, not only at their end.
+def run_replica(arguments: Tuple[float, int, int, ProteinLattice, float, float, RandomStream]) \
+        -> Tuple[ProteinLattice, float, MMCSamples, Tuple[ProteinLattice, float]]:
+    temperature, iterations, sampling_frequency, lattice, epsilon, boltzmann, rng = arguments
+
+    lowest, lattice, samples = mmc(temperature, iterations, sampling_frequency, lattice,
+                                   epsilon=epsilon,
+                                   boltzmann=boltzmann,
+                                   rng=rng)
+    return lattice, calculate_energy_incremental(epsilon, lattice), samples, lowest
+
+
+# Metropolis swap criterion for the configurations of two replicas.
+# Returns the probability of accepting the swap: min(1, exp((1/kTi - 1/kTj) * (Ei - Ej)))
+def replica_swap_probability(temperature_i: float, energy_i: float,
+                             temperature_j: float, energy_j: float,
+                             boltzmann: float = 1.0) -> float:
+    delta = (1.0 / (boltzmann * temperature_i) - 1.0 / (boltzmann * temperature_j)) * (energy_i - energy_j)
+    if delta >= 0.0:
+        return 1.0
+    return math.exp(delta)
+
+
+# Performs a replica exchange (parallel tempering) procedure using the mmc function internally.
+# One replica runs per temperature, each in a worker process of a multiprocessing pool.
+# After every mmc_iterations_per_exchange iterations, neighbouring temperatures try to swap their configurations.
+# Even and odd neighbour pairs are tried alternately.
+# Returns a tuple: ( (lowest_lattice, lowest_energy, lowest_temp), lattice_at_lowest_temp, results, swap_rates )
+# results has the same shape as the results of perform_mmc_simulated_annealing(), sorted by temperature.
+# swap_rates holds (temp_i, temp_j, acceptance_rate) for each neighbouring pair.
+def perform_mmc_replica_exchange(
+        lattice: ProteinLattice,
+        temperatures: List[float],  # Temperature of each replica, all must be larger than 0.
+        exchange_count: int,  # Amount of exchange rounds
+        mmc_iterations_per_exchange: int,  # MMC iterations per replica between exchange rounds.
+        sampling_frequency: int = 100,  # Frequency at which the mmc function will sample values
+        epsilon: float = 1.0,
+        boltzmann: float = 1.0,
+        processes: Optional[int] = None,  # Amount of worker processes, defaults to one per cpu.
+        randomize_seed: bool = True,  # Set a fresh seed before starting
+        rng: Optional[RandomStream] = None  # Random number stream, randomize_seed is ignored if given
+) -> Tuple[Tuple[ProteinLattice, float, float],
+           ProteinLattice,
+           List[Tuple[float, List[float], List[float]]],
+           List[Tuple[float, float, float]]]:
+    temperatures = sorted(temperatures)
+
+    # Set up the random number stream for the swaps.
+    # Every replica gets an independent stream spawned from it for each round.
+    if rng is None:
+        if randomize_seed:
+            seed()
+        rng = RandomStream.from_global_random()
+
+    # All replicas start from the given conformation.
+    replicas: List[ProteinLattice] = [copy.deepcopy(lattice) for _ in temperatures]
+    energies: List[float] = [calculate_energy(epsilon, lattice) for _ in temperatures]
+    energy_samples: List[List[float]] = [[] for _ in temperatures]
+    gyration_samples: List[List[float]] = [[] for _ in temperatures]
+
+    swaps_attempted: List[int] = [0 for _ in range(0, len(temperatures) - 1)]
+    swaps_accepted: List[int] = [0 for _ in range(0, len(temperatures) - 1)]
+
+    # Keep track of best values observed.
+    # Lattices come back from the workers as fresh copies, so no deepcopy is needed to store them.
+    lowest_lattice = replicas[0]
+    lowest_lattice_energy: float = energies[0]
+    lowest_temp: float = temperatures[0]
+
+    with multiprocessing.Pool(processes) as pool:
+        for exchange in range(0, exchange_count):
+            print('Replica exchange round {}/{}...'.format(exchange + 1, exchange_count))
+
+            # Run all replicas in parallel
+            replica_rngs = rng.spawn(len(temperatures))
+            arguments = [(temperatures[i], mmc_iterations_per_exchange, sampling_frequency, replicas[i],
+                          epsilon, boltzmann, replica_rngs[i])
+                         for i in range(0, len(temperatures))]
+            for i, (replica, energy, samples, (replica_lowest_lattice, replica_lowest_energy)) in enumerate(
+                    pool.map(run_replica, arguments)):
+                replicas[i] = replica
+                energies[i] = energy
+                energy_samples[i].extend(samples.energy)
+                gyration_samples[i].extend(samples.gyration_radius)
+
+                # Also catches lower states the replica visited between two exchange rounds
+                if replica_lowest_energy < lowest_lattice_energy:
+                    lowest_lattice = replica_lowest_lattice
+                    lowest_lattice_energy = replica_lowest_energy
+                    lowest_temp = temperatures[i]
+
+            # Try to swap neighbouring configurations
+            for i in range(exchange % 2, len(temperatures) - 1, 2):
+                swaps_attempted[i] += 1
+                w = replica_swap_probability(temperatures[i], energies[i],
+                                             temperatures[i + 1], energies[i + 1],
+                                             boltzmann)
+                if w > rng.random():
+                    swaps_accepted[i] += 1
+                    replicas[i], replicas[i + 1] = replicas[i + 1], replicas[i]
+                    energies[i], energies[i + 1] = energies[i + 1], energies[i]
+
+    # Generate results, discarding first 10%
+    # (temp, energy[], gyration[])
+    results: List[Tuple[float, List[float], List[float]]] = [
+        (temperatures[i], discard_fraction_of_array(energy_samples[i]), discard_fraction_of_array(gyration_samples[i]))
+        for i in range(0, len(temperatures))
+    ]
+
+    swap_rates: List[Tuple[float, float, float]] = [
+        (temperatures[i], temperatures[i + 1],
+         float(swaps_accepted[i]) / swaps_attempted[i] if swaps_attempted[i] != 0 else 0.0)
+        for i in range(0, len(temperatures) - 1)
+    ]
+
+    # Print some statistics
+    for temp_i, temp_j, rate in swap_rates:
+        print('Swap acceptance T: {:.2f} <-> {:.2f}: {:.2f}'.format(temp_i, temp_j, rate))
+    print('Lowest energy state found: {:.2f} at T: {:.2f}'.format(lowest_lattice_energy, lowest_temp))
+
+    return (lowest_lattice, lowest_lattice_energy, lowest_temp), replicas[0], results, swap_rates
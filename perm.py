@@ -0,0 +1,186 @@
+from computation import *
+
+
+# Ground state search by chain growth with population control (pruned-enriched Rosenbluth method, PERM).
+# Chains are grown one monomer at a time, depth first. Every new monomer is placed at one of the free neighbours
+# of the last one, picked with probability proportional to its Boltzmann factor exp(-dE / kT),
+# and the weight of the chain is multiplied by the sum of those factors (importance sampled Rosenbluth weight).
+# Chains with a large weight compared to the average at their length are copied (enriched),
+# chains with a small weight are dropped with probability 1/2 (pruned), following Hsu, Mehra, Nadler and Grassberger.
+# Weights are kept as logarithms, as they easily exceed the float range for long chains at low temperatures.
+
+
+# Returns log(exp(a) + exp(b))
+def log_add(a: float, b: float) -> float:
+    if a == -math.inf:
+        return b
+    if b == -math.inf:
+        return a
+    if a < b:
+        a, b = b, a
+    return a + math.log1p(math.exp(b - a))
+
+
+# Returns the probability of each candidate to be among copies distinct picks, proportional to its factor.
+# Candidates whose share would exceed 1 are always picked, the other picks are shared in proportion to the factors.
+def inclusion_probabilities(factors: List[float], copies: int) -> List[float]:
+    certain: List[bool] = [False] * len(factors)
+    while True:
+        rest = sum(factor for factor, is_certain in zip(factors, certain) if not is_certain)
+        left = copies - sum(certain)
+        largest = max((idx for idx in range(0, len(factors)) if not certain[idx]), key=lambda idx: factors[idx],
+                      default=None)
+        if largest is None or left * factors[largest] < rest:
+            break
+        certain[largest] = True
+    return [1.0 if is_certain else left * factor / rest for factor, is_certain in zip(factors, certain)]
+
+
+# Systematic sampling: returns the indices of the candidates picked by the points u, u + 1, u + 2, ...
+# on the cumulative inclusion probabilities. Every candidate is picked at most once, with its inclusion probability.
+def systematic_sample(probabilities: List[float], u: float) -> List[int]:
+    picks: List[int] = []
+    cumulative = 0.0
+    for idx, probability in enumerate(probabilities):
+        cumulative += probability
+        if u < cumulative:
+            picks.append(idx)
+            u += 1.0
+    return picks
+
+
+# Grows complete conformations of the H/P sequence of lattice with PERM at the given temperature.
+# One tour starts from the first monomer and ends when all of its enriched copies are grown or pruned.
+# Returns a tuple: ( (lowest_lattice, lowest_energy, temperature), lowest_lattice, results )
+# results has the same shape as the results of perform_mmc_simulated_annealing():
+# one (temperature, energy[], gyration[]) entry with the energy and radius of gyration of every complete chain grown.
+def perform_perm_search(
+        lattice: ProteinLattice,  # Gives the H/P sequence to fold, its conformation is not used.
+        tours: int,  # Amount of tours
+        temperature: float = 0.3,  # Temperature used for the Boltzmann factors, low values favour contacts
+        epsilon: float = 1.0,
+        boltzmann: float = 1.0,
+        # Enrichment threshold factor. Chains are copied above and pruned below 0.2 times this threshold.
+        threshold_factor: float = 1.0,
+        target_energy: Optional[float] = None,  # Stop as soon as a conformation with this energy or lower is found
+        randomize_seed: bool = True,  # Set a fresh seed before starting
+        rng: Optional[RandomStream] = None,  # Random number stream, randomize_seed is ignored if given
+        # Receives the lowest conformations, one is kept if not given.
+        # Pass one with a larger capacity to keep the top-K.
+        lowest: Optional[LowestConformations] = None,
+        verbose: bool = True  # Print progress and statistics
+) -> Tuple[Tuple[ProteinLattice, float, float],
+           ProteinLattice,
+           List[Tuple[float,
+                      List[float],
+                      List[float]]]]:
+    if rng is None:
+        if randomize_seed:
+            seed()
+        rng = RandomStream.from_global_random()
+    if lowest is None:
+        lowest = LowestConformations()
+
+    length = len(lattice)
+    is_h = [lattice.get_kind(idx) == MonomerKind.H for idx in range(0, length)]
+    # Log of the Boltzmann factor of one new H-H contact
+    log_contact_factor = epsilon / (boltzmann * temperature)
+
+    # Sum of weights (log) and amount of chains that reached each length, used for the thresholds
+    log_weight_sums: List[float] = [-math.inf] * length
+    chain_counts: List[int] = [0] * length
+
+    energies: List[float] = []
+    gyration_radii: List[float] = []
+
+    # Current chain: positions of the placed monomers and the index of the monomer at each taken position
+    positions: List[Tuple[int, int]] = []
+    cells: Dict[Tuple[int, int], int] = {}
+
+    tour = 0
+    while tour < tours and lowest.lowest_energy > (target_energy if target_energy is not None else -math.inf):
+        tour += 1
+        # Stack entries: (monomer to place, x, y, log_weight after placing, contacts after placing)
+        # The first monomer is placed at (0, 0) and the second one to its right, removing the lattice symmetries.
+        stack: List[Tuple[int, int, int, float, int]] = [(0, 0, 0, 0.0, 0)]
+        while len(stack) != 0:
+            idx, x, y, log_weight, contact_count = stack.pop()
+
+            # Take the chain back to the parent of this entry, depth first order guarantees it is on the chain.
+            while len(positions) > idx:
+                del cells[positions.pop()]
+            positions.append((x, y))
+            cells[(x, y)] = idx
+
+            log_weight_sums[idx] = log_add(log_weight_sums[idx], log_weight)
+            chain_counts[idx] += 1
+
+            # Complete chain
+            if idx == length - 1:
+                energy = -1.0 * epsilon * float(contact_count)
+                energies.append(energy)
+                gyration_radii.append(GyrationTracker(positions).gyration_radius())
+                if lowest.is_candidate(energy):
+                    if len(lowest.kinds) == 0:
+                        lowest.kinds = [lattice.get_kind(i) for i in range(0, length)]
+                        lowest.hydrophobicity = lattice.hydrophobicity
+                    lowest.offer_positions(energy, np.array(positions, dtype=np.int64))
+                continue
+
+            # Possible positions of the next monomer with the contacts it would make.
+            # Contacts with the previous monomer are counted as well, like calculate_energy() does.
+            next_idx = idx + 1
+            if idx == 0:
+                candidates = [(x + 1, y)]
+            else:
+                candidates = [(x + dx, y + dy) for dx, dy in SAW_STEPS if (x + dx, y + dy) not in cells]
+            if len(candidates) == 0:
+                continue
+            new_contacts = []
+            for cx, cy in candidates:
+                count = 0
+                if is_h[next_idx]:
+                    for neighbour in [(cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)]:
+                        other = cells.get(neighbour)
+                        if other is not None and is_h[other]:
+                            count += 1
+                new_contacts.append(count)
+            # Factors relative to the candidate with the most contacts, to stay in the float range
+            most_contacts = max(new_contacts)
+            factors = [math.exp(log_contact_factor * (count - most_contacts)) for count in new_contacts]
+            factor_sum = sum(factors)
+            new_log_weight = log_weight + log_contact_factor * most_contacts + math.log(factor_sum)
+
+            # Population control, compared with the average weight at the new length.
+            # Enriched chains get up to one copy per candidate, each continuing from a different candidate.
+            copies = 1
+            if chain_counts[next_idx] > 0:
+                log_threshold = (math.log(threshold_factor) + log_weight_sums[next_idx] - log_weight_sums[0] +
+                                 2.0 * math.log(chain_counts[next_idx] / chain_counts[0]))
+                if new_log_weight > log_threshold:
+                    copies = min(len(candidates), int(math.ceil(math.exp(min(new_log_weight - log_threshold, 3.0)))))
+                elif new_log_weight < log_threshold + math.log(0.2):
+                    if rng.random() < 0.5:
+                        continue
+                    log_weight += math.log(2.0)
+
+            # Copies are drawn without replacement, each weighted by its factor over its inclusion probability.
+            # A single copy gets the full Rosenbluth weight, all candidates taken at once get their own factor.
+            probabilities = inclusion_probabilities(factors, copies)
+            for choice_idx in systematic_sample(probabilities, rng.random()):
+                cx, cy = candidates[choice_idx]
+                choice_log_weight = (log_weight + log_contact_factor * most_contacts +
+                                     math.log(factors[choice_idx] / probabilities[choice_idx]))
+                stack.append((next_idx, cx, cy, choice_log_weight, contact_count + new_contacts[choice_idx]))
+
+        if verbose and (tour % 1000 == 0 or tour == tours):
+            print('PERM tour {}/{}: {} chains, lowest energy: {:.2f}'.format(tour, tours, len(energies),
+                                                                             lowest.lowest_energy))
+
+    assert len(lowest) != 0, 'No complete conformation was grown, increase the amount of tours'
+    lowest_lattice = lowest.get_lattice(0, type(lattice))
+    lowest_energy = calculate_energy(epsilon, lowest_lattice)
+    if verbose:
+        print('Lowest energy state found: {:.2f} after {} tours'.format(lowest_energy, tour))
+
+    return (lowest_lattice, lowest_energy, temperature), lowest_lattice, [(temperature, energies, gyration_radii)]
@@ -0,0 +1,59 @@
+from typing import *
+import bisect
+import numpy as np
+
+
+# Stream of random numbers for a single simulation, backed by a numpy.random.Generator.
+# Uniform numbers are drawn in blocks, so a draw costs an index into an array instead of a call into the generator.
+# Offers the parts of the random.Random interface used in this program (random, randrange, choice, choices),
+# so it can be passed wherever a random.Random is accepted.
+# Streams do not share any global state: two streams with the same seed give the same numbers,
+# and spawn() gives independent streams for parallel workers.
+class RandomStream:
+    # Amount of uniform numbers drawn from the generator at once
+    BLOCK_SIZE: int = 4096
+
+    def __init__(self, seed: Optional[Union[int, np.random.SeedSequence]] = None):
+        self.seed_sequence: np.random.SeedSequence = seed if isinstance(seed, np.random.SeedSequence) \
+            else np.random.SeedSequence(seed)
+        self.generator: np.random.Generator = np.random.default_rng(self.seed_sequence)
+        self.__block: List[float] = []
+        self.__position: int = 0
+
+    # Returns a fresh stream seeded from the global random module.
+    # Used when no stream is given, so seed() keeps making runs reproducible.
+    @staticmethod
+    def from_global_random() -> 'RandomStream':
+        from random import getrandbits
+        return RandomStream(getrandbits(64))
+
+    # Returns count new streams that are independent from this one and from each other
+    def spawn(self, count: int) -> List['RandomStream']:
+        return [RandomStream(child) for child in self.seed_sequence.spawn(count)]
+
+    # Returns a float in [0, 1)
+    def random(self) -> float:
+        if self.__position == len(self.__block):
+            # Converted to a list once per block, indexing a list is cheaper than indexing an array.
+            self.__block = self.generator.random(self.BLOCK_SIZE).tolist()
+            self.__position = 0
+        value = self.__block[self.__position]
+        self.__position += 1
+        return value
+
+    # Returns an int in [0, stop)
+    def randrange(self, stop: int) -> int:
+        return int(self.random() * stop)
+
+    # Returns a random element of the non-empty sequence
+    def choice(self, sequence: Sequence):
+        return sequence[int(self.random() * len(sequence))]
+
+    # Returns k random elements of the population with replacement, optionally weighted
+    def choices(self, population: Sequence, weights: Optional[Sequence[float]] = None, k: int = 1) -> List:
+        if weights is None:
+            return [self.choice(population) for _ in range(0, k)]
+        cumulative_weights = list(np.cumsum(weights))
+        total = cumulative_weights[-1]
+        return [population[bisect.bisect(cumulative_weights, self.random() * total, 0, len(population) - 1)]
+                for _ in range(0, k)]
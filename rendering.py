@@ -0,0 +1,96 @@
+from drawing import *
+import multiprocessing
+import multiprocessing.pool
+import pickle
+
+# Renders figures to files in a worker process, so a simulation does not wait for matplotlib.
+# Jobs are a drawing function of drawing.py with its arguments. The arguments are pickled when the job is
+# submitted, so the simulation can keep changing the lattice right away. The workers use the Agg backend,
+# so no display is needed and nothing blocks on a window.
+
+
+# Renders a single job into its file.
+# Module level function so it can be sent to the worker processes of the pool.
+# Arguments tuple: (drawing function, output path, pickled (args, kwargs))
+def render_job(arguments: Tuple[Callable, str, bytes]):
+    function, output_path, payload = arguments
+    args, kwargs = pickle.loads(payload)
+    function(*args, output_path=output_path, **kwargs)
+
+
+# Draws the plots of draw_simulated_annealing_plots() as files into the directory output_path.
+# Takes output_path like the other drawing functions, so it can be rendered by a RenderQueue.
+def draw_simulated_annealing_plot_files(lattice: ProteinLattice,
+                                        results: List[Tuple[float, List[float], List[float]]],
+                                        output_path: str, **kwargs):
+    draw_simulated_annealing_plots(lattice, results, output_directory=output_path, **kwargs)
+
+
+# Queue of figures to render, in processes worker processes.
+# Every figure is written to directory as <number>_<name>.png, numbered in the order the jobs are submitted.
+# Submitting blocks while max_pending jobs are still being rendered, so a fast simulation can not pile up
+# unbounded amounts of pickled arguments. Errors of a job are raised by the next submit(), wait() or close().
+class RenderQueue:
+    def __init__(self, directory: str, processes: int = 1, max_pending: int = 64):
+        assert processes >= 1, 'Rendering needs at least one worker process'
+        os.makedirs(directory, exist_ok=True)
+        self.directory: str = directory
+        self.max_pending: int = max_pending
+        # Amount of jobs submitted so far, numbers the files
+        self.count: int = 0
+        # Paths of all files written, or still being written
+        self.paths: List[str] = []
+        self.__pending: List[multiprocessing.pool.AsyncResult] = []
+        self.__pool = multiprocessing.Pool(processes, initializer=use_headless_rendering)
+
+    # Submits a job rendering function(*args, **kwargs) into a new file, returns its path.
+    # function is a drawing function taking an output_path argument, like draw_protein_conformation().
+    def submit(self, function: Callable, name: str, *args, **kwargs) -> str:
+        return self.__submit(function, '{:04d}_{}.png'.format(self.count, name), args, kwargs)
+
+    # Submits a job drawing all simulated annealing plots into a new directory, returns its path.
+    # See draw_simulated_annealing_plots() for the keyword arguments.
+    def submit_simulated_annealing_plots(self, lattice: ProteinLattice,
+                                         results: List[Tuple[float, List[float], List[float]]],
+                                         name: str = 'simulated_annealing', **kwargs) -> str:
+        return self.__submit(draw_simulated_annealing_plot_files, '{:04d}_{}'.format(self.count, name),
+                             (lattice, results), kwargs)
+
+    def __submit(self, function: Callable, file_name: str, args: Tuple, kwargs: Dict) -> str:
+        self.__collect(self.max_pending - 1)
+        output_path = os.path.join(self.directory, file_name)
+        self.count += 1
+        self.paths.append(output_path)
+        payload = pickle.dumps((args, kwargs))
+        self.__pending.append(self.__pool.apply_async(render_job, ((function, output_path, payload),)))
+        return output_path
+
+    # Submits a job drawing the conformation of the lattice, see draw_protein_conformation()
+    def submit_conformation(self, lattice: ProteinLattice, temperature: float, name: str = 'conformation') -> str:
+        return self.submit(draw_protein_conformation, '{}_T{:.2f}'.format(name, temperature),
+                           lattice, temperature, lattice.hydrophobicity)
+
+    # Waits until at most max_pending jobs are left, raising the error of a failed job
+    def __collect(self, max_pending: int):
+        still_pending = []
+        for result in self.__pending:
+            if result.ready():
+                # Raises the error of the job, if it failed
+                result.get()
+            else:
+                still_pending.append(result)
+        self.__pending = still_pending
+        while len(self.__pending) > max(0, max_pending):
+            self.__pending.pop(0).get()
+
+    # Waits until all submitted jobs are rendered
+    def wait(self):
+        self.__collect(0)
+
+    # Waits until all submitted jobs are rendered and stops the worker processes
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self.__pool.close()
+            self.__pool.join()
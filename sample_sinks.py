@@ -0,0 +1,229 @@
+from typing import *
+import collections.abc
+import glob
+import os
+import numpy as np
+
+
+# Receives the energy and gyration radius samples taken by mmc().
+# The default MemorySampleSink keeps them in lists, the other sinks write them to disk as they come in,
+# so memory use stays bounded and progress can be followed on disk while a run is going.
+class SampleSink:
+    # Adds a single sample
+    def append(self, energy: float, gyration_radius: float):
+        raise NotImplementedError
+
+    # Adds multiple samples at once
+    def extend(self, energy: Sequence[float], gyration_radius: Sequence[float]):
+        for e, g in zip(energy, gyration_radius):
+            self.append(e, g)
+
+    # Makes sure all samples appended so far are stored
+    def flush(self):
+        pass
+
+    # Flushes and releases any open resources. The samples stay readable.
+    def close(self):
+        self.flush()
+
+    # Returns all energy samples so far
+    def get_energy(self) -> Sequence[float]:
+        raise NotImplementedError
+
+    # Returns all gyration radius samples so far
+    def get_gyration_radius(self) -> Sequence[float]:
+        raise NotImplementedError
+
+
+# Keeps the samples in memory as lists. This is the default of mmc().
+class MemorySampleSink(SampleSink):
+    def __init__(self):
+        self.energy: List[float] = []
+        self.gyration_radius: List[float] = []
+
+    def append(self, energy: float, gyration_radius: float):
+        self.energy.append(energy)
+        self.gyration_radius.append(gyration_radius)
+
+    def extend(self, energy: Sequence[float], gyration_radius: Sequence[float]):
+        self.energy.extend(energy)
+        self.gyration_radius.extend(gyration_radius)
+
+    def get_energy(self) -> List[float]:
+        return self.energy
+
+    def get_gyration_radius(self) -> List[float]:
+        return self.gyration_radius
+
+
+# Appends the samples to a binary file of float64 (energy, gyration_radius) pairs.
+# Samples are buffered and written every buffer_size samples.
+# The getters return memory-mapped views of the file, so reading the samples does not load them into memory.
+class MemmapSampleSink(SampleSink):
+    def __init__(self, path: str, buffer_size: int = 4096, append: bool = False):
+        self.path: str = path
+        self.buffer_size: int = buffer_size
+        self.__buffer: List[float] = []
+        self.__file = open(path, 'ab' if append else 'wb')
+
+    def append(self, energy: float, gyration_radius: float):
+        self.__buffer.append(energy)
+        self.__buffer.append(gyration_radius)
+        if len(self.__buffer) >= 2 * self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.__file is None:
+            return
+        if len(self.__buffer) != 0:
+            self.__file.write(np.array(self.__buffer, dtype=np.float64).tobytes())
+            self.__buffer = []
+        self.__file.flush()
+
+    def close(self):
+        self.flush()
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    # Returns the file as a memory-mapped (k, 2) array
+    def __map(self) -> np.ndarray:
+        self.flush()
+        if os.path.getsize(self.path) == 0:
+            return np.zeros((0, 2), dtype=np.float64)
+        return np.memmap(self.path, dtype=np.float64, mode='r').reshape(-1, 2)
+
+    def get_energy(self) -> np.ndarray:
+        return self.__map()[:, 0]
+
+    def get_gyration_radius(self) -> np.ndarray:
+        return self.__map()[:, 1]
+
+
+# Read-only sequence of one column ('energy' or 'gyration_radius') of .npz shards, see NpzShardSampleSink.
+# Only the shard holding the requested values is loaded, so the samples never need to fit in memory at once.
+# Slicing with step 1 gives another view, np.asarray() loads the values of the view into one array.
+class NpzShardColumn(collections.abc.Sequence):
+    def __init__(self, paths: List[str], lengths: List[int], name: str, start: int = 0, stop: Optional[int] = None):
+        self.paths: List[str] = paths
+        self.lengths: List[int] = lengths
+        self.name: str = name
+        # Index of the first value of every shard, followed by the total amount of values
+        self.offsets: np.ndarray = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        total = int(self.offsets[-1])
+        self.start: int = min(start, total)
+        self.stop: int = total if stop is None else max(self.start, min(stop, total))
+        # The shard loaded last, as (shard number, values)
+        self.__loaded: Tuple[int, Optional[np.ndarray]] = (-1, None)
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    # Returns the values of shard number shard, keeping only that shard in memory
+    def __shard(self, shard: int) -> np.ndarray:
+        if self.__loaded[0] != shard:
+            with np.load(self.paths[shard]) as data:
+                self.__loaded = (shard, data[self.name])
+        return self.__loaded[1]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step == 1:
+                return NpzShardColumn(self.paths, self.lengths, self.name, self.start + start, self.start + stop)
+            return np.asarray(self)[idx]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('Sample index out of range')
+        position = self.start + idx
+        shard = int(np.searchsorted(self.offsets, position, side='right')) - 1
+        return float(self.__shard(shard)[position - self.offsets[shard]])
+
+    # Iterates over the values one shard at a time
+    def __iter__(self) -> Iterator[float]:
+        for _, values in self.__shards():
+            yield from values.tolist()
+
+    # Yields (shard number, values of the view in it) for every shard the view overlaps
+    def __shards(self) -> Iterator[Tuple[int, np.ndarray]]:
+        for shard in range(0, len(self.paths)):
+            begin, end = int(self.offsets[shard]), int(self.offsets[shard + 1])
+            if end <= self.start or begin >= self.stop:
+                continue
+            values = self.__shard(shard)
+            yield shard, values[max(self.start, begin) - begin:min(self.stop, end) - begin]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        values = [values for _, values in self.__shards()]
+        array = np.concatenate(values) if len(values) != 0 else np.zeros(0, dtype=np.float64)
+        return array.astype(dtype) if dtype is not None else array
+
+    # Only the shard paths are pickled, not the loaded values
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_NpzShardColumn__loaded'] = (-1, None)
+        return state
+
+
+# Writes the samples as numbered .npz shards of shard_size samples into a directory.
+# Each shard holds an 'energy' and a 'gyration_radius' array.
+# Flushing writes the buffered samples as a (smaller) shard.
+# Shards already in the directory are removed, so a reused directory only holds the samples of this sink.
+# The getters return NpzShardColumn views that load one shard at a time.
+class NpzShardSampleSink(SampleSink):
+    def __init__(self, directory: str, shard_size: int = 100000):
+        self.directory: str = directory
+        self.shard_size: int = shard_size
+        self.shard_count: int = 0
+        # Paths and sample counts of the shards written
+        self.shard_paths: List[str] = []
+        self.shard_lengths: List[int] = []
+        self.__energy: List[float] = []
+        self.__gyration_radius: List[float] = []
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, 'shard_*.npz')):
+            os.remove(path)
+
+    def append(self, energy: float, gyration_radius: float):
+        self.__energy.append(energy)
+        self.__gyration_radius.append(gyration_radius)
+        if len(self.__energy) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.__energy) == 0:
+            return
+        path = os.path.join(self.directory, 'shard_{:06d}.npz'.format(self.shard_count))
+        np.savez(path,
+                 energy=np.array(self.__energy, dtype=np.float64),
+                 gyration_radius=np.array(self.__gyration_radius, dtype=np.float64))
+        self.shard_count += 1
+        self.shard_paths.append(path)
+        self.shard_lengths.append(len(self.__energy))
+        self.__energy = []
+        self.__gyration_radius = []
+
+    # Returns a view of one column of all shards written
+    def __column(self, name: str) -> NpzShardColumn:
+        self.flush()
+        return NpzShardColumn(self.shard_paths[:], self.shard_lengths[:], name)
+
+    def get_energy(self) -> NpzShardColumn:
+        return self.__column('energy')
+
+    def get_gyration_radius(self) -> NpzShardColumn:
+        return self.__column('gyration_radius')
+
+
+# Returns a sink factory for perform_mmc_simulated_annealing() writing one memory-mapped file per temperature step
+def memmap_sample_sinks(directory: str, buffer_size: int = 4096) -> Callable[[int, float], SampleSink]:
+    os.makedirs(directory, exist_ok=True)
+    return lambda step, temperature: MemmapSampleSink(os.path.join(directory, 'samples_{:04d}.bin'.format(step)),
+                                                      buffer_size=buffer_size)
+
+
+# Returns a sink factory for perform_mmc_simulated_annealing() writing one shard directory per temperature step
+def npz_shard_sample_sinks(directory: str, shard_size: int = 100000) -> Callable[[int, float], SampleSink]:
+    return lambda step, temperature: NpzShardSampleSink(os.path.join(directory, 'samples_{:04d}'.format(step)),
+                                                        shard_size=shard_size)
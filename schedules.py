@@ -0,0 +1,138 @@
+from online_statistics import OnlineStatistics
+from typing import *
+import math
+
+
+# Temperature schedules for perform_mmc_simulated_annealing().
+# A schedule gives the temperature and the amount of mmc iterations of every temperature step.
+# The annealer calls update() after every step, so a schedule can adapt the following steps to the samples.
+class AnnealingSchedule:
+    # Returns the temperature of step, out of temperature_steps steps from max_temp down to min_temp
+    def temperature(self, step: int, temperature_steps: int, max_temp: float, min_temp: float) -> float:
+        raise NotImplementedError
+
+    # Returns the amount of mmc iterations of step, out of temperature_steps steps
+    def iterations(self, step: int, temperature_steps: int, mmc_iterations_per_step: int) -> int:
+        return mmc_iterations_per_step
+
+    # Receives the statistics of the energy samples of a finished step
+    def update(self, step: int, temperature: float, energy: OnlineStatistics):
+        pass
+
+    # Returns the constructor parameters of the schedule, checkpoints are only resumed with equal parameters
+    def get_parameters(self) -> Tuple:
+        return ()
+
+    # Returns the state collected by update(), stored in checkpoints so a resumed run adapts the same way
+    def get_state(self):
+        return None
+
+    # Restores the state returned by get_state()
+    def set_state(self, state):
+        pass
+
+
+# Linear ramp from max_temp towards min_temp. This is the default of the annealer.
+class LinearSchedule(AnnealingSchedule):
+    def temperature(self, step: int, temperature_steps: int, max_temp: float, min_temp: float) -> float:
+        return max_temp - (((max_temp - min_temp) / temperature_steps) * step)
+
+
+# Geometric cooling, every step multiplies the temperature by the same factor.
+# Reaches min_temp at the last step, so min_temp must be larger than 0.
+class GeometricSchedule(AnnealingSchedule):
+    def temperature(self, step: int, temperature_steps: int, max_temp: float, min_temp: float) -> float:
+        assert min_temp > 0.0, 'Geometric schedule needs a minimum temperature larger than 0'
+        if temperature_steps == 1:
+            return max_temp
+        return max_temp * (min_temp / max_temp) ** (step / (temperature_steps - 1))
+
+
+# Logarithmic cooling: T = max_temp * log(2) / log(step + 2), not going below min_temp.
+# Cools slowly, steps are spent at the lower temperatures.
+class LogarithmicSchedule(AnnealingSchedule):
+    def temperature(self, step: int, temperature_steps: int, max_temp: float, min_temp: float) -> float:
+        return max(min_temp, max_temp * math.log(2) / math.log(step + 2))
+
+
+# Takes the temperatures from a function of (step, temperature_steps, max_temp, min_temp).
+class CallableSchedule(AnnealingSchedule):
+    def __init__(self, function: Callable[[int, int, float, float], float]):
+        self.function: Callable[[int, int, float, float], float] = function
+
+    def temperature(self, step: int, temperature_steps: int, max_temp: float, min_temp: float) -> float:
+        return self.function(step, temperature_steps, max_temp, min_temp)
+
+    def get_parameters(self) -> Tuple:
+        return getattr(self.function, '__module__', None), getattr(self.function, '__qualname__', None)
+
+
+# Uses the temperatures of the base schedule, but moves iterations to the steps around the peak of the heat capacity.
+# After every step the heat capacity of its samples is taken from the online energy statistics.
+# Every step gets a weight between min_factor and max_factor, in proportion to the change of the heat capacity
+# over the last two steps, relative to the larger of those two and the mean heat capacity so far.
+# Where the heat capacity is flat (above the transition, or once the chain is frozen) few iterations are spent,
+# while it rises towards or falls from its peak many are.
+# The iterations are shared out of a budget of temperature_steps * mmc_iterations_per_step: every step gets
+# its weight's share of the iterations left, assuming the remaining steps get the mean weight so far.
+# The last step gets what is left, so the total matches the budget and the schedule only moves effort around.
+# Only ratios of heat capacities are used, so the Boltzmann constant does not matter.
+class AdaptiveSchedule(AnnealingSchedule):
+    def __init__(self, base: Optional[AnnealingSchedule] = None,
+                 min_factor: float = 0.25,
+                 max_factor: float = 2.0):
+        self.base: AnnealingSchedule = base if base is not None else LinearSchedule()
+        self.min_factor: float = min_factor
+        self.max_factor: float = max_factor
+        # Heat capacity of every finished step
+        self.heat_capacities: List[float] = []
+        # Weight of every step handed out so far
+        self.weights: List[float] = []
+        # Iterations handed out so far
+        self.iterations_spent: int = 0
+
+    def temperature(self, step: int, temperature_steps: int, max_temp: float, min_temp: float) -> float:
+        return self.base.temperature(step, temperature_steps, max_temp, min_temp)
+
+    # Returns the weight of the next step, from the change of the heat capacity over the last two steps
+    def next_weight(self) -> float:
+        # Nothing is known before the first two steps, they get the mean weight.
+        if len(self.heat_capacities) < 2:
+            return (self.min_factor + self.max_factor) / 2.0 if len(self.weights) == 0 else \
+                sum(self.weights) / len(self.weights)
+
+        last, previous = self.heat_capacities[-1], self.heat_capacities[-2]
+        scale = max(last, previous, sum(self.heat_capacities) / len(self.heat_capacities))
+        fraction = min(1.0, abs(last - previous) / scale) if scale > 0.0 else 0.0
+        return self.min_factor + (self.max_factor - self.min_factor) * fraction
+
+    # Hands out the iterations of step, call once per step
+    def iterations(self, step: int, temperature_steps: int, mmc_iterations_per_step: int) -> int:
+        remaining = temperature_steps * mmc_iterations_per_step - self.iterations_spent
+        remaining_steps = max(1, temperature_steps - step)
+        weight = self.next_weight()
+        mean_weight = (sum(self.weights) + weight) / (len(self.weights) + 1)
+        share = weight / (weight + (remaining_steps - 1) * mean_weight)
+
+        iterations = max(1, int(round(remaining * share)))
+        self.weights.append(weight)
+        self.iterations_spent += iterations
+        return iterations
+
+    def update(self, step: int, temperature: float, energy: OnlineStatistics):
+        if energy.count < 2 or temperature <= 0.0:
+            self.heat_capacities.append(0.0)
+        else:
+            self.heat_capacities.append(energy.heat_capacity(temperature))
+
+    def get_parameters(self) -> Tuple:
+        return type(self.base).__name__, self.base.get_parameters(), self.min_factor, self.max_factor
+
+    def get_state(self):
+        return list(self.heat_capacities), list(self.weights), self.iterations_spent
+
+    def set_state(self, state):
+        heat_capacities, weights, iterations_spent = state
+        self.heat_capacities = list(heat_capacities)
+        self.weights = list(weights)
+        self.iterations_spent = iterations_spent
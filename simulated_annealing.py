@@ -1,4 +1,6 @@
 from benchmarking import *
+from checkpoints import *
+from schedules import *
 
 
 # Performs a simulated annealing procedure using the mmc function internally.
@@ -12,64 +14,178 @@ def perform_mmc_simulated_annealing(
         epsilon: float = 1.0,
         boltzmann: float = 1.0,
         randomize_seed: bool = True,  # Set a fresh seed before starting
-        store_lowest_lattice: bool = False) -> Tuple[Tuple[ProteinLattice, float, float],
-                                                     ProteinLattice,
-                                                     List[Tuple[float,
-                                                                List[float],
-                                                                List[float]]]]:
+        store_lowest_lattice: bool = True,
+        draw_conformation_plots: bool = True,  # Draw the initial and final conformation
+        verbose: bool = True,  # Print progress and statistics
+        backend: str = accelerated.BACKEND_PYTHON,  # mmc implementation, 'python' or 'numba'
+        rng: Optional[RandomStream] = None,  # Random number stream, randomize_seed is ignored if given
+        # Creates the sample sink for each (temperature step, temperature), samples are kept in memory if not given.
+        # See memmap_sample_sinks() and npz_shard_sample_sinks().
+        sink_factory: Optional[Callable[[int, float], SampleSink]] = None,
+        # trajectories.TrajectoryWriter recording the steps of all temperature steps as one trajectory.
+        # Closing it is left to the caller.
+        trajectory=None,
+        # Receives the lowest conformations over all temperature steps, one is kept if not given.
+        # Pass one with a larger capacity to keep the top-K.
+        lowest: Optional[LowestConformations] = None,
+        # Writes a checkpoint to this path after every checkpoint_frequency temperature steps, if given.
+        # Checkpoints are only written between temperature steps. With keep_samples, every checkpoint pickles
+        # all samples collected so far again, so it grows with the run.
+        checkpoint_path: Optional[str] = None,
+        checkpoint_frequency: int = 1,
+        # Continues from the checkpoint at this path, written by a run with the same schedule parameters.
+        # The run continues at the first temperature step after the checkpoint: a step that was interrupted
+        # is rerun from its start, not from the iteration it reached.
+        # The lattice, rng and randomize_seed arguments are ignored then, they are restored from the checkpoint.
+        # The trajectory is not part of the checkpoint.
+        resume_from: Optional[str] = None,
+        # Temperatures and iterations of the steps, see schedules.py. Linear from max_temp to min_temp if not given.
+        schedule: Optional[AnnealingSchedule] = None,
+        # Keep the samples in results. If not, results hold empty lists and only the online statistics are kept.
+        keep_samples: bool = True,
+        # Receives (temperature, energy_statistics, gyration_statistics) of every step, after discarding the first 10%
+        step_statistics: Optional[List[Tuple[float, OnlineStatistics, OnlineStatistics]]] = None,
+        # Relative probability of each MoveKind in mmc(), kink jumps and pivots half of the time each if not given
+        move_probabilities: Optional[Dict[MoveKind, float]] = None,
+        # Conformation cache shared by all temperature steps, see mmc(). Its hit rate is printed if verbose.
+        cache: Optional[ConformationCache] = None,
+        # Receives the distinct conformations visited at every temperature step, printed if verbose.
+        # Only supported by the 'python' backend, mmc() switches to it if given.
+        visited: Optional[VisitedStates] = None,
+        # rendering.RenderQueue that renders the conformation plots to files in a worker process.
+        # The plots are shown if not given. Closing it is left to the caller.
+        renderer=None
+) -> Tuple[Tuple[ProteinLattice, float, float],
+           ProteinLattice,
+           List[Tuple[float,
+                      List[float],
+                      List[float]]]]:
     # (final_temp, energy[], gyration[])
     results: List[Tuple[float, List[float], List[float]]] = []
+    if store_lowest_lattice and lowest is None:
+        lowest = LowestConformations()
+    if schedule is None:
+        schedule = LinearSchedule()
+    if step_statistics is None:
+        step_statistics = []
 
-    # Set seed for MMC
-    if randomize_seed:
-        seed()
+    parameters = (temperature_steps, mmc_iterations_per_step, max_temp, min_temp, sampling_frequency,
+                  epsilon, boltzmann, store_lowest_lattice, backend, type(schedule).__name__, schedule.get_parameters(),
+                  sorted(move_probabilities.items()) if move_probabilities is not None else None)
+    first_step = 0
+    if resume_from is None:
+        # Set up the random number stream for MMC, all temperature steps draw from the same stream.
+        if rng is None:
+            if randomize_seed:
+                seed()
+            rng = RandomStream.from_global_random()
 
-    # Keep track of best values observed.
-    lowest_lattice = lattice
-    lowest_lattice_energy: float = calculate_energy(epsilon, lattice)
-    lowest_temp: float = max_temp
+        # Keep track of best values observed.
+        lowest_lattice = lattice
+        lowest_lattice_energy, _ = calculate_energy_cached(epsilon, lattice, cache)
+        lowest_temp: float = max_temp
+    else:
+        # Restore the state between two temperature steps from the checkpoint
+        checkpoint = read_checkpoint(resume_from)
+        if checkpoint.parameters != parameters:
+            raise ValueError('Checkpoint was written by an annealing run with other parameters')
+        first_step = checkpoint.next_step
+        lattice = checkpoint.lattice
+        rng = checkpoint.rng
+        results = checkpoint.results
+        lowest_lattice = lattice
+        lowest_lattice_energy = checkpoint.lowest_lattice_energy
+        lowest_temp = checkpoint.lowest_temp
+        schedule.set_state(checkpoint.schedule_state)
+        step_statistics[:] = checkpoint.step_statistics
+        if store_lowest_lattice:
+            lowest.merge(checkpoint.lowest)
+        if verbose:
+            print('Resuming annealing at step {}/{}...'.format(first_step + 1, temperature_steps))
 
     # Temperature step per mmc step
-    for iteration in range(0, temperature_steps):
+    for iteration in range(first_step, temperature_steps):
         # Compute temperature
-        temperature = max_temp - (((max_temp - min_temp) / temperature_steps) * iteration)
-        print('Annealing at T: {:.2f}, {}/{}...'.format(temperature, iteration + 1, temperature_steps))
-
-        # Perform mmc at the given temperature
-        (lowest, lowest_energy), _, samples = mmc(temperature, mmc_iterations_per_step, sampling_frequency, lattice,
-                                                  draw_initial_conformation_plot=(iteration == 0),
-                                                  draw_resulting_conformation_plot=(iteration == temperature_steps - 1),
-                                                  epsilon=epsilon,
-                                                  boltzmann=boltzmann,
-                                                  store_lowest_lattice=store_lowest_lattice)
-
-        # Store new lattice as lowest if a lower lattice has been encountered
-        if store_lowest_lattice and lowest_energy < lowest_lattice_energy:
-            lowest_lattice = copy.deepcopy(lowest)
-            lowest_lattice_energy = lowest_energy
+        temperature = schedule.temperature(iteration, temperature_steps, max_temp, min_temp)
+        if verbose:
+            print('Annealing at T: {:.2f}, {}/{}...'.format(temperature, iteration + 1, temperature_steps))
+
+        # Perform mmc at the given temperature.
+        # The statistics of the samples are kept online, skipping the same first 10% as the results.
+        iterations = schedule.iterations(iteration, temperature_steps, mmc_iterations_per_step)
+        inner_sink = sink_factory(iteration, temperature) if sink_factory is not None else None
+        if inner_sink is None and keep_samples:
+            inner_sink = MemorySampleSink()
+        sink = StatisticsSampleSink(inner_sink, discard=discarded_sample_count(iterations // sampling_frequency + 1))
+        _, _, samples = mmc(temperature, iterations, sampling_frequency, lattice,
+                            draw_initial_conformation_plot=(
+                                    draw_conformation_plots and iteration == 0),
+                            draw_resulting_conformation_plot=(
+                                    draw_conformation_plots and
+                                    iteration == temperature_steps - 1),
+                            epsilon=epsilon,
+                            boltzmann=boltzmann,
+                            store_lowest_lattice=store_lowest_lattice,
+                            backend=backend,
+                            rng=rng,
+                            sink=sink,
+                            trajectory=trajectory,
+                            lowest=lowest,
+                            move_probabilities=move_probabilities,
+                            cache=cache,
+                            visited=visited,
+                            renderer=renderer)
+        sink.close()
+
+        # Print how many of the attempted moves were wasted at this temperature
+        if verbose:
+            print('Moves at T: {:.2f}: {}'.format(temperature, samples.move_statistics))
+            if visited is not None:
+                print('Distinct conformations at T: {:.2f}: {}'.format(temperature,
+                                                                       visited.distinct_count(temperature)))
+
+        # Remember the temperature if a lower lattice has been encountered.
+        # The lattice itself is built once, after the last temperature step.
+        if store_lowest_lattice and lowest.lowest_energy < lowest_lattice_energy:
+            lowest_lattice_energy = lowest.lowest_energy
             lowest_temp = temperature
 
         # Generate results, discarding first 10%
         # (final_temp, energy[], gyration[])
         results.append((temperature, discard_fraction_of_array(samples.energy),
                         discard_fraction_of_array(samples.gyration_radius)))
+        step_statistics.append((temperature, sink.energy, sink.gyration_radius))
+        schedule.update(iteration, temperature, sink.energy)
+
+        # Save the state for resuming after this temperature step
+        if checkpoint_path is not None and ((iteration + 1) % checkpoint_frequency == 0 or
+                                            iteration == temperature_steps - 1):
+            write_checkpoint(checkpoint_path, AnnealingCheckpoint(parameters, iteration + 1, lattice, rng, results,
+                                                                  lowest, lowest_lattice_energy, lowest_temp,
+                                                                  schedule.get_state(), step_statistics))
+
+    if store_lowest_lattice and len(lowest) != 0:
+        lowest_lattice = lowest.get_lattice(0, type(lattice))
+
+    if not verbose:
+        return (lowest_lattice, lowest_lattice_energy, lowest_temp), lattice, results
 
     # Compute and print some statistics
     print('Annealing at T: {:.2f}, {}/{}... done.'.format(min_temp, temperature_steps, temperature_steps))
-    print('Final energy: {}'.format(calculate_energy(epsilon, lattice)))
-    all_energy = [val
-                  for result_set in results
-                  for val in result_set[1]]
-
-    all_gyration = [val
-                    for result_set in results
-                    for val in result_set[2]]
+    print('Final energy: {}'.format(calculate_energy_cached(epsilon, lattice, cache)[0]))
+    if cache is not None:
+        print('Conformation cache: {}'.format(cache))
+    all_energy = OnlineStatistics()
+    all_gyration = OnlineStatistics()
+    for _, energy_statistics, gyration_statistics in step_statistics:
+        all_energy.merge(energy_statistics)
+        all_gyration.merge(gyration_statistics)
 
-    print('Lowest energy state found: {:.2f}'.format(min(all_energy)))
-    print('Mean energy state: {:.2f}'.format(mean(all_energy)))
+    print('Lowest energy state found: {:.2f}'.format(all_energy.minimum))
+    print('Mean energy state: {:.2f}'.format(all_energy.mean))
 
-    print('Lowest gyration radius found: {:.2f}'.format(min(all_gyration)))
-    print('Mean gyration radius: {:.2f}'.format(mean(all_gyration)))
+    print('Lowest gyration radius found: {:.2f}'.format(all_gyration.minimum))
+    print('Mean gyration radius: {:.2f}'.format(all_gyration.mean))
 
     print('Resulting protein: ')
     print(lattice.chain)
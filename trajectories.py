@@ -0,0 +1,199 @@
+from classes import *
+import os
+import numpy as np
+
+# Binary trajectory files.
+# A trajectory stores the conformations visited by mmc() without storing every frame:
+# a header with the monomer kinds and the initial positions, followed by one fixed size step record per iteration.
+#
+# Layout (little endian):
+# - Header: magic b'HPTRAJ01', chain length (uint32), hydrophobicity (float64),
+#   kinds (int8 per monomer), initial positions (int32 x, y per monomer).
+# - Step records of TRAJECTORY_STEP_DTYPE, one per iteration:
+#   move: one of the TRAJECTORY_MOVE_ values below
+#   index: the moved monomer (kink jump / endpoint rotation / pull move), the pivot point,
+#   or the first of the two monomers of a crankshaft move
+#   a, b: the offset (dx, dy) of a kink jump / endpoint rotation / crankshaft move,
+#   the PivotSymmetry and MonomerPart of a pivot,
+#   or the MonomerPart and 4 * c_direction + l_direction of a pull move
+#
+# Frame 0 is the initial conformation, frame k is the conformation after k steps.
+
+TRAJECTORY_MAGIC = b'HPTRAJ01'
+
+# Step was rejected or undone, the conformation stays the same.
+TRAJECTORY_MOVE_NONE = 0
+# Kink jump or endpoint rotation of a single monomer.
+TRAJECTORY_MOVE_KINK = 1
+# Pivot of one part of the chain.
+TRAJECTORY_MOVE_PIVOT = 2
+# Crankshaft move, both monomers move by the same offset.
+TRAJECTORY_MOVE_CRANKSHAFT = 3
+# Pull move, the monomers that follow are found again while replaying.
+TRAJECTORY_MOVE_PULL = 4
+
+TRAJECTORY_STEP_DTYPE = np.dtype([('move', 'u1'), ('a', 'i1'), ('b', 'i1'), ('index', '<u4')])
+
+
+# Returns the size in bytes of the header for a chain of the given length
+def trajectory_header_size(length: int) -> int:
+    return len(TRAJECTORY_MAGIC) + 4 + 8 + length + 8 * length
+
+
+# Writes the steps of one or more consecutive mmc() runs to a trajectory file.
+# Pass it to mmc() or perform_mmc_simulated_annealing() as trajectory.
+# The header is written from the lattice of the first run, later runs must continue from where the last one ended.
+# Steps are buffered and written every buffer_size steps.
+class TrajectoryWriter:
+    def __init__(self, path: str, buffer_size: int = 4096):
+        self.path: str = path
+        self.buffer_size: int = buffer_size
+        self.step_count: int = 0
+        self.__file = open(path, 'wb')
+        self.__started: bool = False
+        self.__buffer: List[Tuple[int, int, int, int]] = []
+        # Move made by the current step, written by write_step() if it is accepted.
+        self.__pending: Tuple[int, int, int, int] = (TRAJECTORY_MOVE_NONE, 0, 0, 0)
+
+    # Writes the header from the initial conformation. Does nothing if the trajectory was started already.
+    def start(self, lattice: ProteinLattice):
+        if self.__started:
+            return
+        self.__started = True
+        length = len(lattice)
+        self.__file.write(TRAJECTORY_MAGIC)
+        self.__file.write(np.array([length], dtype='<u4').tobytes())
+        self.__file.write(np.array([lattice.hydrophobicity], dtype='<f8').tobytes())
+        self.__file.write(np.array([int(lattice.get_kind(idx)) for idx in range(0, length)], dtype='i1').tobytes())
+        self.__file.write(lattice.get_positions(0, length).astype('<i4').tobytes())
+
+    # Remembers a kink jump / endpoint rotation of monomer idx by (dx, dy) as the move of the current step
+    def stage_kink_jump(self, idx: int, dx: int, dy: int):
+        self.__pending = (TRAJECTORY_MOVE_KINK, dx, dy, idx)
+
+    # Remembers a pivot as the move of the current step
+    def stage_pivot(self, rotation_point_idx: int, symmetry: PivotSymmetry, part: MonomerPart):
+        self.__pending = (TRAJECTORY_MOVE_PIVOT, int(symmetry), int(part), rotation_point_idx)
+
+    # Remembers a crankshaft move of monomers idx and idx + 1 by (dx, dy) as the move of the current step
+    def stage_crankshaft(self, idx: int, dx: int, dy: int):
+        self.__pending = (TRAJECTORY_MOVE_CRANKSHAFT, dx, dy, idx)
+
+    # Remembers a pull move as the move of the current step, see computation.perform_pull_move()
+    def stage_pull_move(self, idx: int, part: MonomerPart, c_direction: int, l_direction: int):
+        self.__pending = (TRAJECTORY_MOVE_PULL, int(part), 4 * c_direction + l_direction, idx)
+
+    # Ends the current step, writing the staged move if it was accepted or an empty step if not
+    def write_step(self, accepted: bool):
+        self.__buffer.append(self.__pending if accepted else (TRAJECTORY_MOVE_NONE, 0, 0, 0))
+        self.__pending = (TRAJECTORY_MOVE_NONE, 0, 0, 0)
+        self.step_count += 1
+        if len(self.__buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.__file is None:
+            return
+        if len(self.__buffer) != 0:
+            self.__file.write(np.array(self.__buffer, dtype=TRAJECTORY_STEP_DTYPE).tobytes())
+            self.__buffer = []
+        self.__file.flush()
+
+    def close(self):
+        self.flush()
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+
+# Reads a trajectory file written by TrajectoryWriter.
+# The steps are memory-mapped, any frame is rebuilt by replaying the steps from the nearest earlier keyframe.
+# Keyframes are stored every keyframe_interval frames while replaying, so seeking back and forth stays cheap.
+class TrajectoryReader:
+    def __init__(self, path: str, keyframe_interval: int = 1024):
+        self.path: str = path
+        self.keyframe_interval: int = keyframe_interval
+
+        with open(path, 'rb') as file:
+            magic = file.read(len(TRAJECTORY_MAGIC))
+            assert magic == TRAJECTORY_MAGIC, 'Not a trajectory file: {}'.format(path)
+            length = int(np.frombuffer(file.read(4), dtype='<u4')[0])
+            self.hydrophobicity: float = float(np.frombuffer(file.read(8), dtype='<f8')[0])
+            self.kinds: List[MonomerKind] = [MonomerKind(kind) for kind in
+                                             np.frombuffer(file.read(length), dtype='i1').tolist()]
+            initial_positions = np.frombuffer(file.read(8 * length), dtype='<i4').reshape(length, 2)
+
+        header_size = trajectory_header_size(length)
+        step_count = (os.path.getsize(path) - header_size) // TRAJECTORY_STEP_DTYPE.itemsize
+        if step_count > 0:
+            self.steps: np.ndarray = np.memmap(path, dtype=TRAJECTORY_STEP_DTYPE, mode='r',
+                                               offset=header_size, shape=(step_count,))
+        else:
+            self.steps: np.ndarray = np.zeros(0, dtype=TRAJECTORY_STEP_DTYPE)
+
+        # Keyframe number -> positions at frame keyframe_number * keyframe_interval
+        self.__keyframes: Dict[int, np.ndarray] = {0: initial_positions.astype(np.int64)}
+
+    # Amount of frames, including the initial conformation
+    def __len__(self) -> int:
+        return len(self.steps) + 1
+
+    # Applies the step to the positions, in place
+    @staticmethod
+    def apply_step(positions: np.ndarray, move: int, a: int, b: int, index: int):
+        if move == TRAJECTORY_MOVE_KINK:
+            positions[index, 0] += a
+            positions[index, 1] += b
+        elif move == TRAJECTORY_MOVE_PIVOT:
+            if b == MonomerPart.Left:
+                start, end = 0, index
+            else:
+                start, end = index + 1, len(positions)
+            pivot = positions[index].copy()
+            positions[start:end] = (positions[start:end] - pivot) @ PIVOT_SYMMETRY_MATRICES[a] + pivot
+        elif move == TRAJECTORY_MOVE_CRANKSHAFT:
+            positions[index:index + 2] += (a, b)
+        elif move == TRAJECTORY_MOVE_PULL:
+            new_positions = pull_move_positions(lambda idx: (positions.item(idx, 0), positions.item(idx, 1)),
+                                                len(positions), index, MonomerPart(a), b // 4, b % 4)
+            for idx, position in new_positions:
+                positions[idx] = position
+
+    # Returns the positions of the frame as an (N, 2) array
+    def get_positions(self, frame: int) -> np.ndarray:
+        assert 0 <= frame < len(self), 'Frame {} out of range'.format(frame)
+        keyframe = frame // self.keyframe_interval
+        while keyframe not in self.__keyframes:
+            keyframe -= 1
+
+        positions = self.__keyframes[keyframe].copy()
+        current = keyframe * self.keyframe_interval
+        steps = self.steps[current:frame].tolist()
+        for move, a, b, index in steps:
+            self.apply_step(positions, move, a, b, index)
+            current += 1
+            if current % self.keyframe_interval == 0:
+                self.__keyframes[current // self.keyframe_interval] = positions.copy()
+        return positions
+
+    # Returns the conformation of the frame as a lattice of the given type
+    def get_lattice(self, frame: int, lattice_type: Type = ProteinLattice) -> ProteinLattice:
+        return lattice_type([Monomer(kind, x, y) for kind, (x, y) in zip(self.kinds,
+                                                                           self.get_positions(frame).tolist())],
+                            self.hydrophobicity)
+
+    # Yields the positions of the frames start up to end (exclusive, defaults to the last frame) every stride frames.
+    # Replays the steps once, instead of seeking every frame.
+    # The yielded array is updated in place by the next frame, copy it to keep it.
+    def replay(self, start: int = 0, end: Optional[int] = None, stride: int = 1) -> Iterator[np.ndarray]:
+        if end is None:
+            end = len(self)
+        if start >= end:
+            return
+        positions = self.get_positions(start)
+        yield positions
+        steps = self.steps[start:end - 1].tolist()
+        for offset, (move, a, b, index) in enumerate(steps, 1):
+            self.apply_step(positions, move, a, b, index)
+            if offset % stride == 0:
+                yield positions
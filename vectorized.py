@@ -0,0 +1,195 @@
+from computation import *
+
+
+# Vectorized Metropolis Monte Carlo engine.
+# Advances M independent chains of the same length N in lock-step, stored as stacked NumPy arrays.
+# Every iteration proposes one move for every chain at once, checks self avoidance and computes the energy
+# with array operations and accepts or rejects per chain with a Metropolis mask.
+#
+# Differences with mmc():
+# - A kink jump picks a random index and is rejected (the chain stays as it is) when no kink jump
+#   is possible there, instead of searching for an index where it is possible.
+# - An endpoint rotation picks one of its two positions at random.
+# These are valid Metropolis moves as well, they only waste some iterations on impossible moves.
+
+
+# M chains of the same length, stored as arrays.
+class VectorizedChains:
+    def __init__(self, lattices: List[ProteinLattice]):
+        length = len(lattices[0])
+        assert all(len(lattice) == length for lattice in lattices), 'All chains must have the same length'
+
+        self.hydrophobicities: List[float] = [lattice.hydrophobicity for lattice in lattices]
+        # Positions, shape (M, N, 2)
+        self.positions: np.ndarray = np.stack([lattice.get_positions(0, length) for lattice in lattices])
+        # Monomer kinds, shape (M, N)
+        self.kinds: np.ndarray = np.array([[int(lattice.get_kind(idx)) for idx in range(0, length)]
+                                           for lattice in lattices], dtype=np.int8)
+
+    # Returns the chains as ProteinLattice objects
+    def to_lattices(self) -> List[ProteinLattice]:
+        return [ProteinLattice([Monomer(MonomerKind(int(kind)), x, y)
+                                for kind, (x, y) in zip(kinds.tolist(), positions.tolist())],
+                               hydrophobicity)
+                for kinds, positions, hydrophobicity in zip(self.kinds, self.positions, self.hydrophobicities)]
+
+
+# Returns keys that are unique per (chain, position) for the given (M, N, 2) positions.
+# Positions are taken relative to the first monomer of each chain, extended by margin on each side.
+# Returns a tuple: (keys, width) where width is the key distance between neighbouring y positions.
+def vectorized_position_keys(positions: np.ndarray, margin: int = 0) -> Tuple[np.ndarray, int]:
+    chain_count, length, _ = positions.shape
+    relative = positions - positions[:, :1, :]
+    offset = length + margin
+    width = 2 * offset + 1
+    rows = np.arange(0, chain_count, dtype=np.int64)[:, None]
+    keys = rows * width * width + (relative[:, :, 0] + offset) * width + (relative[:, :, 1] + offset)
+    return keys, width
+
+
+# Returns for each of the M chains whether it is self avoiding, shape (M,)
+def vectorized_is_self_avoiding(positions: np.ndarray) -> np.ndarray:
+    keys, _ = vectorized_position_keys(positions)
+    keys = np.sort(keys, axis=1)
+    return ~np.any(keys[:, 1:] == keys[:, :-1], axis=1)
+
+
+# Returns the amount of H-H contacts for each of the M chains, shape (M,)
+# Counted the same way as calculate_energy(): every H monomer counts its H neighbours, then halved.
+def vectorized_contact_counts(positions: np.ndarray, kinds: np.ndarray) -> np.ndarray:
+    keys, width = vectorized_position_keys(positions, margin=1)
+    flat_keys = keys.ravel()
+    order = np.argsort(flat_keys)
+    sorted_keys = flat_keys[order]
+    flat_is_h = (kinds == MonomerKind.H).ravel()
+    is_h = kinds == MonomerKind.H
+
+    counts = np.zeros(positions.shape[0], dtype=np.int64)
+    for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        neighbour_keys = keys + dx * width + dy
+        found_at = np.minimum(np.searchsorted(sorted_keys, neighbour_keys), len(sorted_keys) - 1)
+        found = sorted_keys[found_at] == neighbour_keys
+        counts += np.sum(found & is_h & flat_is_h[order[found_at]], axis=1)
+    return counts // 2
+
+
+# Returns the radius of gyration for each of the M chains, shape (M,)
+# Same definition as ProteinLattice.compute_gyration_radius()
+def vectorized_gyration_radii(positions: np.ndarray) -> np.ndarray:
+    length = positions.shape[1]
+    center = (positions.min(axis=1) + positions.max(axis=1)) / 2.0
+    sum_of_squares = np.sum((positions - center[:, None, :]) ** 2, axis=(1, 2))
+    return np.sqrt(sum_of_squares / length / length)
+
+
+# Proposes a kink jump or endpoint rotation for every chain at a random index.
+# Returns a tuple: (new_positions, possible) where possible is False for chains where the move is not possible.
+def vectorized_propose_kink_jumps(positions: np.ndarray, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    chain_count, length, _ = positions.shape
+    rows = np.arange(0, chain_count)
+    idx = rng.integers(0, length, chain_count)
+    prev_pos = positions[rows, np.where(idx == 0, 1, idx - 1)]
+    next_pos = positions[rows, np.where(idx == length - 1, length - 2, idx + 1)]
+    current = positions[rows, idx]
+
+    # Kink jump: the previous and next monomer must form a corner, the monomer jumps to the opposite corner.
+    kink_target = prev_pos + next_pos - current
+    is_corner = np.all(np.abs(prev_pos - next_pos) == 1, axis=1)
+
+    # Endpoint rotation: move to one of the positions beside the neighbouring monomer.
+    is_endpoint = (idx == 0) | (idx == length - 1)
+    neighbour = np.where((idx == 0)[:, None], next_pos, prev_pos)
+    bond = current - neighbour
+    sign = rng.choice(np.array([-1, 1]), chain_count)[:, None]
+    endpoint_target = neighbour + np.stack([bond[:, 1], -bond[:, 0]], axis=1) * sign
+
+    new_positions = positions.copy()
+    new_positions[rows, idx] = np.where(is_endpoint[:, None], endpoint_target, kink_target)
+    return new_positions, is_endpoint | is_corner
+
+
+# Proposes a pivot with a random point, lattice symmetry and part for every chain.
+# Returns a tuple: (new_positions, possible) where possible is False for chains where nothing is moved.
+def vectorized_propose_pivots(positions: np.ndarray, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    chain_count, length, _ = positions.shape
+    rows = np.arange(0, chain_count)
+    pivot_idx = rng.integers(0, length, chain_count)
+    matrices = PIVOT_SYMMETRY_MATRICES[rng.integers(0, len(PIVOT_SYMMETRY_MATRICES), chain_count)]
+    part = rng.integers(0, 2, chain_count)
+
+    indices = np.arange(0, length)[None, :]
+    moved = np.where((part == MonomerPart.Left)[:, None], indices < pivot_idx[:, None], indices > pivot_idx[:, None])
+
+    pivot = positions[rows, pivot_idx][:, None, :]
+    rotated = np.einsum('mnk,mkl->mnl', positions - pivot, matrices) + pivot
+    return np.where(moved[:, :, None], rotated, positions), np.any(moved, axis=1)
+
+
+# Performs the MMC simulation for all chains at once.
+# temperature is either one value or one value per chain.
+# Returns a tuple: ( result_chains, samples_per_chain )
+def mmc_vectorized(temperature: Union[float, np.ndarray],  # Temperature parameter
+                   max_iterations: int,  # Iterations to do
+                   sampling_frequency: int,  # Frequency at which needs to be sampled
+                   chains: VectorizedChains,  # Chains that need to be operated on, modified in place
+                   epsilon: float = 1.0,  # Epsilon
+                   boltzmann: float = 1.0,  # Boltzmann weight
+                   rng: Optional[np.random.Generator] = None) -> Tuple[VectorizedChains, List[MMCSamples]]:
+    if rng is None:
+        rng = np.random.default_rng()
+
+    chain_count = chains.positions.shape[0]
+    temperatures = np.broadcast_to(np.asarray(temperature, dtype=float), (chain_count,))
+    rows = np.arange(0, chain_count)
+
+    statistics = np.zeros((6, chain_count), dtype=np.int64)
+    # Rows of statistics, same counters as MoveStatistics
+    pivot_attempted, pivot_rejected, pivot_accepted, kink_attempted, kink_rejected, kink_accepted = range(0, 6)
+
+    # Take initial samples
+    energy = -1.0 * epsilon * vectorized_contact_counts(chains.positions, chains.kinds)
+    energy_samples = [energy]
+    gyration_samples = [vectorized_gyration_radii(chains.positions)]
+
+    for iteration in range(0, max_iterations):
+        # Choose operation per chain and propose both kinds of moves
+        is_kink = rng.integers(0, 2, chain_count) == 0
+        kink_positions, kink_possible = vectorized_propose_kink_jumps(chains.positions, rng)
+        pivot_positions, pivot_possible = vectorized_propose_pivots(chains.positions, rng)
+        new_positions = np.where(is_kink[:, None, None], kink_positions, pivot_positions)
+        possible = np.where(is_kink, kink_possible, pivot_possible)
+        possible &= vectorized_is_self_avoiding(new_positions)
+
+        # Metropolis acceptance per chain
+        new_energy = -1.0 * epsilon * vectorized_contact_counts(new_positions, chains.kinds)
+        with np.errstate(over='ignore'):
+            w = np.exp(-(new_energy - energy) / (boltzmann * temperatures))
+        accepted = possible & ((new_energy < energy) | (w > rng.random(chain_count)))
+
+        chains.positions[accepted] = new_positions[accepted]
+        energy = np.where(accepted, new_energy, energy)
+
+        statistics[kink_attempted] += is_kink
+        statistics[kink_rejected] += is_kink & ~possible
+        statistics[kink_accepted] += is_kink & accepted
+        statistics[pivot_attempted] += ~is_kink
+        statistics[pivot_rejected] += ~is_kink & ~possible
+        statistics[pivot_accepted] += ~is_kink & accepted
+
+        # Sample the energy and gyration
+        if (iteration + 1) % sampling_frequency == 0:
+            energy_samples.append(energy)
+            gyration_samples.append(vectorized_gyration_radii(chains.positions))
+
+    # Split the samples per chain
+    energy_samples = np.stack(energy_samples, axis=1)
+    gyration_samples = np.stack(gyration_samples, axis=1)
+    samples = []
+    for i in rows:
+        move_statistics = MoveStatistics()
+        (move_statistics.pivot_attempted, move_statistics.pivot_rejected, move_statistics.pivot_accepted,
+         move_statistics.kink_attempted, move_statistics.kink_rejected, move_statistics.kink_accepted) = \
+            statistics[:, i].tolist()
+        samples.append(MMCSamples(energy_samples[i].tolist(), gyration_samples[i].tolist(), move_statistics))
+
+    return chains, samples
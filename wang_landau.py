@@ -0,0 +1,160 @@
+from computation import *
+
+
+# Moves used by perform_wang_landau_sampling() by default.
+# Pull moves reach the compact low energy conformations, pivots the extended high energy ones.
+# Kink jumps are picked from the possible ones only, so they are not proposed as often as their reverse
+# and bias the estimate.
+WANG_LANDAU_MOVE_PROBABILITIES: Dict[MoveKind, float] = {MoveKind.Pivot: 1.0, MoveKind.Pull: 1.0}
+
+
+# Density of states g(E) of a chain, as estimated by perform_wang_landau_sampling().
+# Averages at any temperature follow from it by reweighting the energy levels with their Boltzmann factor:
+# <A>(T) = sum(A(E) * g(E) * exp(-E / kT)) / sum(g(E) * exp(-E / kT))
+# Only the ratios of g(E) are known, so ln_g is relative to the highest energy level.
+class DensityOfStates:
+    def __init__(self, energies: np.ndarray, ln_g: np.ndarray, gyration_radii: np.ndarray, boltzmann: float = 1.0):
+        # Energy levels, lowest first
+        self.energies: np.ndarray = energies
+        # Natural logarithm of the density of states of every energy level
+        self.ln_g: np.ndarray = ln_g
+        # Mean radius of gyration of the conformations at every energy level
+        self.gyration_radii: np.ndarray = gyration_radii
+        self.boltzmann: float = boltzmann
+
+    # Returns the probability of every energy level at the temperature.
+    # Computed from the logarithms shifted by their maximum, so g(E) itself never needs to fit in a float.
+    def probabilities(self, temperature: float) -> np.ndarray:
+        ln_weights = self.ln_g - self.energies / (self.boltzmann * temperature)
+        weights = np.exp(ln_weights - ln_weights.max())
+        return weights / weights.sum()
+
+    # Returns the mean energy at the temperature
+    def mean_energy(self, temperature: float) -> float:
+        return float(np.dot(self.probabilities(temperature), self.energies))
+
+    # Returns the heat capacity at the temperature, same definition as compute_heat_capacity()
+    def heat_capacity(self, temperature: float) -> float:
+        probabilities = self.probabilities(temperature)
+        mean = np.dot(probabilities, self.energies)
+        variance = np.dot(probabilities, (self.energies - mean) ** 2)
+        return float(variance) / (self.boltzmann * temperature)
+
+    # Returns the mean radius of gyration at the temperature.
+    # Levels without a radius of gyration (NaN) are left out, the probabilities of the others are renormalized.
+    def mean_gyration_radius(self, temperature: float) -> float:
+        known = ~np.isnan(self.gyration_radii)
+        if not np.any(known):
+            return math.nan
+        probabilities = self.probabilities(temperature)[known]
+        return float(np.dot(probabilities, self.gyration_radii[known]) / probabilities.sum())
+
+    # Returns (temperature, mean energy, heat capacity, mean gyration radius) for every temperature
+    def thermodynamics(self, temperatures: Iterable[float]) -> List[Tuple[float, float, float, float]]:
+        return [(temperature, self.mean_energy(temperature), self.heat_capacity(temperature),
+                 self.mean_gyration_radius(temperature)) for temperature in temperatures]
+
+
+# Estimates the density of states of the chain with Wang-Landau sampling, in a single run for all temperatures.
+# Moves are accepted with probability min(1, g(E_old) / g(E_new)) and every visit of an energy level
+# multiplies its g(E) by the modification factor f. Once the histogram of visits is flat,
+# meaning every level was visited at least flatness times the mean amount, f is reduced to sqrt(f)
+# and the histogram starts over. The run ends when ln(f) drops below final_ln_modification_factor.
+# Energy levels are added as they are found, starting at the lowest g(E) so far.
+# Moves that are not possible count as rejected, so pivots are attempted once instead of until one succeeds.
+# The radius of gyration is averaged per energy level over the last flat histogram.
+# Levels that were not part of a flat histogram yet use their visits since then, if any.
+# Modifies the given lattice!
+def perform_wang_landau_sampling(
+        lattice: ProteinLattice,
+        epsilon: float = 1.0,
+        boltzmann: float = 1.0,
+        flatness: float = 0.8,  # Fraction of the mean visits every energy level needs for a flat histogram
+        final_ln_modification_factor: float = 1e-6,  # ln(f) to stop at, smaller values give a more accurate g(E)
+        check_frequency: int = 10000,  # Iterations between checks of the histogram
+        max_iterations: Optional[int] = None,  # Stop after this many iterations, even if g(E) did not converge
+        # Relative probability of each MoveKind, see mmc()
+        move_probabilities: Dict[MoveKind, float] = WANG_LANDAU_MOVE_PROBABILITIES,
+        randomize_seed: bool = True,  # Set a fresh seed before starting
+        rng: Optional[RandomStream] = None,  # Random number stream, randomize_seed is ignored if given
+        # Receives the lowest conformations visited, if given
+        lowest: Optional[LowestConformations] = None,
+        verbose: bool = True  # Print progress and statistics
+) -> DensityOfStates:
+    if rng is None:
+        if randomize_seed:
+            seed()
+        rng = RandomStream.from_global_random()
+    move_kinds, move_cumulative = cumulative_move_probabilities(move_probabilities)
+    statistics = MoveStatistics()
+
+    # All values are kept per contact count, the energy is -epsilon * contact count.
+    contacts = lattice.contact_count
+    ln_g: Dict[int, float] = {contacts: 0.0}
+    histogram: Dict[int, int] = {contacts: 0}
+    gyration_sums: Dict[int, float] = {contacts: 0.0}
+    # Mean radius of gyration of every level over the last flat histogram
+    flat_gyration_radii: Dict[int, float] = {}
+    if lowest is not None:
+        lowest.offer(calculate_energy_incremental(epsilon, lattice), lattice)
+
+    ln_f = 1.0
+    iteration = 0
+    while ln_f > final_ln_modification_factor:
+        if max_iterations is not None and iteration >= max_iterations:
+            if verbose:
+                print('Wang-Landau stopped after {} iterations at ln(f): {:.2e}'.format(iteration, ln_f))
+            break
+
+        for _ in range(0, check_frequency):
+            operation_kind = pick_move_kind(rng, move_kinds, move_cumulative)
+            operation_kind, accepted = mmc_attempt_move(operation_kind, lattice, statistics=statistics, rng=rng,
+                                                         single_pivot_attempt=True)
+            if accepted:
+                new_contacts = lattice.contact_count
+                if new_contacts not in ln_g:
+                    ln_g[new_contacts] = min(ln_g.values())
+                    histogram[new_contacts] = 0
+                    gyration_sums[new_contacts] = 0.0
+                # Accept with probability min(1, g(E_old) / g(E_new))
+                ln_ratio = ln_g[contacts] - ln_g[new_contacts]
+                if ln_ratio < 0.0 and math.exp(ln_ratio) <= rng.random():
+                    lattice.undo_last_change()
+                    accepted = False
+                else:
+                    contacts = new_contacts
+
+            if accepted:
+                statistics.count_accepted(operation_kind)
+                if lowest is not None and lowest.is_candidate(-1.0 * epsilon * float(contacts)):
+                    lowest.offer(-1.0 * epsilon * float(contacts), lattice)
+
+            ln_g[contacts] += ln_f
+            histogram[contacts] += 1
+            gyration_sums[contacts] += lattice.compute_gyration_radius()
+        iteration += check_frequency
+
+        visits = list(histogram.values())
+        if min(visits) >= flatness * sum(visits) / len(visits):
+            if verbose:
+                print('Wang-Landau histogram flat at ln(f): {:.2e} after {} iterations, {} energy levels'.format(
+                    ln_f, iteration, len(visits)))
+            ln_f /= 2.0
+            # The radius of gyration of the last flat histogram is kept
+            flat_gyration_radii = {level: gyration_sums[level] / histogram[level] for level in histogram
+                                   if histogram[level] != 0}
+            histogram = {level: 0 for level in histogram}
+            gyration_sums = {level: 0.0 for level in gyration_sums}
+
+    if verbose:
+        print('Moves: {}'.format(statistics))
+
+    # Lowest energy (most contacts) first, levels without any visits counted have no radius of gyration (NaN).
+    levels = sorted(ln_g, reverse=True)
+    ln_g_values = np.array([ln_g[level] for level in levels], dtype=np.float64)
+    return DensityOfStates(np.array([-1.0 * epsilon * float(level) for level in levels], dtype=np.float64),
+                           ln_g_values - ln_g_values[-1],
+                           np.array([flat_gyration_radii[level] if level in flat_gyration_radii else
+                                     gyration_sums[level] / histogram[level] if histogram[level] != 0 else math.nan
+                                     for level in levels], dtype=np.float64),
+                           boltzmann)